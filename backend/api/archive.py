@@ -0,0 +1,152 @@
+"""
+Hot/cold archival of old messages.
+
+Message, GroupMessage and ForumChannelMessage rows older than
+ARCHIVE['MAX_AGE_DAYS'] are moved into the Archived* tables by the
+archive_messages command, so the hot tables and their indexes only hold
+recent history. Each chunk locks up to CHUNK_SIZE of the oldest rows, copies
+them and deletes them from the hot table in one transaction: a run can be
+stopped at any point, and the next one carries on with whatever is still in
+the hot table.
+
+The hot rows are removed with a plain DELETE ... WHERE id IN (...) because
+their attachment blob references move to the archive rows; the post_delete
+receivers that release blobs must not run.
+
+Once a run has finished, every archived row is older than every hot row, so a
+timestamp-ordered history is the archived rows followed by the hot rows.
+TieredMessages exposes the two querysets as one countable, sliceable sequence
+for the message list endpoints.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedForumChannelMessage, ArchivedGroupMessage, ArchivedMessage, ForumChannelMessage, GroupMessage, Message
+)
+
+ARCHIVE_CONFIG = getattr(settings, 'ARCHIVE', {})
+MAX_AGE_DAYS = ARCHIVE_CONFIG.get('MAX_AGE_DAYS', 365)
+CHUNK_SIZE = ARCHIVE_CONFIG.get('CHUNK_SIZE', 1000)
+# Pause between chunks so other writers can take the table locks
+CHUNK_PAUSE = ARCHIVE_CONFIG.get('CHUNK_PAUSE', 0.05)
+
+
+class ArchiveTier:
+    def __init__(self, label, hot_model, archive_model):
+        self.label = label
+        self.hot_model = hot_model
+        self.archive_model = archive_model
+        # Columns copied as-is; archived_at is filled in on insert
+        self.columns = [
+            field.attname for field in archive_model._meta.concrete_fields if field.name != 'archived_at'
+        ]
+
+    def pending(self, cutoff):
+        return self.hot_model.objects.filter(timestamp__lt=cutoff)
+
+    def archive_chunk(self, cutoff, after_pk=0):
+        """Move one chunk; returns (rows moved, last primary key moved)"""
+        quote = connection.ops.quote_name
+        table = quote(self.hot_model._meta.db_table)
+        pk_column = quote(self.hot_model._meta.pk.column)
+
+        with transaction.atomic():
+            rows = list(
+                self.pending(cutoff).filter(pk__gt=after_pk).order_by('pk')
+                .select_for_update().values(*self.columns)[:CHUNK_SIZE]
+            )
+            if not rows:
+                return 0, after_pk
+            self.archive_model.objects.bulk_create([self.archive_model(**row) for row in rows])
+            pks = [row['id'] for row in rows]
+            placeholders = ', '.join(['%s'] * len(pks))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table} WHERE {pk_column} IN ({placeholders})', pks)
+        return len(rows), pks[-1]
+
+
+ARCHIVE_TIERS = (
+    ArchiveTier('messages', Message, ArchivedMessage),
+    ArchiveTier('group_messages', GroupMessage, ArchivedGroupMessage),
+    ArchiveTier('forum_channel_messages', ForumChannelMessage, ArchivedForumChannelMessage),
+)
+
+
+def archive_cutoff(max_age_days=MAX_AGE_DAYS):
+    return timezone.now() - timedelta(days=max_age_days)
+
+
+def archive_tier(tier, cutoff, deadline=None, on_chunk=None):
+    """
+    Move every row of `tier` older than `cutoff`. Stops early once `deadline`
+    (a time.monotonic() value) has passed; returns (rows moved, finished).
+    """
+    total, last_pk = 0, 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            return total, False
+        moved, last_pk = tier.archive_chunk(cutoff, last_pk)
+        if not moved:
+            return total, True
+        total += moved
+        if on_chunk:
+            on_chunk(tier, total)
+        if CHUNK_PAUSE:
+            time.sleep(CHUNK_PAUSE)
+
+
+def find_message(hot_model, pk):
+    """A message by id from the hot table or its archive; raises hot_model.DoesNotExist"""
+    try:
+        return hot_model.objects.get(pk=pk)
+    except hot_model.DoesNotExist:
+        for tier in ARCHIVE_TIERS:
+            if tier.hot_model is hot_model:
+                archived = tier.archive_model.objects.filter(pk=pk).first()
+                if archived is not None:
+                    return archived
+        raise
+
+
+class TieredMessages:
+    """Archived rows followed by hot rows, as one countable, sliceable sequence"""
+
+    def __init__(self, archived, hot):
+        self.archived = archived
+        self.hot = hot
+        self._archived_count = None
+
+    def archived_count(self):
+        if self._archived_count is None:
+            self._archived_count = self.archived.count()
+        return self._archived_count
+
+    def count(self):
+        return self.archived_count() + self.hot.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        yield from self.archived
+        yield from self.hot
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('TieredMessages only supports slicing')
+        start, stop = key.start or 0, key.stop
+        split = self.archived_count()
+
+        rows = []
+        if start < split:
+            rows.extend(self.archived[start:split if stop is None else min(stop, split)])
+        hot_start = max(start - split, 0)
+        hot_stop = None if stop is None else max(stop - split, 0)
+        if hot_stop is None or hot_stop > hot_start:
+            rows.extend(self.hot[hot_start:hot_stop])
+        return rows
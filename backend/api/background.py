@@ -0,0 +1,48 @@
+"""
+Lightweight in-process background scheduling.
+
+Periodic maintenance (e.g. tab session expiry) runs on daemon threads that are
+started once per server process, so request handlers never pay for it.
+"""
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_started = {}
+_started_lock = threading.Lock()
+
+
+class PeriodicTask(threading.Thread):
+    def __init__(self, name, func, interval):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                close_old_connections()
+                self.func()
+            except Exception as e:
+                logger.error(f"Periodic task {self.name} failed: {e}")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_periodic_task(name, func, interval):
+    """Start a named periodic task once per process. Returns the task."""
+    with _started_lock:
+        task = _started.get(name)
+        if task is None or not task.is_alive():
+            task = PeriodicTask(name, func, interval)
+            task.start()
+            _started[name] = task
+            logger.info(f"Started periodic task {name} (every {interval}s)")
+        return task
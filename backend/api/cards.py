@@ -0,0 +1,132 @@
+"""
+Shared "user card" cache.
+
+A user card is the small, request-independent dict every serializer needs to
+render a sender, member or participant: names, admin flag and avatar storage
+names. Cards are read in bulk with get_many(user_ids) through two tiers: a
+per-process LRU (entries live for LOCAL_TTL seconds, which bounds staleness
+on other workers) and the Django cache (USER_CARD_CACHE['CACHE_ALIAS'], set
+it to a Redis/Memcached alias to share cards across workers). Misses are
+loaded from the User table in one query.
+
+Keys carry CARD_VERSION, so changing the card layout only needs a version
+bump. User.save and UserProfile.sync_user_card call invalidate().
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+
+CARD_CONFIG = getattr(settings, 'USER_CARD_CACHE', {})
+CARD_CACHE_ALIAS = CARD_CONFIG.get('CACHE_ALIAS', 'default')
+CARD_TIMEOUT = CARD_CONFIG.get('TIMEOUT', 3600)
+LOCAL_SIZE = CARD_CONFIG.get('LOCAL_SIZE', 5000)
+LOCAL_TTL = CARD_CONFIG.get('LOCAL_TTL', 30)
+CARD_VERSION = 1
+
+# User columns a card is built from; saving a change to any of them invalidates it
+CARD_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_admin', 'avatar', 'avatar_renditions')
+
+
+def build_card(user):
+    full_name = f'{user.first_name} {user.last_name}'.strip()
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'full_name': full_name or user.username,
+        'is_admin': user.is_admin,
+        'avatar': user.avatar,
+        'avatar_renditions': user.avatar_renditions or {},
+    }
+
+
+def card_avatar_url(request, card, size=None):
+    """Avatar URL for a card, preferring the requested rendition"""
+    if not card or not card.get('avatar'):
+        return None
+    name = card['avatar_renditions'].get(size) if size else None
+    url = default_storage.url(name or card['avatar'])
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class UserCardCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # user_id -> (expires_at, card)
+
+    @property
+    def cache(self):
+        return caches[CARD_CACHE_ALIAS]
+
+    def _key(self, user_id):
+        return f'usercard:v{CARD_VERSION}:{user_id}'
+
+    def _get_local(self, user_ids, now):
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._local.get(user_id)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._local[user_id]
+                    continue
+                self._local.move_to_end(user_id)
+                found[user_id] = entry[1]
+        return found
+
+    def _set_local(self, cards, now):
+        expires_at = now + LOCAL_TTL
+        with self._lock:
+            for user_id, card in cards.items():
+                self._local[user_id] = (expires_at, card)
+                self._local.move_to_end(user_id)
+            while len(self._local) > LOCAL_SIZE:
+                self._local.popitem(last=False)
+
+    def get_many(self, user_ids):
+        """Bulk lookup: {user_id: card} for every existing user in user_ids"""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return {}
+        now = time.monotonic()
+        cards = self._get_local(user_ids, now)
+
+        missing = user_ids - cards.keys()
+        if missing:
+            keys = {self._key(user_id): user_id for user_id in missing}
+            shared = {keys[key]: card for key, card in self.cache.get_many(list(keys)).items()}
+            missing -= shared.keys()
+
+            loaded = {}
+            if missing:
+                users = get_user_model().objects.filter(pk__in=missing).only(*CARD_FIELDS)
+                loaded = {user.id: build_card(user) for user in users}
+                if loaded:
+                    self.cache.set_many({self._key(user_id): card for user_id, card in loaded.items()}, CARD_TIMEOUT)
+
+            fetched = {**shared, **loaded}
+            self._set_local(fetched, now)
+            cards.update(fetched)
+        return cards
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._local.pop(user_id, None)
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+
+
+user_cards = UserCardCache()
@@ -1,18 +1,37 @@
 import json
 import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from .models import ChatConvo, Conversation, Message, Group, GroupMember, GroupMessage
 from .utils import get_or_create_tab_session, validate_tab_session
+from .presence import presence
+from .dbpool import db_sync_to_async
+from .routers import pin_user
+from .typing_throttle import typing_throttle, TYPING_EXPIRY
+from .receipts import ReadReceiptBatcher
+from .fanout import local_sockets
+from .wire import JSON_WIRE, negotiate
 from urllib.parse import parse_qsl
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+
+def group_message_payload(message_obj):
+    """The group_message event body sent to a group's room, for socket and REST sends alike"""
+    return {
+        'id': message_obj.id,
+        'sender_username': message_obj.sender.username,
+        'sender_first_name': message_obj.sender.first_name,
+        'sender_last_name': message_obj.sender.last_name,
+        'message': message_obj.message,
+        'timestamp': message_obj.timestamp.isoformat(),
+        'attachment_url': message_obj.attachment.url if message_obj.attachment else None
+    }
+
 class ApiConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -20,6 +39,8 @@ class ApiConsumer(AsyncWebsocketConsumer):
         self.processing_task = None
         self.recent_messages = set()  # Track recent messages to prevent duplicates
         self.max_recent_messages = 100  # Keep last 100 messages in memory
+        self.read_receipts = ReadReceiptBatcher(self)
+        self.wire = JSON_WIRE
 
     async def connect(self):
         # Get token from query parameters
@@ -52,18 +73,28 @@ class ApiConsumer(AsyncWebsocketConsumer):
         # Create user-specific room
         self.room_group_name = f'chat_{user.username}'
 
-        # Join user-specific room
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-
         # Start message processing task
         self.processing_task = asyncio.create_task(self.process_message_queue())
 
-        await self.accept()
+        # Compact frames when the client offers the subprotocol (api/wire.py)
+        self.wire = negotiate(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=self.wire.subprotocol)
         logger.info(f"WebSocket connected for user: {user.username}")
 
+        # Only the user's first socket in this process joins the room; it fans
+        # room events out to the other tabs (api/fanout.py)
+        if local_sockets.add(self.room_group_name, self):
+            await self.channel_layer.group_add(
+                self.room_group_name,
+                self.channel_name
+            )
+
+        # Register presence and tell contacts if the user just came online
+        self.contact_usernames = await self.get_contact_usernames(user)
+        came_online = await presence.aconnect(user.id, self.channel_name)
+        if came_online:
+            await self.broadcast_presence(True)
+
     async def disconnect(self, close_code):
         # Cancel processing task
         if self.processing_task:
@@ -73,24 +104,49 @@ class ApiConsumer(AsyncWebsocketConsumer):
             except asyncio.CancelledError:
                 pass
 
-        # Leave room group only if room_group_name exists
+        # Hand the room over to another local tab before leaving it
         if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+            was_delegate, successor = local_sockets.remove(self.room_group_name, self)
+            if successor is not None:
+                await self.channel_layer.group_add(
+                    self.room_group_name,
+                    successor.channel_name
+                )
+            if was_delegate:
+                await self.channel_layer.group_discard(
+                    self.room_group_name,
+                    self.channel_name
+                )
+
+        # Release presence and tell contacts if this was the user's last socket
+        if hasattr(self, 'user'):
+            await self.read_receipts.close()
+            went_offline = await presence.adisconnect(self.user.id, self.channel_name)
+            if went_offline:
+                await self.broadcast_presence(False)
 
     # Receive message from WebSocket - ULTRA FAST PATH
     async def receive(self, text_data):
         try:
-            text_data_json = json.loads(text_data)
+            text_data_json = self.wire.decode(text_data)
             
             # Handle ping/pong for connection health
             if text_data_json.get('type') == 'ping':
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=self.wire.encode({
                     'type': 'pong',
                     'timestamp': text_data_json.get('timestamp', asyncio.get_event_loop().time())
                 }))
+                await presence.atouch(self.user.id)
+                return
+            
+            # Typing indicators are relayed to the peer only, never persisted
+            if text_data_json.get('type') == 'typing':
+                await self.handle_typing(text_data_json)
+                return
+            
+            # Read pointers are debounced per conversation, see api/receipts.py
+            if text_data_json.get('type') == 'read_up_to':
+                self.handle_read_up_to(text_data_json)
                 return
             
             # Handle regular messages
@@ -163,11 +219,40 @@ class ApiConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             # Send error back to sender
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=self.wire.encode({
                 'type': 'error',
                 'message': 'Failed to send message'
             }))
 
+    async def handle_typing(self, data):
+        receiver = data.get('receiver')
+        # Only relay to people the user already shares a conversation with
+        if not receiver or receiver == self.username or receiver not in getattr(self, 'contact_usernames', []):
+            return
+        conversation_id = data.get('conversation_id')
+        event = {
+            'type': 'typing_update',
+            'sender': self.username,
+            'conversation_id': conversation_id,
+            'is_typing': bool(data.get('is_typing', True)),
+            'timestamp': time.time()
+        }
+
+        async def send(event):
+            await self.channel_layer.group_send(f'chat_{receiver}', event)
+
+        # A direct conversation is identified by its two usernames
+        await typing_throttle.submit((self.username, receiver), event, send)
+
+    def handle_read_up_to(self, data):
+        try:
+            conversation_id = int(data['conversation_id'])
+            message_id = int(data['message_id'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if conversation_id > 0 and message_id > 0:
+            self.read_receipts.add(conversation_id, message_id)
+
     # Background message processing
     async def process_message_queue(self):
         while True:
@@ -203,18 +288,12 @@ class ApiConsumer(AsyncWebsocketConsumer):
     # Receive message from room group - OPTIMIZED
     async def chat_message(self, event):
         try:
-            # Check for duplicate messages using message_id
+            # Check for duplicate deliveries to this user (shared by all local tabs)
             message_id = event.get('message_id')
-            if message_id and message_id in self.recent_messages:
+            if message_id and local_sockets.seen(self.room_group_name, message_id):
                 logger.info(f"Duplicate message in chat_message, ignoring: {message_id}")
                 return
             
-            # Add to recent messages if not already present
-            if message_id:
-                self.recent_messages.add(message_id)
-                if len(self.recent_messages) > self.max_recent_messages:
-                    self.recent_messages = set(list(self.recent_messages)[-self.max_recent_messages:])
-            
             # Log timestamp being sent
             logger.info(f"Sending message with timestamp: {event.get('timestamp')}s to {event.get('receiver')}")
             
@@ -247,8 +326,12 @@ class ApiConsumer(AsyncWebsocketConsumer):
                 'receiver_email': event.get('receiver_email', '')
             }
             
-            # Send message to WebSocket with enhanced data
-            await self.send(text_data=json.dumps(message_data))
+            # Encode once for all of the user's tabs; the tab that sent the
+            # message already shows it and only the other tabs get the echo
+            await local_sockets.send(
+                self.room_group_name, message_data,
+                skip=lambda consumer: message_id in consumer.recent_messages
+            )
             
             # If this is a new conversation and the current user is the receiver,
             # send a conversation refresh notification
@@ -262,7 +345,7 @@ class ApiConsumer(AsyncWebsocketConsumer):
                     'sender_email': event.get('sender_email', ''),
                     'timestamp': event.get('timestamp')
                 }
-                await self.send(text_data=json.dumps(refresh_data))
+                await self.fan_out(refresh_data)
                 logger.info(f"Conversation refresh sent to {current_user} for new conversation {event.get('conversation_id')}")
             
             logger.info(f"Message sent successfully to WebSocket: {event['sender']} -> {event['receiver']} (type: {message_type}, new_conversation: {is_new_conversation})")
@@ -270,7 +353,64 @@ class ApiConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error sending message to WebSocket: {e}")
 
-    @database_sync_to_async
+    async def fan_out(self, data):
+        """Write a room event to every local socket of this user, encoded once per wire format"""
+        await local_sockets.send(self.room_group_name, data)
+
+    async def broadcast_presence(self, is_online):
+        """Push a presence change to every contact's personal room"""
+        event = {
+            'type': 'presence_update',
+            'user_id': self.user.id,
+            'username': self.username,
+            'is_online': is_online,
+            'timestamp': time.time()
+        }
+        for contact in getattr(self, 'contact_usernames', []):
+            await self.channel_layer.group_send(f'chat_{contact}', event)
+
+    # Receive typing state from room group
+    async def typing_update(self, event):
+        await self.fan_out({
+            'type': 'typing',
+            'sender': event['sender'],
+            'conversation_id': event['conversation_id'],
+            'is_typing': event['is_typing'],
+            'expires_in': TYPING_EXPIRY,
+            'timestamp': event['timestamp']
+        })
+
+    # Receive a read pointer update from room group
+    async def read_receipt(self, event):
+        await self.fan_out({
+            'type': 'read_receipt',
+            'conversation_id': event['conversation_id'],
+            'reader': event['reader'],
+            'message_id': event['message_id'],
+            'timestamp': event['timestamp']
+        })
+
+    # Receive presence change from room group
+    async def presence_update(self, event):
+        await self.fan_out({
+            'type': 'presence',
+            'user_id': event['user_id'],
+            'username': event['username'],
+            'is_online': event['is_online'],
+            'timestamp': event['timestamp']
+        })
+
+    @db_sync_to_async
+    def get_contact_usernames(self, user):
+        """Usernames of everyone the user shares a conversation with"""
+        return list(
+            get_user_model().objects.filter(conversations__participants=user)
+            .exclude(id=user.id)
+            .values_list('username', flat=True)
+            .distinct()
+        )
+
+    @db_sync_to_async
     def save_messages_batch(self, messages_data):
         """Save multiple messages to database efficiently"""
         try:
@@ -301,11 +441,12 @@ class ApiConsumer(AsyncWebsocketConsumer):
                     sender=sender,
                     content=msg_data['message']
                 )
+                pin_user(sender.id)
                 
         except Exception as e:
             logger.error(f"Error saving messages batch: {e}")
 
-    @database_sync_to_async
+    @db_sync_to_async
     def save_message_new(self, sender_username, receiver_username, message):
         try:
             sender = User.objects.get(username=sender_username)
@@ -334,12 +475,13 @@ class ApiConsumer(AsyncWebsocketConsumer):
                 sender=sender,
                 content=message
             )
+            pin_user(sender.id)
             
             return conversation.id
         except User.DoesNotExist:
             return None
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_user_from_token(self, token):
         try:
             access_token = AccessToken(token)
@@ -352,7 +494,7 @@ class ApiConsumer(AsyncWebsocketConsumer):
             logger.error(f"Token validation error: {e}")
             return None
 
-    @database_sync_to_async
+    @db_sync_to_async
     def save_message(self, sender_username, receiver_username, message):
         try:
             sender = User.objects.get(username=sender_username)
@@ -362,6 +504,7 @@ class ApiConsumer(AsyncWebsocketConsumer):
                 receiver=receiver,
                 message=message
             )
+            pin_user(sender.id)
         except User.DoesNotExist:
             pass
 
@@ -463,7 +606,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-    @database_sync_to_async
+    @db_sync_to_async
     def is_group_member(self, user, group_id):
         try:
             group = Group.objects.get(id=group_id)
@@ -471,7 +614,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         except Group.DoesNotExist:
             return False
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_user_from_token(self, token):
         try:
             access_token = AccessToken(token)
@@ -484,7 +627,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             print(f"Token validation error: {e}")
             return None
 
-    @database_sync_to_async
+    @db_sync_to_async
     def save_group_message(self, group_id, sender, message, attachment=None):
         try:
             group = Group.objects.get(id=group_id)
@@ -494,15 +637,8 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 message=message,
                 attachment=attachment
             )
-            return {
-                'id': message_obj.id,
-                'sender_username': message_obj.sender.username,
-                'sender_first_name': message_obj.sender.first_name,
-                'sender_last_name': message_obj.sender.last_name,
-                'message': message_obj.message,
-                'timestamp': message_obj.timestamp.isoformat(),
-                'attachment_url': message_obj.attachment.url if message_obj.attachment else None
-            }
+            pin_user(sender.id)
+            return group_message_payload(message_obj)
         except Group.DoesNotExist:
             return None
 
@@ -0,0 +1,297 @@
+"""
+Process-wide MySQL connection pool and the executor for consumer DB calls.
+
+Under ASGI every HTTP request runs its sync code on a fresh thread, so
+Django's per-thread persistent connections (CONN_MAX_AGE) cannot be reused and
+each request used to open a new MySQL connection. The `api.pooled_mysql`
+backend hands out connections from a ConnectionPool instead: Django "closes"
+the connection at the end of each request as usual (CONN_MAX_AGE = 0) and the
+connection goes back to the pool. The pool never holds more than MAX_SIZE
+connections; callers beyond that wait up to TIMEOUT seconds. Connections older
+than MAX_LIFETIME are recycled and connections that sat idle for longer than
+HEALTH_CHECK_AFTER are pinged before being handed out.
+
+A returned connection is only rolled back, not reset: session variables
+(SET @x, SET SESSION ...), a changed isolation level and temporary tables
+carry over to whoever checks it out next. Django re-applies its own session
+setup (autocommit, init_connection_state) on every checkout, so code that
+changes other session state must restore it itself or close the raw
+connection instead of letting it return to the pool.
+
+WebSocket consumers use db_sync_to_async instead of channels'
+database_sync_to_async, which runs the call on a dedicated executor of
+CONSUMER_WORKERS threads, so a burst of socket traffic can take at most that
+many connections and never starves HTTP requests of the rest of the pool.
+
+pool_stats() reports pool sizes and wait times for both.
+"""
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.utils import OperationalError
+
+from .background import start_periodic_task
+
+logger = logging.getLogger(__name__)
+
+POOL_CONFIG = getattr(settings, 'DB_POOL', {})
+MAX_SIZE = POOL_CONFIG.get('MAX_SIZE', 20)
+TIMEOUT = POOL_CONFIG.get('TIMEOUT', 10)
+MAX_LIFETIME = POOL_CONFIG.get('MAX_LIFETIME', 600)
+HEALTH_CHECK_AFTER = POOL_CONFIG.get('HEALTH_CHECK_AFTER', 30)
+CONSUMER_WORKERS = POOL_CONFIG.get('CONSUMER_WORKERS', 8)
+# Waits longer than this are logged
+SLOW_WAIT = POOL_CONFIG.get('SLOW_WAIT', 0.5)
+STATS_LOG_INTERVAL = POOL_CONFIG.get('STATS_LOG_INTERVAL', 300)
+
+
+class PoolExhausted(OperationalError):
+    pass
+
+
+class WaitStats:
+    """Counters for how long callers waited for a connection or a worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            if seconds >= SLOW_WAIT:
+                self.slow += 1
+
+    def data(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                'max_ms': round(self.max * 1000, 3),
+                'slow': self.slow,
+            }
+
+
+class ConnectionPool:
+    def __init__(self, alias, max_size=MAX_SIZE, timeout=TIMEOUT):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = deque()    # (raw connection, created_at, idle_since)
+        self._created_at = {}   # id(raw connection) -> created_at, for every open connection
+        self._opening = 0       # connections being opened outside the lock
+        self.waits = WaitStats()
+        self.counters = {'created': 0, 'reused': 0, 'recycled': 0, 'unhealthy': 0, 'timeouts': 0}
+
+    @property
+    def size(self):
+        return len(self._created_at)
+
+    def _take_slot(self, started):
+        """Block until an idle connection or room for a new one; returns the idle entry or None"""
+        deadline = started + self.timeout
+        with self._cond:
+            while not self._idle and self.size + self._opening >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolExhausted(
+                        f'No database connection available for {self.alias!r} within {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+                self._cond.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._opening += 1
+            return None
+
+    def acquire(self, connect):
+        """A raw connection from the pool, opening one with connect() if there is room"""
+        started = time.monotonic()
+        while True:
+            entry = self._take_slot(started)
+            if entry is None:
+                break
+            raw, created_at, idle_since = entry
+            now = time.monotonic()
+            if now - created_at > MAX_LIFETIME:
+                self.counters['recycled'] += 1
+                self._discard(raw)
+                continue
+            if now - idle_since > HEALTH_CHECK_AFTER and not self._ping(raw):
+                self.counters['unhealthy'] += 1
+                self._discard(raw)
+                continue
+            self.counters['reused'] += 1
+            self._record_wait(started)
+            return raw
+
+        try:
+            raw = connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self._created_at[id(raw)] = time.monotonic()
+        self.counters['created'] += 1
+        self._record_wait(started)
+        return raw
+
+    def release(self, raw, broken=False):
+        """
+        Return a connection; broken or dirty connections are closed instead.
+        Only an open transaction is rolled back; other session state is kept
+        (see the module docstring).
+        """
+        if broken and not self._ping(raw):
+            self.counters['unhealthy'] += 1
+            self._discard(raw)
+            return
+        try:
+            if not raw.get_autocommit():
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        with self._cond:
+            created_at = self._created_at.get(id(raw))
+            if created_at is None:
+                return
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def _ping(self, raw):
+        try:
+            raw.ping()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(id(raw), None)
+            self._cond.notify()
+
+    def _record_wait(self, started):
+        waited = time.monotonic() - started
+        self.waits.record(waited)
+        if waited >= SLOW_WAIT:
+            logger.warning(f"Waited {waited:.3f}s for a database connection ({self.alias})")
+
+    def data(self):
+        with self._cond:
+            size, idle = self.size, len(self._idle)
+        return {
+            'max_size': self.max_size,
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'wait': self.waits.data(),
+            **self.counters,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(alias)
+            # Once per process, not on every checkout
+            if STATS_LOG_INTERVAL:
+                start_periodic_task('db-pool-stats', log_pool_stats, STATS_LOG_INTERVAL)
+    return pool
+
+
+# Consumer DB calls
+
+_consumer_executor = ThreadPoolExecutor(max_workers=CONSUMER_WORKERS, thread_name_prefix='consumer-db')
+_consumer_waits = WaitStats()
+_consumer_lock = threading.Lock()
+_consumer_active = 0
+_consumer_peak = 0
+
+
+def _run_consumer_call(func, queued_at, *args, **kwargs):
+    global _consumer_active, _consumer_peak
+
+    waited = time.monotonic() - queued_at
+    _consumer_waits.record(waited)
+    if waited >= SLOW_WAIT:
+        logger.warning(f"Consumer DB call {func.__qualname__} waited {waited:.3f}s for a worker")
+    with _consumer_lock:
+        _consumer_active += 1
+        _consumer_peak = max(_consumer_peak, _consumer_active)
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Hands the connection back to the pool
+        close_old_connections()
+        with _consumer_lock:
+            _consumer_active -= 1
+
+
+def db_sync_to_async(func):
+    """Like channels' database_sync_to_async, but on the sized consumer executor"""
+    run = sync_to_async(_run_consumer_call, thread_sensitive=False, executor=_consumer_executor)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, time.monotonic(), *args, **kwargs)
+
+    return wrapper
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    with _consumer_lock:
+        active, peak = _consumer_active, _consumer_peak
+    return {
+        'pools': {alias: pool.data() for alias, pool in pools.items()},
+        'consumer_executor': {
+            'workers': CONSUMER_WORKERS,
+            'active': active,
+            'peak_active': peak,
+            'wait': _consumer_waits.data(),
+        },
+    }
+
+
+def log_pool_stats():
+    stats = pool_stats()
+    for alias, data in stats['pools'].items():
+        logger.info(
+            f"DB pool {alias}: {data['in_use']}/{data['max_size']} in use, {data['idle']} idle, "
+            f"avg wait {data['wait']['avg_ms']}ms, max wait {data['wait']['max_ms']}ms, "
+            f"{data['timeouts']} timeouts"
+        )
+    executor = stats['consumer_executor']
+    logger.info(
+        f"Consumer DB executor: {executor['active']}/{executor['workers']} busy, "
+        f"avg wait {executor['wait']['avg_ms']}ms, max wait {executor['wait']['max_ms']}ms"
+    )
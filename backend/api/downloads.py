@@ -0,0 +1,164 @@
+"""
+Streaming file downloads with HTTP Range and conditional request support.
+
+serve_file() never reads a whole file into memory: full responses go through
+FileResponse (chunked by Django), partial responses through a bounded chunk
+iterator, and in offload mode the body is handed to the front-end web server
+via X-Sendfile (Apache/lighttpd) or X-Accel-Redirect (nginx).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+DOWNLOAD_CONFIG = getattr(settings, 'FILE_DOWNLOADS', {})
+# None (stream from Django), 'sendfile' (X-Sendfile) or 'accel' (X-Accel-Redirect)
+OFFLOAD_MODE = DOWNLOAD_CONFIG.get('OFFLOAD')
+# Internal nginx location that maps onto MEDIA_ROOT, used with 'accel'
+ACCEL_REDIRECT_PREFIX = DOWNLOAD_CONFIG.get('ACCEL_REDIRECT_PREFIX', '/protected-media/')
+CHUNK_SIZE = DOWNLOAD_CONFIG.get('CHUNK_SIZE', 64 * 1024)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat_result):
+    """
+    Strong validator built from size and mtime, cheap to compute from one
+    stat(). Stored files are written once and never modified in place, so it
+    changes whenever the bytes do and is safe for byte ranges and If-Range.
+    """
+    return f'"{stat_result.st_size:x}-{int(stat_result.st_mtime * 1000000):x}"'
+
+
+def parse_range_header(header, file_size):
+    """
+    Parse a single 'bytes=start-end' range. Returns (start, end) inclusive,
+    None when the header should be ignored (absent, malformed or multi-range)
+    and 'unsatisfiable' when the range lies outside the file.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        start = max(file_size - length, 0)
+        end = file_size - 1
+    else:
+        start = int(start)
+        end = int(end) if end else file_size - 1
+        if start >= file_size or start > end:
+            return 'unsatisfiable'
+        end = min(end, file_size - 1)
+    return start, end
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(last_modified) <= since
+
+
+def _iter_file_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, file_name=None, content_type=None, as_attachment=True, media_name=None):
+    """
+    Build a download response for the file at `path`.
+
+    `media_name` is the storage-relative name (FileField.name) and is only
+    needed for X-Accel-Redirect offloading.
+    """
+    stat_result = os.stat(path)
+    file_size = stat_result.st_size
+    file_name = file_name or os.path.basename(path)
+    content_type = content_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    etag = file_etag(stat_result)
+    last_modified = stat_result.st_mtime
+
+    common_headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        # Escapes quotes and backslashes and adds filename* for non-ASCII names
+        'Content-Disposition': content_disposition_header(as_attachment, file_name),
+    }
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponse(status=304)
+        for header in ('ETag', 'Last-Modified'):
+            response[header] = common_headers[header]
+        return response
+
+    # Let the web server stream the bytes (it also handles Range itself)
+    if OFFLOAD_MODE in ('sendfile', 'accel'):
+        response = HttpResponse(content_type=content_type)
+        if OFFLOAD_MODE == 'sendfile':
+            response['X-Sendfile'] = path
+        else:
+            response['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(media_name or file_name)
+        for header, value in common_headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range_header(request.headers.get('Range'), file_size)
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{file_size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_file_range(path, start, length),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(file_size)
+
+    for header, value in common_headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,77 @@
+"""
+Per-process registry of each user's chat sockets.
+
+Every tab of a user opens its own ApiConsumer, but only the first one in this
+process (the delegate) joins the chat_<username> group, so the channel layer
+delivers each room event to a process once per user rather than once per tab.
+The delegate builds the payload once, encodes it once per wire format in use
+(api/wire.py) and writes the same frame to all of the user's local sockets. When the delegate closes, the next
+local socket joins the group before the delegate leaves it.
+
+Room events are also de-duplicated here, per user, instead of per socket.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Message ids remembered per user to drop repeated room deliveries
+RECENT_IDS = 100
+
+
+class LocalSockets:
+    def __init__(self):
+        self._sockets = {}  # group -> {channel_name: consumer}, oldest first; the first is the delegate
+        self._recent = {}   # group -> OrderedDict of message ids already fanned out
+
+    def add(self, group, consumer):
+        """Register a socket; returns True when it is the group's delegate and must join the group"""
+        sockets = self._sockets.setdefault(group, {})
+        sockets[consumer.channel_name] = consumer
+        return len(sockets) == 1
+
+    def remove(self, group, consumer):
+        """
+        Unregister a socket. Returns (was_delegate, successor): the successor is
+        the socket that must join the group in its place, if any is left.
+        """
+        sockets = self._sockets.get(group)
+        if not sockets or consumer.channel_name not in sockets:
+            return False, None
+        was_delegate = next(iter(sockets)) == consumer.channel_name
+        del sockets[consumer.channel_name]
+        if not sockets:
+            del self._sockets[group]
+            self._recent.pop(group, None)
+            return was_delegate, None
+        return was_delegate, next(iter(sockets.values())) if was_delegate else None
+
+    def sockets(self, group):
+        return list(self._sockets.get(group, {}).values())
+
+    def seen(self, group, message_id):
+        """True if message_id was already fanned out to this group; records it otherwise"""
+        recent = self._recent.setdefault(group, OrderedDict())
+        if message_id in recent:
+            return True
+        recent[message_id] = None
+        if len(recent) > RECENT_IDS:
+            recent.popitem(last=False)
+        return False
+
+    async def send(self, group, data, skip=None):
+        """Encode `data` once per wire format and write it to every local socket of the group"""
+        frames = {}
+        for consumer in self.sockets(group):
+            if skip is not None and skip(consumer):
+                continue
+            wire = consumer.wire
+            if wire not in frames:
+                frames[wire] = wire.encode(data)
+            try:
+                await consumer.send(text_data=frames[wire])
+            except Exception as e:
+                logger.error(f"Error writing to socket {consumer.channel_name}: {e}")
+
+
+local_sockets = LocalSockets()
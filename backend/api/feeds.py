@@ -0,0 +1,189 @@
+"""
+Keyset-paginated admin message feed.
+
+Legacy ChatConvo rows, conversation Messages and archived conversation
+messages are independently indexed streams ordered by (timestamp, id). A page
+is built by reading at most limit + 1 rows from each stream past the cursor
+and merging them (a k-way merge over the sources), so the cost of a page
+never depends on table size.
+
+Rows are ordered newest first by (timestamp, source rank, id); the cursor
+encodes the last row returned, and each stream turns it into a keyset
+predicate on its own (timestamp, id) index.
+"""
+import base64
+import heapq
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .cards import user_cards
+from .models import ArchivedMessage, ChatConvo, Conversation, Message
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, rank, row_id):
+    raw = f'{timestamp.isoformat()}|{rank}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, rank, row_id = raw.split('|')
+        parsed = datetime.fromisoformat(timestamp)
+        return parsed, int(rank), int(row_id)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+class FeedSource(ABC):
+    """One ordered stream of the feed"""
+    rank = 0
+    type = ''
+    model = None
+
+    @abstractmethod
+    def queryset(self, filters):
+        """Rows of this stream matching the user/conversation filters"""
+
+    def after_cursor(self, queryset, cursor):
+        if cursor is None:
+            return queryset
+        timestamp, rank, row_id = cursor
+        if self.rank < rank:
+            return queryset.filter(timestamp__lte=timestamp)
+        if self.rank > rank:
+            return queryset.filter(timestamp__lt=timestamp)
+        return queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=row_id))
+
+    def rows(self, filters, cursor, limit):
+        queryset = self.after_cursor(self.queryset(filters), cursor)
+        if filters.get('since'):
+            queryset = queryset.filter(timestamp__gte=filters['since'])
+        if filters.get('until'):
+            queryset = queryset.filter(timestamp__lt=filters['until'])
+        return list(queryset.order_by('-timestamp', '-id')[:limit])
+
+    def sort_key(self, row):
+        return (row.timestamp, self.rank, row.id)
+
+
+class ChatConvoSource(FeedSource):
+    rank = 0
+    type = 'old'
+    model = ChatConvo
+
+    def queryset(self, filters):
+        if filters.get('conversation_id'):
+            # Legacy messages are not grouped into conversations
+            return ChatConvo.objects.none()
+        queryset = ChatConvo.objects.only('id', 'sender_id', 'receiver_id', 'message', 'timestamp')
+        if filters.get('user_id'):
+            queryset = queryset.filter(Q(sender_id=filters['user_id']) | Q(receiver_id=filters['user_id']))
+        return queryset
+
+
+class MessageSource(FeedSource):
+    rank = 1
+    type = 'new'
+    model = Message
+
+    def queryset(self, filters):
+        queryset = Message.objects.only('id', 'conversation_id', 'sender_id', 'content', 'timestamp')
+        if filters.get('conversation_id'):
+            queryset = queryset.filter(conversation_id=filters['conversation_id'])
+        if filters.get('user_id'):
+            queryset = queryset.filter(conversation__participants__id=filters['user_id'])
+        return queryset
+
+
+class ArchivedMessageSource(MessageSource):
+    """Archived conversation messages; they keep their ids, so they share the 'new' rank"""
+    model = ArchivedMessage
+
+    def queryset(self, filters):
+        queryset = ArchivedMessage.objects.only('id', 'conversation_id', 'sender_id', 'content', 'timestamp')
+        if filters.get('conversation_id'):
+            queryset = queryset.filter(conversation_id=filters['conversation_id'])
+        if filters.get('user_id'):
+            queryset = queryset.filter(conversation__participants__id=filters['user_id'])
+        return queryset
+
+
+FEED_SOURCES = (ChatConvoSource(), MessageSource(), ArchivedMessageSource())
+
+
+def parse_feed_filters(params):
+    """Read user/conversation/since/until query parameters"""
+    filters = {}
+    for name in ('user_id', 'conversation_id'):
+        if params.get(name):
+            filters[name] = int(params[name])
+    for name in ('since', 'until'):
+        if params.get(name):
+            value = parse_datetime(params[name])
+            if value is None:
+                raise ValueError(f'{name} must be an ISO 8601 datetime')
+            filters[name] = value
+    return filters
+
+
+def admin_message_feed(filters=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the merged feed: {'data': [...], 'next_cursor': str or None}.
+    `cursor` is the opaque string returned as next_cursor by the previous page.
+    """
+    filters = filters or {}
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor) if cursor else None
+
+    streams = [
+        [(source.sort_key(row), source, row) for row in source.rows(filters, position, limit + 1)]
+        for source in FEED_SOURCES
+    ]
+    merged = list(heapq.merge(*streams, key=lambda item: item[0], reverse=True))
+    page, has_more = merged[:limit], len(merged) > limit
+
+    # Receivers of conversation messages: one query for the page's conversations
+    conversation_ids = {row.conversation_id for _, source, row in page if source.type == 'new'}
+    participants = {}
+    for conversation_id, user_id in Conversation.participants.through.objects.filter(
+        conversation_id__in=conversation_ids
+    ).values_list('conversation_id', 'user_id'):
+        participants.setdefault(conversation_id, []).append(user_id)
+
+    def receiver_id(source, row):
+        if source.type == 'old':
+            return row.receiver_id
+        others = [user_id for user_id in participants.get(row.conversation_id, []) if user_id != row.sender_id]
+        return min(others) if others else None
+
+    receivers = [receiver_id(source, row) for _, source, row in page]
+    cards = user_cards.get_many([row.sender_id for _, _, row in page] + receivers)
+
+    data = []
+    for (_, source, row), receiver in zip(page, receivers):
+        data.append({
+            'id': f"{source.type}_{row.id}",
+            'sender': (cards.get(row.sender_id) or {}).get('username'),
+            'receiver': (cards.get(receiver) or {}).get('username'),
+            'message': row.message if source.type == 'old' else row.content,
+            'timestamp': row.timestamp,
+            'type': source.type,
+            'conversation_id': getattr(row, 'conversation_id', None),
+        })
+
+    next_cursor = None
+    if has_more and page:
+        (timestamp, rank, row_id), _, _ = page[-1]
+        next_cursor = encode_cursor(timestamp, rank, row_id)
+    return {'data': data, 'next_cursor': next_cursor}
@@ -4,7 +4,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
+from .permissions import tokens_for_user
 from .models import User
 
 User = get_user_model()
@@ -98,7 +98,8 @@ class GoogleOAuth:
         Create JWT tokens for the user
         """
         try:
-            refresh = RefreshToken.for_user(user)
+            # Carries the is_admin claim checked by api.permissions.IsAdmin
+            refresh = tokens_for_user(user)
             return {
                 'access': str(refresh.access_token),
                 'refresh': str(refresh),
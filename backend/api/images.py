@@ -0,0 +1,330 @@
+"""
+Image renditions, attachment thumbnails and previews.
+
+Every uploaded profile picture gets square WebP renditions (48/128/512 px by
+default) generated once, off the request thread, in a small worker pool. They
+are stored next to the original under profile_pictures/renditions/ and their
+names are recorded on UserProfile.profile_picture_renditions, so list views
+can point clients at a small image instead of the full-size upload.
+
+Image attachments get their dimensions and a BlurHash placeholder at upload
+time; actual thumbnails are rendered lazily on first request and kept in an
+LRU-capped on-disk cache.
+"""
+import io
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .cards import user_cards
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CONFIG = getattr(settings, 'IMAGE_RENDITIONS', {})
+PROFILE_PICTURE_SIZES = IMAGE_CONFIG.get('PROFILE_PICTURE_SIZES', {'small': 48, 'medium': 128, 'large': 512})
+WEBP_QUALITY = IMAGE_CONFIG.get('WEBP_QUALITY', 80)
+RENDITIONS_DIR = 'profile_pictures/renditions'
+
+THUMBNAIL_SIZES = IMAGE_CONFIG.get('THUMBNAIL_SIZES', (160, 320, 640))
+DEFAULT_THUMBNAIL_SIZE = IMAGE_CONFIG.get('DEFAULT_THUMBNAIL_SIZE', 320)
+THUMBNAIL_CACHE_DIR = IMAGE_CONFIG.get('THUMBNAIL_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = IMAGE_CONFIG.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_CONFIG.get('WORKERS', 2),
+    thread_name_prefix='image-renditions'
+)
+
+
+def render_webp(source, size, crop=True):
+    """
+    Render an image file (path or file object) to WebP bytes. With crop=True the
+    result is a size x size square, otherwise it fits inside size x size.
+    Returns (bytes, width, height).
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        mode = 'RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        img = img.convert(mode)
+        if crop:
+            img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        else:
+            img.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        return buffer.getvalue(), img.width, img.height
+
+
+def delete_renditions(renditions):
+    for name in (renditions or {}).values():
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.error(f"Error deleting rendition {name}: {e}")
+
+
+def generate_profile_renditions(profile_id, picture_name):
+    """Build all renditions for a profile picture and record them on the profile"""
+    from .models import UserProfile
+
+    close_old_connections()
+    try:
+        stem = os.path.splitext(os.path.basename(picture_name))[0]
+        renditions = {}
+        with default_storage.open(picture_name, 'rb') as source:
+            for label, size in PROFILE_PICTURE_SIZES.items():
+                source.seek(0)
+                data, _, _ = render_webp(source, size)
+                name = f'{RENDITIONS_DIR}/{stem}_{size}.webp'
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                renditions[label] = default_storage.save(name, ContentFile(data))
+
+        # Only attach the renditions if the picture wasn't replaced meanwhile
+        updated = UserProfile.objects.filter(
+            pk=profile_id, profile_picture=picture_name
+        ).update(profile_picture_renditions=renditions)
+        if updated:
+            user_ids = list(get_user_model().objects.filter(
+                profile__pk=profile_id, avatar=picture_name
+            ).values_list('pk', flat=True))
+            get_user_model().objects.filter(pk__in=user_ids).update(avatar_renditions=renditions)
+            user_cards.invalidate(*user_ids)
+        else:
+            delete_renditions(renditions)
+    except Exception as e:
+        logger.error(f"Error generating renditions for {picture_name}: {e}")
+    finally:
+        close_old_connections()
+
+
+def schedule_profile_renditions(profile):
+    """Queue rendition generation for the profile's current picture once the save commits"""
+    if not profile.profile_picture:
+        return
+    profile_id = profile.pk
+    picture_name = profile.profile_picture.name
+    transaction.on_commit(
+        lambda: _executor.submit(generate_profile_renditions, profile_id, picture_name)
+    )
+
+
+def user_avatar_url(request, user, size=None):
+    """
+    Like profile_picture_url, but read from the User card columns so no
+    profile lookup is needed.
+    """
+    if user is None or not user.avatar:
+        return None
+    name = (user.avatar_renditions or {}).get(size) if size else None
+    url = default_storage.url(name or user.avatar)
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def profile_picture_url(request, profile, size=None):
+    """
+    URL of a profile picture rendition ('small', 'medium', 'large'), falling
+    back to the original while renditions are still being generated.
+    """
+    if profile is None or not profile.profile_picture:
+        return None
+    name = (profile.profile_picture_renditions or {}).get(size) if size else None
+    url = default_storage.url(name) if name else profile.profile_picture.url
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+# BlurHash (https://blurha.sh) encoder, run on a tiny downscale of the image
+BASE83_CHARACTERS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+BLURHASH_SAMPLE_SIZE = 32
+
+
+def _encode_base83(value, length):
+    return ''.join(
+        BASE83_CHARACTERS[(value // (83 ** (length - i))) % 83]
+        for i in range(1, length + 1)
+    )
+
+
+def _srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(rgb_pixels, width, height, x_components=4, y_components=3):
+    """Encode a flat list of (r, g, b) tuples as a BlurHash string"""
+    linear = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in rgb_pixels]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                row = y * width
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * basis_y
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = _encode_base83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        blurhash += _encode_base83(quantised_max, 1)
+    else:
+        max_value = 1
+        blurhash += _encode_base83(0, 1)
+
+    blurhash += _encode_base83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+
+    def quantise(value):
+        scaled = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(math.floor(scaled * 9 + 9.5))))
+
+    for r, g, b in ac:
+        blurhash += _encode_base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return blurhash
+
+
+def image_preview_metadata(source):
+    """Return {'attachment_width', 'attachment_height', 'attachment_blurhash'} for an image file"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        width, height = img.size
+        img.draft('RGB', (BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE))
+        sample = img.convert('RGB')
+        sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE))
+        pixels = list(sample.getdata())
+        blurhash = blurhash_encode(pixels, sample.width, sample.height)
+    return {
+        'attachment_width': width,
+        'attachment_height': height,
+        'attachment_blurhash': blurhash,
+    }
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of rendered thumbnails with an LRU size cap. Hits refresh the
+    file's mtime; when the cache grows past max_bytes the least recently used
+    files are evicted down to 90% of the cap.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def path_for(self, key, size):
+        return os.path.join(self.directory, key[:2], f'{key}_{size}.webp')
+
+    def get(self, key, size):
+        path = self.path_for(key, size)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, size, data):
+        path = self.path_for(key, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if file_name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat_result.st_mtime, stat_result.st_size
+
+    def _scan_total(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
+
+def get_attachment_thumbnail(message, size=DEFAULT_THUMBNAIL_SIZE):
+    """
+    Path of a cached WebP thumbnail for an image attachment, rendering it on
+    first request. Thumbnails are keyed by content hash so duplicate uploads
+    share one cache entry. Also fills in missing preview metadata.
+    """
+    key = message.attachment_hash or f'{message._meta.model_name}-{message.pk}'
+    path = thumbnail_cache.get(key, size)
+    if path:
+        return path
+
+    with message.attachment.open('rb') as source:
+        data, _, _ = render_webp(source, size, crop=False)
+        if not message.attachment_blurhash:
+            source.seek(0)
+            preview = image_preview_metadata(source)
+            type(message).objects.filter(pk=message.pk).update(**preview)
+    return thumbnail_cache.put(key, size, data)
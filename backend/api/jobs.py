@@ -0,0 +1,301 @@
+"""
+Background jobs for admin bulk deletes.
+
+Deleting a user, a group or every message used to run Django's cascade
+collector inside the request, loading every dependent row into memory and
+holding locks until it finished. These deletes now run as BackgroundJob rows
+on a single worker thread: the big leaf tables (messages, members, sessions)
+are drained in bounded primary-key chunks with a plain DELETE ... WHERE id IN
+(...), each chunk in its own short transaction, and only the small remainder
+goes through the ORM. Progress is written to the job row after every chunk.
+
+Raw deletes bypass the post_delete receivers in api/signals.py, so the
+attachment names of each chunk are collected first and their blob references
+are released on a separate file-cleanup worker once the chunk commits. They
+also bypass the cascade, so a job must drain dependent tables first;
+delete_in_chunks refuses to start on a table that still has rows pointing
+at the rows it would delete.
+
+The worker queue only lives in memory. Jobs a previous process left pending
+or running are picked up again by a periodic resumer once their row has not
+changed for STALE_AFTER seconds.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .background import start_periodic_task
+from .storage import release_blob
+
+logger = logging.getLogger(__name__)
+
+JOB_CONFIG = getattr(settings, 'ADMIN_JOBS', {})
+DELETE_CHUNK_SIZE = JOB_CONFIG.get('DELETE_CHUNK_SIZE', 1000)
+# Pause between chunks so other writers can take the table locks
+CHUNK_PAUSE = JOB_CONFIG.get('CHUNK_PAUSE', 0.05)
+# A pending or running job whose row has not changed for this long was lost with its process
+STALE_AFTER = JOB_CONFIG.get('STALE_AFTER', 600)
+RESUME_INTERVAL = JOB_CONFIG.get('RESUME_INTERVAL', 60)
+
+_job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='admin-jobs')
+_file_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-cleanup')
+
+
+def release_files(names):
+    # Runs on the file-cleanup thread: give its pooled connection back when done
+    close_old_connections()
+    try:
+        for name in names:
+            try:
+                release_blob(name)
+            except Exception as e:
+                logger.error(f"Error releasing file {name}: {e}")
+    finally:
+        close_old_connections()
+
+
+def _release_files_async(names):
+    _file_executor.submit(release_files, names)
+
+
+class JobContext:
+    def __init__(self, job):
+        self.job = job
+        self.progress = dict(job.progress or {})
+
+    def record(self, label, count):
+        from .models import BackgroundJob
+
+        self.progress[label] = count
+        BackgroundJob.objects.filter(pk=self.job.pk).update(progress=self.progress, updated_at=timezone.now())
+
+    def check_dependents(self, queryset):
+        """Raise if rows of other tables still reference rows of `queryset` through an enforced foreign key"""
+        model = queryset.model
+        for relation in model._meta.get_fields(include_hidden=True):
+            if not (relation.auto_created and not relation.concrete and (relation.one_to_many or relation.one_to_one)):
+                continue
+            if not relation.field.db_constraint:
+                continue
+            dependents = relation.related_model._base_manager.filter(
+                **{f'{relation.field.name}__in': queryset.values('pk')}
+            )
+            if dependents.exists():
+                raise RuntimeError(
+                    f'Cannot bulk delete {model._meta.label}: {relation.related_model._meta.label}.'
+                    f'{relation.field.name} still references it; delete those rows first'
+                )
+
+    def delete_in_chunks(self, label, queryset, file_field=None, on_chunk=None):
+        """
+        Delete every row of `queryset` in pk chunks; returns the number deleted.
+        `on_chunk(pks)` runs in each chunk's transaction, for cleanup the
+        bypassed post_delete receivers would have done.
+        """
+        model = queryset.model
+        self.check_dependents(queryset)
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        pk_column = quote(model._meta.pk.column)
+        fields = ['pk', file_field] if file_field else ['pk']
+
+        total = self.progress.get(label, 0)
+        while True:
+            rows = list(queryset.order_by('pk').values_list(*fields)[:DELETE_CHUNK_SIZE])
+            if not rows:
+                break
+            pks = [row[0] for row in rows]
+            names = [row[1] for row in rows if file_field and row[1]]
+            placeholders = ', '.join(['%s'] * len(pks))
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {table} WHERE {pk_column} IN ({placeholders})', pks)
+                    total += cursor.rowcount
+                if on_chunk:
+                    on_chunk(pks)
+                if names:
+                    transaction.on_commit(partial(_release_files_async, names))
+            self.record(label, total)
+            if CHUNK_PAUSE:
+                time.sleep(CHUNK_PAUSE)
+        self.record(label, total)
+        return total
+
+
+def delete_all_messages_job(ctx):
+    from .models import (
+        ArchivedMessage, ChatConvo, Conversation, ConversationReadState, Message, MessageSearchTerm
+    )
+
+    ctx.delete_in_chunks('old_messages', ChatConvo.objects.all())
+    ctx.delete_in_chunks('new_messages', Message.objects.all(), 'attachment')
+    ctx.delete_in_chunks('archived_messages', ArchivedMessage.objects.all(), 'attachment')
+    ctx.delete_in_chunks('message_search_terms', MessageSearchTerm.objects.all())
+    ctx.delete_in_chunks('conversation_participants', Conversation.participants.through.objects.all())
+    ctx.delete_in_chunks('conversation_read_states', ConversationReadState.objects.all())
+    ctx.delete_in_chunks('conversations', Conversation.objects.all())
+
+
+def _delete_group(ctx, group_id):
+    from .models import ArchivedGroupMessage, Group, GroupMember, GroupMessage, SearchPosting
+
+    ctx.delete_in_chunks('group_messages', GroupMessage.objects.filter(group_id=group_id), 'attachment')
+    ctx.delete_in_chunks(
+        'archived_group_messages', ArchivedGroupMessage.objects.filter(group_id=group_id), 'attachment'
+    )
+    ctx.delete_in_chunks('group_members', GroupMember.objects.filter(group_id=group_id))
+    ctx.delete_in_chunks(
+        'search_postings', SearchPosting.objects.filter(doc_type=SearchPosting.GROUP_MESSAGE, scope_id=group_id)
+    )
+    # The group row itself goes through the ORM so its image blob is released
+    Group.objects.filter(pk=group_id).delete()
+
+
+def delete_group_job(ctx, group_id):
+    _delete_group(ctx, group_id)
+    ctx.record('groups', 1)
+
+
+def _delete_forum(ctx, forum_id):
+    from .models import ArchivedForumChannelMessage, Forum, ForumChannelMessage, SearchPosting
+
+    ctx.delete_in_chunks('forum_channel_messages', ForumChannelMessage.objects.filter(channel__forum_id=forum_id))
+    ctx.delete_in_chunks(
+        'archived_forum_channel_messages', ArchivedForumChannelMessage.objects.filter(channel__forum_id=forum_id)
+    )
+    ctx.delete_in_chunks(
+        'search_postings', SearchPosting.objects.filter(doc_type=SearchPosting.FORUM_POST, scope_id=forum_id)
+    )
+    Forum.objects.filter(pk=forum_id).delete()
+
+
+def delete_forum_job(ctx, forum_id):
+    _delete_forum(ctx, forum_id)
+    ctx.record('forums', 1)
+
+
+def delete_user_job(ctx, user_id):
+    from django.contrib.auth import get_user_model
+    from .models import (
+        ArchivedForumChannelMessage, ArchivedGroupMessage, ArchivedMessage, ChatConvo, Forum,
+        ForumChannelMessage, Group, GroupMessage, Message, TabSession
+    )
+    from .search import forum_post_index, group_message_index, remove_messages
+
+    # Groups and forums the user created cascade from the user row
+    for index, group_id in enumerate(Group.objects.filter(created_by_id=user_id).values_list('pk', flat=True), 1):
+        _delete_group(ctx, group_id)
+        ctx.record('groups', index)
+    for index, forum_id in enumerate(Forum.objects.filter(created_by_id=user_id).values_list('pk', flat=True), 1):
+        _delete_forum(ctx, forum_id)
+        ctx.record('forums', index)
+
+    ctx.delete_in_chunks('old_messages', ChatConvo.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)))
+    ctx.delete_in_chunks('new_messages', Message.objects.filter(sender_id=user_id), 'attachment', remove_messages)
+    ctx.delete_in_chunks(
+        'group_messages', GroupMessage.objects.filter(sender_id=user_id), 'attachment', group_message_index.remove
+    )
+    ctx.delete_in_chunks(
+        'forum_channel_messages', ForumChannelMessage.objects.filter(sender_id=user_id), on_chunk=forum_post_index.remove
+    )
+    ctx.delete_in_chunks(
+        'archived_messages', ArchivedMessage.objects.filter(sender_id=user_id), 'attachment', remove_messages
+    )
+    ctx.delete_in_chunks(
+        'archived_group_messages', ArchivedGroupMessage.objects.filter(sender_id=user_id), 'attachment',
+        group_message_index.remove
+    )
+    ctx.delete_in_chunks(
+        'archived_forum_channel_messages', ArchivedForumChannelMessage.objects.filter(sender_id=user_id),
+        on_chunk=forum_post_index.remove
+    )
+    ctx.delete_in_chunks('tab_sessions', TabSession.objects.filter(user_id=user_id))
+
+    # What is left (profile, memberships, ...) is small enough for the cascade collector
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is not None:
+        user.delete()
+    ctx.record('users', 1)
+
+
+JOB_HANDLERS = {
+    'delete_all_messages': delete_all_messages_job,
+    'delete_user': delete_user_job,
+    'delete_group': delete_group_job,
+    'delete_forum': delete_forum_job,
+}
+
+
+def run_job(job_id):
+    from .models import BackgroundJob
+
+    close_old_connections()
+    try:
+        # Claim the job; another process may have queued it too (see resume_interrupted_jobs)
+        claimed = BackgroundJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', started_at=timezone.now(), updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = BackgroundJob.objects.get(pk=job_id)
+        JOB_HANDLERS[job.kind](JobContext(job), **job.params)
+        BackgroundJob.objects.filter(pk=job_id).update(status='succeeded', finished_at=timezone.now(), updated_at=timezone.now())
+    except Exception as e:
+        logger.error(f"Background job {job_id} failed: {e}")
+        BackgroundJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(e)[:1000], finished_at=timezone.now(), updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def start_job(kind, params=None, created_by=None):
+    """Record a job and queue it on the worker once the surrounding transaction commits"""
+    from .models import BackgroundJob
+
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = BackgroundJob.objects.create(kind=kind, params=params or {}, created_by=created_by)
+    transaction.on_commit(lambda: _job_executor.submit(run_job, job.pk))
+    return job
+
+
+def resume_interrupted_jobs():
+    """Queue jobs that stayed pending or running past STALE_AFTER, i.e. whose process went away"""
+    from .models import BackgroundJob
+
+    cutoff = timezone.now() - timedelta(seconds=STALE_AFTER)
+    stale = BackgroundJob.objects.filter(status__in=['pending', 'running'], updated_at__lt=cutoff)
+    for job_id in stale.order_by('created_at').values_list('pk', flat=True):
+        # Conditional update so only one process takes each job back
+        reset = BackgroundJob.objects.filter(pk=job_id, updated_at__lt=cutoff).update(
+            status='pending', updated_at=timezone.now()
+        )
+        if reset:
+            logger.info(f"Resuming interrupted background job {job_id}")
+            _job_executor.submit(run_job, job_id)
+
+
+def start_job_resumer():
+    start_periodic_task('background-job-resumer', resume_interrupted_jobs, RESUME_INTERVAL)
+
+
+def job_data(job):
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import ARCHIVE_TIERS, MAX_AGE_DAYS, archive_cutoff, archive_tier
+
+
+class Command(BaseCommand):
+    help = (
+        'Move messages older than ARCHIVE["MAX_AGE_DAYS"] into the archive tables in small '
+        'chunks. Safe to interrupt: every chunk commits on its own and the next run picks up '
+        'whatever is still in the hot tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, default=MAX_AGE_DAYS, help='Archive rows older than this')
+        parser.add_argument('--time-limit', type=int, default=0, help='Stop after this many seconds (0 = no limit)')
+        parser.add_argument(
+            '--only', action='append', choices=[tier.label for tier in ARCHIVE_TIERS],
+            help='Archive only this table (repeatable)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would move')
+
+    def handle(self, *args, **options):
+        if options['max_age_days'] < 1:
+            raise CommandError('--max-age-days must be at least 1')
+        cutoff = archive_cutoff(options['max_age_days'])
+        deadline = time.monotonic() + options['time_limit'] if options['time_limit'] else None
+        tiers = [tier for tier in ARCHIVE_TIERS if not options['only'] or tier.label in options['only']]
+        self.stdout.write(f'Archiving rows older than {cutoff.isoformat()}')
+
+        if options['dry_run']:
+            for tier in tiers:
+                self.stdout.write(f'{tier.label}: {tier.pending(cutoff).count()} rows to archive')
+            return
+
+        def report(tier, total):
+            self.stdout.write(f'  {tier.label}: {total} rows archived')
+
+        for tier in tiers:
+            moved, finished = archive_tier(tier, cutoff, deadline, on_chunk=report)
+            if not finished:
+                self.stdout.write(self.style.WARNING(
+                    f'Time limit reached during {tier.label} after {moved} rows; run again to continue'
+                ))
+                return
+            self.stdout.write(self.style.SUCCESS(f'{tier.label}: done ({moved} rows archived)'))
+        self.stdout.write(self.style.SUCCESS('Archive is up to date'))
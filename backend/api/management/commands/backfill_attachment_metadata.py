@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from api.attachments import compute_attachment_metadata
+from api.models import Message, GroupMessage
+
+METADATA_FIELDS = ['attachment_size', 'attachment_mime_type', 'attachment_name', 'attachment_hash', 'attachment_type']
+
+
+class Command(BaseCommand):
+    help = 'Store size, MIME type, original name and SHA-256 hash for attachments uploaded before metadata was tracked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows fetched and updated per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Message, GroupMessage):
+            updated, missing = self.backfill(model, batch_size)
+            self.stdout.write(
+                self.style.SUCCESS(f'{model.__name__}: backfilled {updated} attachments, {missing} files missing')
+            )
+
+    def backfill(self, model, batch_size):
+        updated = 0
+        missing = 0
+        last_id = 0
+        while True:
+            # Keyset pagination over the primary key keeps every batch an index range scan
+            batch = list(
+                model.objects.filter(id__gt=last_id, attachment_size__isnull=True)
+                .exclude(attachment__isnull=True).exclude(attachment='')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            changed = []
+            for obj in batch:
+                try:
+                    metadata = compute_attachment_metadata(obj.attachment)
+                except (FileNotFoundError, OSError) as e:
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f'{model.__name__} {obj.id}: {e}'))
+                    continue
+                if obj.attachment_type:
+                    metadata.pop('attachment_type')
+                for field, value in metadata.items():
+                    setattr(obj, field, value)
+                changed.append(obj)
+
+            model.objects.bulk_update(changed, METADATA_FIELDS)
+            updated += len(changed)
+        return updated, missing
@@ -0,0 +1,147 @@
+import random
+import string
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+
+from api.typing_throttle import TYPING_EXPIRY
+from api.wire import COMPACT_WIRE, JSON_WIRE
+
+WORDS = [
+    'ok', 'yes', 'no', 'lol', 'see', 'you', 'at', 'the', 'lab', 'tomorrow', 'did', 'submit', 'assignment',
+    'notes', 'from', 'lecture', 'thanks', 'meeting', 'library', 'exam', 'project', 'group', 'deadline',
+]
+
+
+def sample_text(rng):
+    # Mostly short chat lines with the occasional paragraph
+    length = rng.choice([1, 2, 3, 4, 6, 8, 12, 20, 40])
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def sample_events(rng, count):
+    """Frames shaped like the ones ApiConsumer sends, in a typical chat mix"""
+    users = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))) for _ in range(20)]
+    now = time.time()
+    events = []
+    for n in range(count):
+        sender, receiver = rng.sample(users, 2)
+        now += rng.random() * 3
+        kind = rng.random()
+        if kind < 0.45:
+            # Socket path: no full names or emails are known
+            events.append({
+                'type': rng.choice(['message', 'message_sent']),
+                'message': sample_text(rng),
+                'sender': sender,
+                'receiver': receiver,
+                'message_id': f'{sender}_{receiver}_{int(now * 1000)}',
+                'timestamp': now,
+                'conversation_id': None,
+                'is_new_conversation': False,
+                'sender_full_name': sender,
+                'sender_email': '',
+                'receiver_full_name': receiver,
+                'receiver_email': '',
+            })
+        elif kind < 0.55:
+            # REST path
+            events.append({
+                'type': 'message',
+                'message': sample_text(rng),
+                'sender': sender,
+                'receiver': receiver,
+                'message_id': 100000 + n,
+                'timestamp': int(now),
+                'conversation_id': rng.randint(1, 5000),
+                'is_new_conversation': rng.random() < 0.05,
+                'sender_full_name': sender.title() + ' ' + rng.choice(WORDS).title(),
+                'sender_email': f'{sender}@example.edu',
+                'receiver_full_name': receiver,
+                'receiver_email': '',
+            })
+        elif kind < 0.8:
+            events.append({
+                'type': 'typing',
+                'sender': sender,
+                'conversation_id': rng.randint(1, 5000),
+                'is_typing': rng.random() < 0.7,
+                'expires_in': TYPING_EXPIRY,
+                'timestamp': now,
+            })
+        elif kind < 0.9:
+            events.append({
+                'type': 'read_receipt',
+                'conversation_id': rng.randint(1, 5000),
+                'reader': sender,
+                'message_id': 100000 + n,
+                'timestamp': now,
+            })
+        elif kind < 0.95:
+            events.append({
+                'type': 'presence',
+                'user_id': rng.randint(1, 5000),
+                'username': sender,
+                'is_online': rng.random() < 0.5,
+                'timestamp': now,
+            })
+        else:
+            events.append({'type': 'pong', 'timestamp': now})
+    return events
+
+
+def deflated_size(frames, context_takeover):
+    """Total payload bytes under permessage-deflate (RFC 7692: raw deflate, trailing 00 00 ff ff removed)"""
+    total = 0
+    compressor = zlib.compressobj(wbits=-15)
+    for frame in frames:
+        if not context_takeover:
+            compressor = zlib.compressobj(wbits=-15)
+        data = compressor.compress(frame.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total += len(data) - 4
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes per frame and encode time of the JSON and compact ws/chat/ wire formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Number of frames to generate')
+        parser.add_argument('--rounds', type=int, default=5, help='Encode passes to time (best is reported)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated traffic')
+
+    def handle(self, *args, **options):
+        events = sample_events(random.Random(options['seed']), options['messages'])
+        count = len(events)
+
+        self.stdout.write(f'{count} frames, best of {options["rounds"]} encode passes')
+        self.stdout.write(
+            f'{"format":<10}{"bytes/frame":>13}{"deflate":>10}{"deflate*":>10}{"encode us":>11}{"decode us":>11}'
+        )
+        baseline = None
+        for label, wire in (('json', JSON_WIRE), ('compact', COMPACT_WIRE)):
+            best_encode = best_decode = float('inf')
+            for _ in range(options['rounds']):
+                start = time.perf_counter()
+                frames = [wire.encode(event) for event in events]
+                best_encode = min(best_encode, time.perf_counter() - start)
+                start = time.perf_counter()
+                for frame in frames:
+                    wire.decode(frame)
+                best_decode = min(best_decode, time.perf_counter() - start)
+
+            raw = sum(len(frame.encode()) for frame in frames)
+            stream = deflated_size(frames, context_takeover=True)
+            single = deflated_size(frames, context_takeover=False)
+            if baseline is None:
+                baseline = raw
+            self.stdout.write(
+                f'{label:<10}{raw / count:>13.1f}{stream / count:>10.1f}{single / count:>10.1f}'
+                f'{best_encode / count * 1e6:>11.2f}{best_decode / count * 1e6:>11.2f}'
+                f'   ({raw / baseline:.0%} of json)'
+            )
+        self.stdout.write(
+            'deflate: permessage-deflate with context takeover; deflate*: with no_context_takeover. '
+            'Compression is negotiated by the ASGI server, not the consumer.'
+        )
@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import (
+    ChatConvo, Conversation, Forum, ForumChannel, ForumChannelMessage, Group, GroupMessage, Message, TabSession
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def explain(queryset):
+    """Return (table, access, index) triples describing how each table is read"""
+    sql, params = queryset.query.sql_with_params()
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0] for column in cursor.description]
+            return [
+                (row['table'], row['type'], row['key'] or '')
+                for row in (dict(zip(columns, r)) for r in cursor.fetchall())
+            ]
+        # SQLite and PostgreSQL name the index inside the plan text
+        if vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [(None, row[-1], row[-1]) for row in cursor.fetchall()]
+        if vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [(None, row[0], row[0]) for row in cursor.fetchall()]
+    raise CommandError(f'EXPLAIN is not supported for {vendor}')
+
+
+def uses_index(plan, index_name):
+    """True if any row of an explain() plan reads through `index_name`"""
+    return any(index_name in index for _, _, index in plan)
+
+
+def is_full_scan(table, access, hot_table):
+    vendor = connection.vendor
+    if vendor == 'mysql':
+        return table == hot_table and access == 'ALL'
+    if vendor == 'sqlite':
+        return access.startswith(f'SCAN {hot_table}') and 'INDEX' not in access
+    return f'Seq Scan on {hot_table}' in access
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the hot endpoint queries and fail if any of them reads its main table '
+        'with a full scan. With --seed, a dataset is generated inside a transaction that '
+        'is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Rows per hot table to generate before checking')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan row')
+
+    def seed(self, rows):
+        User = get_user_model()
+        users = [
+            User.objects.create_user(username=f'plancheck{i}', email=f'plancheck{i}@example.invalid', password=None)
+            for i in range(20)
+        ]
+        conversations = []
+        for i in range(10):
+            conversation = Conversation.objects.create()
+            conversation.participants.add(users[i], users[i + 10])
+            conversations.append(conversation)
+        group = Group.objects.create(name='plancheck', created_by=users[0])
+        forum = Forum.objects.create(title='plancheck', created_by=users[0])
+        channel = ForumChannel.objects.create(forum=forum, name='plancheck', created_by=users[0])
+
+        Message.objects.bulk_create(
+            Message(conversation=conversations[i % 10], sender=users[i % 20], content='x', is_read=bool(i % 3))
+            for i in range(rows)
+        )
+        GroupMessage.objects.bulk_create(
+            GroupMessage(group=group, sender=users[i % 20], message='x') for i in range(rows)
+        )
+        ForumChannelMessage.objects.bulk_create(
+            ForumChannelMessage(channel=channel, sender=users[i % 20], content='x') for i in range(rows)
+        )
+        ChatConvo.objects.bulk_create(
+            ChatConvo(sender=users[i % 20], receiver=users[(i + 1) % 20], message='x') for i in range(rows)
+        )
+        TabSession.objects.bulk_create(
+            TabSession(user=users[i % 20], tab_id=f'plancheck-{i}', session_key='x', is_active=bool(i % 2))
+            for i in range(rows)
+        )
+
+    def hot_queries(self):
+        """(label, model, queryset) for the query behind each hot endpoint"""
+        message = Message.objects.order_by('-pk').first()
+        conversation_id = message.conversation_id if message else 1
+        user_id = message.sender_id if message else 1
+        other_id = user_id + 1
+        group_id = GroupMessage.objects.values_list('group_id', flat=True).order_by('-pk').first() or 1
+        channel_id = ForumChannelMessage.objects.values_list('channel_id', flat=True).order_by('-pk').first() or 1
+        cutoff = timezone.now() - timedelta(hours=2)
+
+        return [
+            ('mark_conversation_read', Message,
+             Message.objects.filter(conversation_id=conversation_id, is_read=False).exclude(sender_id=user_id)),
+            ('get_conversation_messages', Message,
+             Message.objects.filter(conversation_id=conversation_id).order_by('timestamp')),
+            ('conversation last message', Message,
+             Message.objects.filter(conversation_id=conversation_id).order_by('-timestamp')[:1]),
+            ('get_group_messages', GroupMessage,
+             GroupMessage.objects.filter(group_id=group_id).order_by('timestamp')[:50]),
+            ('forum channel messages', ForumChannelMessage,
+             ForumChannelMessage.objects.filter(channel_id=channel_id).order_by('timestamp')),
+            ('get_user_active_sessions', TabSession,
+             TabSession.objects.filter(user_id=user_id, is_active=True, last_activity__gte=cutoff)),
+            ('tab session sweeper', TabSession,
+             TabSession.objects.filter(is_active=True, last_activity__lt=cutoff).order_by().values_list('id', flat=True)[:1000]),
+            ('legacy conversation', ChatConvo,
+             ChatConvo.objects.filter(
+                 (Q(sender_id=user_id) & Q(receiver_id=other_id)) | (Q(sender_id=other_id) & Q(receiver_id=user_id))
+             ).order_by('-timestamp')),
+            ('admin message feed', Message,
+             Message.objects.order_by('-timestamp', '-id')[:51]),
+        ]
+
+    def check_plans(self, verbose):
+        failures = []
+        for label, model, queryset in self.hot_queries():
+            table = model._meta.db_table
+            plan = explain(queryset)
+            scans = [row for row in plan if is_full_scan(row[0], row[1], table)]
+            if verbose or scans:
+                for row in plan:
+                    self.stdout.write(f'    {row}')
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label} ({table})'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok         {label}'))
+        return failures
+
+    def handle(self, *args, **options):
+        failures = []
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                failures = self.check_plans(options['verbose_plans'])
+                # Never keep the seeded rows
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries use a full table scan: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
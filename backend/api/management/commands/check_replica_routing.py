@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from api.models import Message
+from api.routers import PRIMARY, REPLICAS, STICKY_SECONDS, db_request, is_pinned, unpin_user, use_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Walk a user through the read-replica routing rules and fail if any read goes to the '
+        'wrong database. Run with DB_LOCAL_REPLICAS=1 to try it against two local SQLite files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, default=1, help='User id to route for (not modified)')
+
+    def expect(self, label, alias, expected):
+        if expected == 'replica':
+            ok = alias in REPLICAS
+        else:
+            ok = alias == expected
+        if not ok:
+            raise CommandError(f'{label}: read went to {alias!r}, expected {expected}')
+        self.stdout.write(self.style.SUCCESS(f'ok  {label} -> {alias}'))
+
+    def handle(self, *args, **options):
+        if not REPLICAS:
+            raise CommandError('No replica databases configured (set DB_REPLICA_HOST or DB_LOCAL_REPLICAS=1)')
+        user_id = options['user_id']
+
+        for alias in [PRIMARY, *REPLICAS]:
+            try:
+                Message.objects.using(alias).exists()
+            except Exception as e:
+                raise CommandError(f'Database {alias!r} is not usable ({e}); run migrate --database={alias}')
+
+        unpin_user(user_id)
+        with db_request(user_id):
+            self.expect('read outside a replica view', Message.objects.all().db, PRIMARY)
+            if not use_replica(user_id):
+                raise CommandError('Replica reads were refused for an unpinned user')
+            self.expect('safe read in a replica view', Message.objects.all().db, 'replica')
+            router.db_for_write(Message)
+            self.expect('read after a write in the same request', Message.objects.all().db, PRIMARY)
+
+        if not is_pinned(user_id):
+            raise CommandError('The user was not pinned to the primary after writing')
+        with db_request(user_id):
+            use_replica(user_id)
+            self.expect(f'read within {STICKY_SECONDS}s of a write', Message.objects.all().db, PRIMARY)
+
+        unpin_user(user_id)
+        with db_request(user_id):
+            use_replica(user_id)
+            self.expect('read once the pin expired', Message.objects.all().db, 'replica')
+
+        self.expect('read outside any request', Message.objects.all().db, PRIMARY)
+        for alias in REPLICAS:
+            self.stdout.write(f'    {alias}: {connections[alias].settings_dict["NAME"]}')
+        self.stdout.write(self.style.SUCCESS('Replica routing behaves as expected'))
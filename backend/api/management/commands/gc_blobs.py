@@ -0,0 +1,161 @@
+import os
+import time
+from collections import Counter
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils import timezone
+from api.models import (
+    ArchivedGroupMessage, ArchivedMessage, Message, GroupMessage, Group, Forum, StoredBlob, UploadSession
+)
+from api.storage import BLOB_PREFIX, blob_storage, select_blob_storage
+
+# Scratch directories under the blob root: temporary files of in-flight
+# writes and chunked upload parts
+SCRATCH_DIRS = ('tmp', 'uploads')
+CHECK_BATCH_SIZE = 500
+
+# Every FileField backed by the content-addressed store
+BLOB_FIELDS = [
+    (Message, 'attachment'),
+    (ArchivedMessage, 'attachment'),
+    (GroupMessage, 'attachment'),
+    (ArchivedGroupMessage, 'attachment'),
+    (Group, 'image'),
+    (Forum, 'image'),
+]
+
+
+def unlisted_blob_fields():
+    """FileFields stored in the blob store that BLOB_FIELDS does not cover"""
+    listed = {(model, field) for model, field in BLOB_FIELDS}
+    return [
+        f'{model._meta.label}.{field.name}'
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+        and getattr(field, '_storage_callable', None) is select_blob_storage
+        and (model, field.name) not in listed
+    ]
+
+
+def count_references(name):
+    """Rows currently pointing at the blob called `name`"""
+    return sum(model.objects.filter(**{field: name}).count() for model, field in BLOB_FIELDS)
+
+
+def blob_root_files(min_age):
+    """(name relative to the storage root, path) of every file under BLOB_PREFIX older than min_age seconds"""
+    root = blob_storage.path(BLOB_PREFIX)
+    cutoff = time.time() - min_age
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            name = '/'.join([BLOB_PREFIX, *os.path.relpath(path, root).split(os.sep)])
+            yield name, path
+
+
+def orphan_files(min_age):
+    """
+    Files under the blob root that nothing tracks: blob files without a
+    StoredBlob row, and scratch files that no active upload session owns.
+    Rows are looked up after the walk, so files written meanwhile are kept.
+    """
+    blob_files, scratch_files = [], []
+    for name, path in blob_root_files(min_age):
+        top = name.split('/')[1]
+        (scratch_files if top in SCRATCH_DIRS else blob_files).append((name, path))
+
+    for start in range(0, len(blob_files), CHECK_BATCH_SIZE):
+        batch = dict(blob_files[start:start + CHECK_BATCH_SIZE])
+        known = set(StoredBlob.objects.filter(name__in=list(batch)).values_list('name', flat=True))
+        yield from (path for name, path in batch.items() if name not in known)
+
+    active = {str(pk) for pk in UploadSession.objects.filter(status='active').values_list('pk', flat=True)}
+    for name, path in scratch_files:
+        parts = name.split('/')
+        # blobs/uploads/<session id>/<offset>.chunk belongs to its session while it is active
+        if parts[1] == 'uploads' and len(parts) > 3 and parts[2] in active:
+            continue
+        yield path
+
+
+class Command(BaseCommand):
+    help = 'Recompute blob reference counts from the rows that use them and delete unreferenced blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without writing anything')
+        parser.add_argument(
+            '--min-file-age', type=int, default=24 * 3600,
+            help='Only remove untracked files older than this many seconds (default: one day)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        # A blob referenced only from an unlisted field would look unreferenced and be deleted
+        unlisted = unlisted_blob_fields()
+        if unlisted:
+            raise CommandError(f'Add these blob-backed fields to BLOB_FIELDS first: {", ".join(unlisted)}')
+
+        # Blobs created after this point may belong to uploads the scan below misses
+        scan_started = timezone.now()
+        references = Counter()
+        for model, field in BLOB_FIELDS:
+            names = (
+                model.objects.filter(**{f'{field}__startswith': f'{BLOB_PREFIX}/'})
+                .order_by().values_list(field, flat=True).iterator(chunk_size=2000)
+            )
+            references.update(names)
+
+        fixed = 0
+        removed = 0
+        candidates = StoredBlob.objects.filter(created_at__lt=scan_started).order_by('id')
+        for blob in candidates.iterator(chunk_size=2000):
+            actual = references.get(blob.name, 0)
+            if actual == blob.ref_count and actual > 0:
+                continue
+            if dry_run:
+                if actual == 0:
+                    removed += 1
+                else:
+                    fixed += 1
+                continue
+
+            # The snapshot may be stale: recount under the row lock that
+            # store_file and release_blob also take before acting on it
+            with transaction.atomic():
+                locked = StoredBlob.objects.select_for_update().filter(pk=blob.pk).first()
+                if locked is None or locked.ref_count != blob.ref_count:
+                    # Gone, or referenced/released since the snapshot; the next run will see it
+                    continue
+                actual = count_references(locked.name)
+                if actual == locked.ref_count and actual > 0:
+                    continue
+                if actual == 0:
+                    removed += 1
+                    locked.delete()
+                    blob_storage.delete(locked.name)
+                else:
+                    fixed += 1
+                    StoredBlob.objects.filter(pk=locked.pk).update(ref_count=actual)
+
+        orphans = 0
+        for path in orphan_files(options['min_file_age']):
+            orphans += 1
+            if dry_run:
+                self.stdout.write(f'Untracked file: {path}')
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        prefix = 'Would fix' if dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {fixed} reference counts, {"would remove" if dry_run else "removed"} {removed} unreferenced blobs'))
+        self.stdout.write(self.style.SUCCESS(f'{"Would remove" if dry_run else "Removed"} {orphans} untracked files'))
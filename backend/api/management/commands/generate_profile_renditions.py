@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from api.images import generate_profile_renditions
+from api.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP renditions for profile pictures uploaded before renditions existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate renditions for every profile picture')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        if not options['all']:
+            profiles = profiles.filter(profile_picture_renditions={})
+
+        count = 0
+        for profile_id, picture_name in profiles.values_list('id', 'profile_picture').iterator():
+            generate_profile_renditions(profile_id, picture_name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {count} profile pictures'))
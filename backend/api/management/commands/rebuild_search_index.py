@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+
+from api.models import (
+    ArchivedForumChannelMessage, ArchivedGroupMessage, ArchivedMessage, ForumChannelMessage, GroupMessage, Message,
+    MessageSearchTerm
+)
+from api.search import forum_post_index, group_message_index, index_messages, remove_messages
+
+
+def stream_ids(queryset, batch_size):
+    """Primary keys of `queryset` in ascending batches, without holding them all in memory"""
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def stream_posted_ids(postings, field, batch_size):
+    """Distinct document ids referenced by `postings`, in ascending batches"""
+    last_id = 0
+    while True:
+        ids = list(
+            postings.filter(**{f'{field}__gt': last_id}).order_by(field)
+            .values_list(field, flat=True).distinct()[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+# index name -> (querysets to stream, indexing function, (postings, document id column), removal function)
+INDEXES = {
+    'messages': (
+        lambda: [Message.objects.all(), ArchivedMessage.objects.all()], index_messages,
+        lambda: (MessageSearchTerm.objects.all(), 'message_id'), remove_messages
+    ),
+    'group_messages': (
+        lambda: [GroupMessage.objects.all(), ArchivedGroupMessage.objects.all()], group_message_index.index,
+        lambda: (group_message_index.postings(), 'doc_id'), group_message_index.remove
+    ),
+    'forum_posts': (
+        lambda: [ForumChannelMessage.objects.all(), ArchivedForumChannelMessage.objects.all()], forum_post_index.index,
+        lambda: (forum_post_index.postings(), 'doc_id'), forum_post_index.remove
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild search postings from the existing rows, streaming them in batches, '
+        'and remove postings whose row no longer exists'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows indexed per batch')
+        parser.add_argument('--only', action='append', choices=list(INDEXES), help='Rebuild only this index (repeatable)')
+
+    def handle(self, *args, **options):
+        for name, (querysets, index, posted, remove) in INDEXES.items():
+            if options['only'] and name not in options['only']:
+                continue
+            rows = postings = 0
+            for queryset in querysets():
+                for ids in stream_ids(queryset, options['batch_size']):
+                    postings += index(ids)
+                    rows += len(ids)
+                    self.stdout.write(f'  {name}: {rows} rows, {postings} postings')
+
+            # Rows removed by raw deletes never fired the post_delete receivers
+            pruned = 0
+            posting_rows, id_field = posted()
+            for ids in stream_posted_ids(posting_rows, id_field, options['batch_size']):
+                existing = set()
+                for queryset in querysets():
+                    existing.update(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+                dead = set(ids) - existing
+                if dead:
+                    remove(dead)
+                    pruned += len(dead)
+            self.stdout.write(self.style.SUCCESS(f'{name}: indexed {rows} rows, pruned postings of {pruned} missing rows'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.utils import cleanup_inactive_sessions
+
+
+class Command(BaseCommand):
+    help = 'Deactivate idle tab sessions and delete long-dead ones (same sweep the server runs in the background)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per UPDATE/DELETE statement')
+
+    def handle(self, *args, **options):
+        deactivated, deleted = cleanup_inactive_sessions(chunk_size=options['chunk_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Deactivated {deactivated} sessions, deleted {deleted} sessions')
+        )
@@ -1,8 +1,12 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from django.utils import timezone
-from .utils import get_or_create_tab_session, validate_tab_session
+from django.conf import settings
+from .utils import get_or_create_tab_session, validate_tab_session, cleanup_inactive_sessions
 from .models import TabSession
+from .background import start_periodic_task
+from .jobs import start_job_resumer
+from .routers import db_request
 import json
 
 class TabSessionMiddleware(MiddlewareMixin):
@@ -10,6 +14,19 @@ class TabSessionMiddleware(MiddlewareMixin):
     Middleware to handle tab session validation and management
     """
     
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        # Session expiry runs on a background sweeper, started once per server process
+        sweeper_config = getattr(settings, 'TAB_SESSION_SWEEPER', {})
+        if sweeper_config.get('ENABLED', True):
+            start_periodic_task(
+                'tab-session-sweeper',
+                cleanup_inactive_sessions,
+                sweeper_config.get('INTERVAL', 300)
+            )
+        # Admin jobs left behind by a previous server process
+        start_job_resumer()
+    
     def process_request(self, request):
         # Skip for non-API requests
         if not request.path.startswith('/api/'):
@@ -57,4 +74,24 @@ class TabSessionMiddleware(MiddlewareMixin):
             response['X-Tab-Session-ID'] = request.tab_session.tab_id
             response['X-Session-Valid'] = 'true'
             
-        return response 
\ No newline at end of file
+        return response 
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Holds the read-replica routing state (api/routers.py) for the view. Must come
+    after TabSessionMiddleware so its session bookkeeping does not count as the
+    user's write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with db_request() as state:
+            response = self.get_response(request)
+            # DRF authenticates inside the view and copies the user onto the request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                state.user_id = user.id
+        return response
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_rename_deleted_message_is_deleted_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tabsession',
+            index=models.Index(fields=['is_active', 'last_activity'], name='tabsession_active_activity_idx'),
+        ),
+    ]
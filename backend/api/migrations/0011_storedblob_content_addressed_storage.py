@@ -0,0 +1,43 @@
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_attachment_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='message_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='group_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='group_images/'),
+        ),
+        migrations.AlterField(
+            model_name='forum',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='forum_images/'),
+        ),
+    ]
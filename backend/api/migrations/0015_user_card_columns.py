@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+def copy_profile_cards(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    UserProfile = apps.get_model('api', 'UserProfile')
+
+    with_picture = models.Q(profile_picture__isnull=False) & ~models.Q(profile_picture='')
+    profiles = UserProfile.objects.filter(with_picture | models.Q(is_admin=True))
+    for profile in profiles.iterator():
+        card = {
+            'avatar': profile.profile_picture.name or None,
+            'avatar_renditions': profile.profile_picture_renditions or {},
+        }
+        if profile.is_admin:
+            card['is_admin'] = True
+        User.objects.filter(pk=profile.user_id).update(**card)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(copy_profile_cards, migrations.RunPython.noop),
+    ]
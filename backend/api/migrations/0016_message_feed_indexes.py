@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_user_card_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatconvo',
+            index=models.Index(fields=['timestamp', 'id'], name='chatconvo_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp', 'id'], name='message_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+class AddIndexOnline(migrations.AddIndex):
+    """
+    AddIndex that builds the index as InnoDB online DDL on MySQL, so reads and
+    writes to the table continue while it is built. Other backends use the
+    regular AddIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'mysql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        statement = self.index.create_sql(model, schema_editor)
+        schema_editor.execute(f'{statement} ALGORITHM=INPLACE LOCK=NONE')
+
+
+class Migration(migrations.Migration):
+
+    # MySQL DDL is not transactional; build each index on its own
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_backgroundjob'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp'], name='message_conv_timestamp_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'is_read', 'sender'], name='message_conv_read_sender_idx'),
+        ),
+        AddIndexOnline(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'timestamp'], name='groupmsg_group_timestamp_idx'),
+        ),
+        AddIndexOnline(
+            model_name='forumchannelmessage',
+            index=models.Index(fields=['channel', 'timestamp'], name='forummsg_channel_ts_idx'),
+        ),
+        AddIndexOnline(
+            model_name='tabsession',
+            index=models.Index(fields=['user', 'is_active', 'last_activity'], name='tabsession_user_active_idx'),
+        ),
+        AddIndexOnline(
+            model_name='chatconvo',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='chatconvo_pair_timestamp_idx'),
+        ),
+    ]
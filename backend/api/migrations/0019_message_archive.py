@@ -0,0 +1,88 @@
+import api.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('attachment', models.FileField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='message_attachments/')),
+                ('attachment_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('attachment_size', models.BigIntegerField(blank=True, null=True)),
+                ('attachment_mime_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('attachment_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('attachment_hash', models.CharField(blank=True, max_length=64, null=True)),
+                ('attachment_width', models.PositiveIntegerField(blank=True, null=True)),
+                ('attachment_height', models.PositiveIntegerField(blank=True, null=True)),
+                ('attachment_blurhash', models.CharField(blank=True, max_length=64, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='api.conversation')),
+                ('deleted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_deleted_messages', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_conversation_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [
+                    models.Index(fields=['timestamp', 'id'], name='archmsg_timestamp_id_idx'),
+                    models.Index(fields=['conversation', 'timestamp'], name='archmsg_conv_timestamp_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedGroupMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.TextField()),
+                ('attachment', models.FileField(blank=True, null=True, storage=api.storage.select_blob_storage, upload_to='group_attachments/')),
+                ('attachment_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('attachment_size', models.BigIntegerField(blank=True, null=True)),
+                ('attachment_mime_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('attachment_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('attachment_hash', models.CharField(blank=True, max_length=64, null=True)),
+                ('attachment_width', models.PositiveIntegerField(blank=True, null=True)),
+                ('attachment_height', models.PositiveIntegerField(blank=True, null=True)),
+                ('attachment_blurhash', models.CharField(blank=True, max_length=64, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='api.group')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_group_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [
+                    models.Index(fields=['group', 'timestamp'], name='archgroupmsg_group_ts_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedForumChannelMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='api.forumchannel')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_forum_channel_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [
+                    models.Index(fields=['channel', 'timestamp'], name='archforummsg_channel_ts_idx'),
+                ],
+            },
+        ),
+    ]
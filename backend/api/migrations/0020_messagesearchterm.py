@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_message_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('message_id', models.BigIntegerField()),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+                ('conversation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.conversation')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['term', 'conversation', 'message_id'], name='msgsearch_term_conv_idx'),
+                    models.Index(fields=['message_id'], name='msgsearch_message_idx'),
+                ],
+            },
+        ),
+    ]
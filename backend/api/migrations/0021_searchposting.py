@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_messagesearchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.PositiveSmallIntegerField(choices=[(1, 'Group message'), (2, 'Forum post')])),
+                ('scope_id', models.BigIntegerField()),
+                ('term', models.CharField(max_length=64)),
+                ('doc_id', models.BigIntegerField()),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['doc_type', 'scope_id', 'term', 'doc_id'], name='searchposting_scope_term_idx'),
+                    models.Index(fields=['doc_type', 'doc_id'], name='searchposting_doc_idx'),
+                ],
+            },
+        ),
+    ]
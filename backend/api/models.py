@@ -1,7 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+from django.core.files.storage import default_storage
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
+from .attachments import compute_attachment_metadata
+from .storage import select_blob_storage
+from .images import delete_renditions, image_preview_metadata
+from .cards import CARD_FIELDS, user_cards
+import copy
 import os
+import uuid
 
 
 class CustomUserManager(BaseUserManager):
@@ -30,7 +38,104 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(username, email, password, **extra_fields)
 
 
-class User(AbstractUser):
+def populate_attachment_metadata(instance, update_fields=None):
+    """
+    Fill size/MIME/name/hash for a freshly assigned attachment before it is
+    written. Returns the update_fields list extended with the metadata columns.
+    """
+    attachment = instance.attachment
+    if not attachment or attachment._committed:
+        return update_fields
+
+    metadata = compute_attachment_metadata(attachment)
+    # Lets the blob storage skip the write entirely when the content is already stored
+    attachment.file.sha256 = metadata['attachment_hash']
+    # Dimensions and BlurHash let clients lay out image bubbles before downloading
+    if metadata['attachment_mime_type'].startswith('image/'):
+        try:
+            metadata.update(image_preview_metadata(attachment.file))
+        except Exception as e:
+            print(f"Error building image preview for {attachment.name}: {e}")
+        finally:
+            attachment.file.seek(0)
+    if getattr(instance, 'attachment_type', None):
+        metadata.pop('attachment_type')
+    for field, value in metadata.items():
+        setattr(instance, field, value)
+
+    if update_fields is not None:
+        update_fields = list(set(update_fields) | set(metadata) | {'attachment'})
+    return update_fields
+
+
+class DirtyFieldsMixin:
+    """
+    Remembers the column values an instance was loaded with, so save() can
+    write only the columns that changed (an UPDATE with update_fields) without
+    re-reading the row first. Instances that were not loaded from the database
+    save normally.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_loaded_values()
+        return instance
+
+    def _tracked_value(self, field):
+        value = getattr(self, field.attname)
+        if isinstance(value, FieldFile):
+            return value.name or None
+        # JSON values may be mutated in place
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def _snapshot_loaded_values(self):
+        self._loaded_values = {
+            field.attname: self._tracked_value(field)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def get_dirty_fields(self):
+        """
+        {field name: value as loaded} for every changed column, or None when
+        the instance was not loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or self._state.adding:
+            return None
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(value, FieldFile) and not value._committed:
+                # A freshly assigned upload, even if it reuses the old name
+                dirty[field.name] = loaded.get(field.attname)
+            elif field.attname not in loaded or self._tracked_value(field) != loaded[field.attname]:
+                dirty[field.name] = loaded.get(field.attname)
+        return dirty
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            self._snapshot_loaded_values()
+        elif getattr(self, '_loaded_values', None) is not None:
+            for field in self._meta.concrete_fields:
+                if field.name in fields or field.attname in fields:
+                    self._loaded_values[field.attname] = self._tracked_value(field)
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not kwargs.get('force_insert') and not args:
+            dirty = self.get_dirty_fields()
+            if dirty is not None:
+                # An empty list makes Django skip the UPDATE altogether
+                kwargs['update_fields'] = list(dirty)
+        super().save(*args, **kwargs)
+        self._snapshot_loaded_values()
+
+
+class User(DirtyFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True)
     full_name = models.CharField(max_length=255, blank=True, null=True)
     profile_picture = models.URLField(blank=True, null=True)
@@ -40,6 +145,10 @@ class User(AbstractUser):
     location_lat = models.FloatField(blank=True, null=True)
     location_lng = models.FloatField(blank=True, null=True)
     last_location_update = models.DateTimeField(blank=True, null=True)
+    # "User card" columns mirrored from UserProfile by UserProfile.save, so
+    # rendering a sender or participant never needs the profile row
+    avatar = models.CharField(max_length=255, blank=True, null=True)
+    avatar_renditions = models.JSONField(default=dict, blank=True)
     
     # Username is required for admin login
     username = models.CharField(max_length=150, unique=True)
@@ -63,7 +172,16 @@ class User(AbstractUser):
                 username = f"{base_username}{counter}"
                 counter += 1
             self.username = username
+        dirty = self.get_dirty_fields()
         super().save(*args, **kwargs)
+        if dirty and set(dirty) & set(CARD_FIELDS):
+            user_cards.invalidate(self.pk)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        user_cards.invalidate(user_id)
+        return result
 
 
 class College(models.Model):
@@ -82,7 +200,7 @@ class College(models.Model):
 class Group(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
-    image = models.ImageField(upload_to='group_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='group_images/', storage=select_blob_storage, blank=True, null=True)
     created_by = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_groups')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -114,17 +232,34 @@ class GroupMessage(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='group_messages')
     message = models.TextField()
-    attachment = models.FileField(upload_to='group_attachments/', blank=True, null=True)
+    attachment = models.FileField(upload_to='group_attachments/', storage=select_blob_storage, blank=True, null=True)
+    attachment_type = models.CharField(max_length=50, blank=True, null=True)  # 'image', 'pdf', 'document', etc.
+    # Attachment metadata captured at upload time (see populate_attachment_metadata)
+    attachment_size = models.BigIntegerField(blank=True, null=True)
+    attachment_mime_type = models.CharField(max_length=100, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True, null=True)
+    attachment_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    attachment_width = models.PositiveIntegerField(blank=True, null=True)
+    attachment_height = models.PositiveIntegerField(blank=True, null=True)
+    attachment_blurhash = models.CharField(max_length=64, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Group message pages (get_group_messages)
+            models.Index(fields=['group', 'timestamp'], name='groupmsg_group_timestamp_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = populate_attachment_metadata(self, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
 
 
 class Forum(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
-    image = models.ImageField(upload_to='forum_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='forum_images/', storage=select_blob_storage, blank=True, null=True)
     created_by = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_forums')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -174,6 +309,10 @@ class ForumChannelMessage(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Channel message pages (forum channel views)
+            models.Index(fields=['channel', 'timestamp'], name='forummsg_channel_ts_idx'),
+        ]
 
 class ChatConvo(models.Model):
     sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='sent_messages')
@@ -184,13 +323,29 @@ class ChatConvo(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset stream for the admin message feed (api/feeds.py)
+            models.Index(fields=['timestamp', 'id'], name='chatconvo_timestamp_id_idx'),
+            # Legacy conversation between a sender/receiver pair, by time
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='chatconvo_pair_timestamp_idx'),
+        ]
+
 
+def delete_profile_picture_files(picture_name, renditions):
+    delete_renditions(renditions)
+    try:
+        default_storage.delete(picture_name)
+    except Exception as e:
+        print(f"Error deleting old profile picture file: {e}")
 
-class UserProfile(models.Model):
+
+class UserProfile(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField('User', on_delete=models.CASCADE, related_name='profile')
     description = models.TextField(blank=True, null=True)
     college_name = models.CharField(max_length=200, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # {'small': name, 'medium': name, 'large': name} WebP renditions (see api/images.py)
+    profile_picture_renditions = models.JSONField(default=dict, blank=True)
     is_admin = models.BooleanField(default=False)
     location_lat = models.FloatField(blank=True, null=True)
     location_lng = models.FloatField(blank=True, null=True)
@@ -200,34 +355,50 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s profile"
 
     def save(self, *args, **kwargs):
-        # Delete old profile picture if it exists and is different
-        if self.pk:
-            try:
-                old_instance = UserProfile.objects.get(pk=self.pk)
-                if old_instance.profile_picture and self.profile_picture and old_instance.profile_picture != self.profile_picture:
-                    try:
-                        print(f"Deleting old profile picture: {old_instance.profile_picture.path}")
-                        if os.path.isfile(old_instance.profile_picture.path):
-                            os.remove(old_instance.profile_picture.path)
-                            print("Old profile picture deleted successfully")
-                    except Exception as e:
-                        print(f"Error deleting old profile picture file: {e}")
-            except UserProfile.DoesNotExist:
-                print("Old profile instance not found")
-                pass
-            except Exception as e:
-                print(f"Error accessing old profile instance: {e}")
-        
-        print(f"Saving profile for user: {self.user.username}")
-        print(f"Profile picture: {self.profile_picture}")
+        adding = self._state.adding
+        dirty = self.get_dirty_fields() or {}
+        old_picture_name = dirty.get('profile_picture')
+        old_renditions = {}
+        if old_picture_name:
+            # Renditions belong to the old picture; new ones are generated after save
+            old_renditions = self._loaded_values.get('profile_picture_renditions') or {}
+            self.profile_picture_renditions = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = list(set(kwargs['update_fields']) | {'profile_picture_renditions'})
         super().save(*args, **kwargs)
-        try:
-            print(f"Profile saved successfully. Picture path: {self.profile_picture.path if self.profile_picture else 'None'}")
-        except Exception as e:
-            print(f"Error accessing profile picture path: {e}")
+
+        if adding or 'profile_picture' in dirty or 'profile_picture_renditions' in dirty or 'is_admin' in dirty:
+            self.sync_user_card(sync_admin=self.is_admin and (adding or 'is_admin' in dirty))
+
+        # Only remove the replaced files once the new picture is committed
+        if old_picture_name:
+            transaction.on_commit(lambda: delete_profile_picture_files(old_picture_name, old_renditions))
+
+    def sync_user_card(self, sync_admin=False):
+        """
+        Copy the picture (and, with sync_admin, a set admin flag) onto the User card columns.
+
+        A user is an admin if either User.is_admin or UserProfile.is_admin is
+        set, so the profile flag is only ever ORed in: clearing it never
+        revokes an admin granted on the User row. Revoking takes both flags.
+        """
+        card = {
+            'avatar': self.profile_picture.name or None,
+            'avatar_renditions': self.profile_picture_renditions or {},
+        }
+        if sync_admin:
+            card['is_admin'] = True
+        User.objects.filter(pk=self.user_id).update(**card)
+        user_cards.invalidate(self.user_id)
+        if UserProfile.user.is_cached(self):
+            for field, value in card.items():
+                setattr(self.user, field, value)
 
     def delete(self, *args, **kwargs):
+        User.objects.filter(pk=self.user_id).update(avatar=None, avatar_renditions={})
+        user_cards.invalidate(self.user_id)
         # Delete profile picture file when profile is deleted
+        delete_renditions(self.profile_picture_renditions)
         if self.profile_picture:
             try:
                 if os.path.isfile(self.profile_picture.path):
@@ -249,6 +420,12 @@ class TabSession(models.Model):
 
     class Meta:
         ordering = ['-last_activity']
+        indexes = [
+            # Used by the background sweeper to find expired sessions
+            models.Index(fields=['is_active', 'last_activity'], name='tabsession_active_activity_idx'),
+            # A user's active sessions (get_user_active_sessions)
+            models.Index(fields=['user', 'is_active', 'last_activity'], name='tabsession_user_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.tab_id}"
@@ -267,8 +444,16 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='sent_conversation_messages')
     content = models.TextField()
-    attachment = models.FileField(upload_to='message_attachments/', blank=True, null=True)
+    attachment = models.FileField(upload_to='message_attachments/', storage=select_blob_storage, blank=True, null=True)
     attachment_type = models.CharField(max_length=50, blank=True, null=True)  # 'image', 'pdf', 'document', etc.
+    # Attachment metadata captured at upload time (see populate_attachment_metadata)
+    attachment_size = models.BigIntegerField(blank=True, null=True)
+    attachment_mime_type = models.CharField(max_length=100, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True, null=True)
+    attachment_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    attachment_width = models.PositiveIntegerField(blank=True, null=True)
+    attachment_height = models.PositiveIntegerField(blank=True, null=True)
+    attachment_blurhash = models.CharField(max_length=64, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     
@@ -278,4 +463,212 @@ class Message(models.Model):
     deleted_by = models.ForeignKey('User', on_delete=models.SET_NULL, blank=True, null=True, related_name='deleted_messages')
 
     class Meta:
-        ordering = ['timestamp']
\ No newline at end of file
+        ordering = ['timestamp']
+        indexes = [
+            # Keyset stream for the admin message feed (api/feeds.py)
+            models.Index(fields=['timestamp', 'id'], name='message_timestamp_id_idx'),
+            # Conversation pages and last-message lookups
+            models.Index(fields=['conversation', 'timestamp'], name='message_conv_timestamp_idx'),
+            # Unread counts and mark_conversation_read
+            models.Index(fields=['conversation', 'is_read', 'sender'], name='message_conv_read_sender_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = populate_attachment_metadata(self, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+
+
+class StoredBlob(models.Model):
+    """A deduplicated file in the content-addressed store (see api/storage.py)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """A chunked, resumable upload in progress (see api/uploads.py)"""
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='uploadsession_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received_bytes}/{self.total_size})"
+
+
+class BackgroundJob(models.Model):
+    """An admin bulk operation running on the background worker (see api/jobs.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey('User', on_delete=models.SET_NULL, blank=True, null=True, related_name='background_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
+
+
+# Archive tier (see api/archive.py). Rows keep the primary key they had in the
+# hot table, so message ids and attachment blob references carry over unchanged.
+
+class ArchivedMessage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='archived_conversation_messages')
+    content = models.TextField()
+    attachment = models.FileField(upload_to='message_attachments/', storage=select_blob_storage, blank=True, null=True)
+    attachment_type = models.CharField(max_length=50, blank=True, null=True)
+    attachment_size = models.BigIntegerField(blank=True, null=True)
+    attachment_mime_type = models.CharField(max_length=100, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True, null=True)
+    attachment_hash = models.CharField(max_length=64, blank=True, null=True)
+    attachment_width = models.PositiveIntegerField(blank=True, null=True)
+    attachment_height = models.PositiveIntegerField(blank=True, null=True)
+    attachment_blurhash = models.CharField(max_length=64, blank=True, null=True)
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    deleted_by = models.ForeignKey('User', on_delete=models.SET_NULL, blank=True, null=True, related_name='archived_deleted_messages')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='archmsg_timestamp_id_idx'),
+            models.Index(fields=['conversation', 'timestamp'], name='archmsg_conv_timestamp_idx'),
+        ]
+
+
+class ArchivedGroupMessage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='archived_group_messages')
+    message = models.TextField()
+    attachment = models.FileField(upload_to='group_attachments/', storage=select_blob_storage, blank=True, null=True)
+    attachment_type = models.CharField(max_length=50, blank=True, null=True)
+    attachment_size = models.BigIntegerField(blank=True, null=True)
+    attachment_mime_type = models.CharField(max_length=100, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True, null=True)
+    attachment_hash = models.CharField(max_length=64, blank=True, null=True)
+    attachment_width = models.PositiveIntegerField(blank=True, null=True)
+    attachment_height = models.PositiveIntegerField(blank=True, null=True)
+    attachment_blurhash = models.CharField(max_length=64, blank=True, null=True)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['group', 'timestamp'], name='archgroupmsg_group_ts_idx'),
+        ]
+
+
+class ArchivedForumChannelMessage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    channel = models.ForeignKey(ForumChannel, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey('User', on_delete=models.CASCADE, related_name='archived_forum_channel_messages')
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['channel', 'timestamp'], name='archforummsg_channel_ts_idx'),
+        ]
+
+
+class MessageSearchTerm(models.Model):
+    """
+    One posting of the direct-message search index (see api/search.py): a
+    term and how often it occurs in a message. message_id is a plain column
+    so postings survive the message moving to the archive tier.
+    """
+    term = models.CharField(max_length=64)
+    message_id = models.BigIntegerField()
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    frequency = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'conversation', 'message_id'], name='msgsearch_term_conv_idx'),
+            models.Index(fields=['message_id'], name='msgsearch_message_idx'),
+        ]
+
+
+class SearchPosting(models.Model):
+    """
+    One posting of the group/forum search index (see api/search.py). Documents
+    are referenced by type and id rather than by foreign key so postings stay
+    small and survive archival; scope_id is the group or forum searched.
+    """
+    GROUP_MESSAGE = 1
+    FORUM_POST = 2
+    DOC_TYPE_CHOICES = [
+        (GROUP_MESSAGE, 'Group message'),
+        (FORUM_POST, 'Forum post'),
+    ]
+
+    doc_type = models.PositiveSmallIntegerField(choices=DOC_TYPE_CHOICES)
+    scope_id = models.BigIntegerField()
+    term = models.CharField(max_length=64)
+    doc_id = models.BigIntegerField()
+    frequency = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doc_type', 'scope_id', 'term', 'doc_id'], name='searchposting_scope_term_idx'),
+            models.Index(fields=['doc_type', 'doc_id'], name='searchposting_doc_idx'),
+        ]
+
+
+class ConversationReadState(models.Model):
+    """
+    How far a participant has read a conversation (see api/receipts.py): every
+    message with an id up to last_read_message_id counts as read by the user.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['conversation', 'user']
@@ -0,0 +1,62 @@
+"""
+Admin authorization.
+
+Admin status travels as a signed `is_admin` claim in the JWT, stamped when a
+token pair is issued (password login, Google login) and re-stamped whenever an
+access token is refreshed, so a revoked admin loses the claim within one
+access token lifetime. IsAdmin trusts the claim and only falls back to the
+cached user card for tokens issued before the claim existed, so admin
+endpoints never query the database for authorization.
+"""
+from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .cards import user_cards
+
+ADMIN_CLAIM = 'is_admin'
+
+
+def user_is_admin(user_id):
+    """Admin flag from the user-card cache (User.is_admin mirrors UserProfile.is_admin)"""
+    card = user_cards.get(user_id)
+    return bool(card and card['is_admin'])
+
+
+def tokens_for_user(user):
+    """Refresh token carrying the admin claim; its access_token inherits the claim"""
+    refresh = RefreshToken.for_user(user)
+    refresh[ADMIN_CLAIM] = bool(user.is_admin)
+    return refresh
+
+
+class AdminClaimTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ADMIN_CLAIM] = bool(user.is_admin)
+        return token
+
+
+class AdminClaimTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        access[ADMIN_CLAIM] = user_is_admin(access[api_settings.USER_ID_CLAIM])
+        data['access'] = str(access)
+        return data
+
+
+class IsAdmin(BasePermission):
+    # A dict detail is rendered as-is, keeping the {"error": ...} body the admin endpoints always returned
+    message = {'error': 'Admin access required'}
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        token = request.auth
+        if token is not None and ADMIN_CLAIM in getattr(token, 'payload', {}):
+            return bool(token[ADMIN_CLAIM])
+        return user_is_admin(user.id)
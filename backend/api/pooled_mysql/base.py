@@ -0,0 +1,20 @@
+"""
+MySQL backend whose connections come from api.dbpool.ConnectionPool.
+
+Opening a connection checks one out of the pool and closing it (at the end of
+each request, since CONN_MAX_AGE is 0) returns it, so connections survive the
+per-request threads ASGI runs sync code on.
+"""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from api.dbpool import get_pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return get_pool(self.alias).acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            get_pool(self.alias).release(self.connection, broken=self.errors_occurred)
@@ -0,0 +1,141 @@
+"""
+In-memory presence registry fed by the chat WebSocket.
+
+ApiConsumer registers every socket on connect, refreshes it on ping and
+releases it on disconnect. Per-process connection counts live here, while the
+online flag itself is mirrored into the Django cache with a TTL, so any worker
+(and any sync view) can answer is_online() without touching the database.
+Each worker also keeps its own presence:<id>:<worker> entry while it holds a
+socket for the user, so closing the last socket on one worker only reports
+the user offline when no other live worker still holds one.
+With the default LocMemCache the cache acts as a local stand-in; point
+PRESENCE_CONFIG['CACHE_ALIAS'] at a Redis/Memcached cache to share presence
+across workers.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+PRESENCE_CONFIG = getattr(settings, 'PRESENCE_CONFIG', {})
+PRESENCE_CACHE_ALIAS = PRESENCE_CONFIG.get('CACHE_ALIAS', 'default')
+# A socket that stops pinging is considered gone after this many seconds
+PRESENCE_TTL = PRESENCE_CONFIG.get('TTL', 90)
+WORKERS_KEY = 'presence:workers'
+
+
+class PresenceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}  # user_id -> set of channel names in this process
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._announced_at = 0
+
+    @property
+    def cache(self):
+        return caches[PRESENCE_CACHE_ALIAS]
+
+    def _key(self, user_id):
+        return f'presence:{user_id}'
+
+    def _worker_key(self, user_id, worker_id):
+        return f'presence:{user_id}:{worker_id}'
+
+    def _announce(self):
+        """Keep this worker in the shared worker list, refreshed a few times per TTL"""
+        now = time.time()
+        if now - self._announced_at < PRESENCE_TTL / 3:
+            return
+        self._announced_at = now
+        workers = self.cache.get(WORKERS_KEY) or {}
+        workers = {worker: seen for worker, seen in workers.items() if seen > now - PRESENCE_TTL}
+        workers[self.worker_id] = now
+        self.cache.set(WORKERS_KEY, workers, None)
+
+    def _held_elsewhere(self, user_id):
+        """True if another live worker still holds a socket for the user"""
+        workers = self.cache.get(WORKERS_KEY) or {}
+        keys = [self._worker_key(user_id, worker) for worker in workers if worker != self.worker_id]
+        return bool(keys) and bool(self.cache.get_many(keys))
+
+    def connect(self, user_id, channel_name):
+        """
+        Register a socket for a user. Returns True when the user just came online
+        (no other socket in this process and no live entry from another worker).
+        """
+        with self._lock:
+            channels = self._connections.setdefault(user_id, set())
+            first_local = not channels
+            channels.add(channel_name)
+
+        self._announce()
+        key = self._key(user_id)
+        was_online = self.cache.get(key) is not None
+        now = time.time()
+        self.cache.set_many({key: now, self._worker_key(user_id, self.worker_id): now}, PRESENCE_TTL)
+        return first_local and not was_online
+
+    def touch(self, user_id):
+        """Refresh the TTL of a user's presence entries (called on ping)."""
+        self._announce()
+        now = time.time()
+        self.cache.set_many({self._key(user_id): now, self._worker_key(user_id, self.worker_id): now}, PRESENCE_TTL)
+
+    def disconnect(self, user_id, channel_name):
+        """
+        Release a socket. Returns True when the last local socket for the user
+        closed, no other worker holds one, and the presence entry was dropped.
+        """
+        with self._lock:
+            channels = self._connections.get(user_id)
+            if channels is None:
+                return False
+            channels.discard(channel_name)
+            if channels:
+                return False
+            del self._connections[user_id]
+
+        self.cache.delete(self._worker_key(user_id, self.worker_id))
+        if self._held_elsewhere(user_id):
+            return False
+        self.cache.delete(self._key(user_id))
+        return True
+
+    def is_online(self, user_ids):
+        """Bulk lookup: returns {user_id: bool} with a single cache round trip."""
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        if not keys:
+            return {}
+        found = self.cache.get_many(list(keys))
+        return {user_id: key in found for key, user_id in keys.items()}
+
+    def last_seen(self, user_ids):
+        """Bulk lookup of the last heartbeat (unix time) for users that are online."""
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        if not keys:
+            return {}
+        found = self.cache.get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    # Async wrappers so consumers never block the event loop on a remote cache
+    async def aconnect(self, user_id, channel_name):
+        return await sync_to_async(self.connect, thread_sensitive=False)(user_id, channel_name)
+
+    async def atouch(self, user_id):
+        return await sync_to_async(self.touch, thread_sensitive=False)(user_id)
+
+    async def adisconnect(self, user_id, channel_name):
+        return await sync_to_async(self.disconnect, thread_sensitive=False)(user_id, channel_name)
+
+
+presence = PresenceRegistry()
+
+
+def is_online(user_ids):
+    """Return {user_id: bool} for the given users without querying the database."""
+    return presence.is_online(user_ids)
@@ -0,0 +1,163 @@
+"""
+Read receipts.
+
+Read state is a per-participant pointer (ConversationReadState): every
+message of the conversation with an id up to last_read_message_id has been
+read by that user. Marking a conversation read is one conditional UPDATE of
+that row instead of an UPDATE over every unread Message, and a message is
+shown as read when another participant's pointer has reached it (or its
+legacy is_read flag is set).
+
+Clients report what they have seen with a `read_up_to` WebSocket event. A
+scroll produces a burst of them, so ReadReceiptBatcher keeps only the highest
+message id per conversation and applies it once per READ_DEBOUNCE seconds,
+then pushes a single read_receipt to the other participants and to the
+reader's other tabs.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .dbpool import db_sync_to_async
+from .models import ArchivedMessage, Conversation, ConversationReadState, Message
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_CONFIG = getattr(settings, 'READ_RECEIPTS', {})
+# Seconds read_up_to events are collected before the pointer is written
+READ_DEBOUNCE = RECEIPT_CONFIG.get('DEBOUNCE', 0.5)
+
+
+def advance_read_pointer(conversation_id, user_id, message_id):
+    """Move the user's pointer forward to message_id (never back); returns True if it moved"""
+    moved = ConversationReadState.objects.filter(
+        conversation_id=conversation_id, user_id=user_id, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id, updated_at=timezone.now())
+    if moved:
+        return True
+    _, created = ConversationReadState.objects.get_or_create(
+        conversation_id=conversation_id, user_id=user_id, defaults={'last_read_message_id': message_id}
+    )
+    return created
+
+
+def has_read(conversation_id, user_id, message_id):
+    """True if the user's pointer already covers message_id"""
+    return ConversationReadState.objects.filter(
+        conversation_id=conversation_id, user_id=user_id, last_read_message_id__gte=message_id
+    ).exists()
+
+
+def read_pointers(conversation_ids):
+    """{conversation_id: {user_id: last_read_message_id}} for these conversations"""
+    pointers = {conversation_id: {} for conversation_id in conversation_ids}
+    for conversation_id, user_id, last_read in ConversationReadState.objects.filter(
+        conversation_id__in=list(conversation_ids)
+    ).values_list('conversation_id', 'user_id', 'last_read_message_id'):
+        pointers[conversation_id][user_id] = last_read
+    return pointers
+
+
+def latest_message_id(conversation_id, up_to=None):
+    """Id of the newest message in the conversation, optionally not past `up_to`"""
+    for model in (Message, ArchivedMessage):
+        queryset = model.objects.filter(conversation_id=conversation_id)
+        if up_to is not None:
+            queryset = queryset.filter(pk__lte=up_to)
+        message_id = queryset.order_by('-pk').values_list('pk', flat=True).first()
+        if message_id is not None:
+            return message_id
+    return None
+
+
+def mark_read_up_to(user, conversation_id, message_id=None):
+    """
+    Advance the user's pointer to message_id (default: the newest message).
+    Returns {'message_id', 'moved', 'participants'} or None when the user is
+    not a participant or there is nothing to read.
+    """
+    participants = dict(
+        Conversation.participants.through.objects.filter(conversation_id=conversation_id)
+        .values_list('user_id', 'user__username')
+    )
+    if user.id not in participants:
+        return None
+    # Never point past the conversation's own messages
+    message_id = latest_message_id(conversation_id, message_id)
+    if message_id is None:
+        return None
+    return {
+        'message_id': message_id,
+        'moved': advance_read_pointer(conversation_id, user.id, message_id),
+        'participants': list(participants.values()),
+    }
+
+
+def receipt_event(conversation_id, reader, message_id):
+    return {
+        'type': 'read_receipt',
+        'conversation_id': conversation_id,
+        'reader': reader,
+        'message_id': message_id,
+        'timestamp': time.time(),
+    }
+
+
+async def send_receipt(channel_layer, conversation_id, reader, result):
+    """Push a receipt to every participant's room (the reader's own room reaches their other tabs)"""
+    event = receipt_event(conversation_id, reader, result['message_id'])
+    for username in result['participants']:
+        await channel_layer.group_send(f'chat_{username}', event)
+
+
+def push_receipt(conversation_id, reader, result):
+    """send_receipt for synchronous callers (the REST endpoints); failures are logged, not raised"""
+    try:
+        async_to_sync(send_receipt)(get_channel_layer(), conversation_id, reader, result)
+    except Exception as e:
+        logger.error(f"Error pushing read receipt for conversation {conversation_id}: {e}")
+
+
+class ReadReceiptBatcher:
+    """Debounces one socket's read_up_to events into one pointer write per conversation"""
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self._pending = {}  # conversation_id -> highest message id reported
+        self._flush_handle = None
+
+    def add(self, conversation_id, message_id):
+        if message_id > self._pending.get(conversation_id, 0):
+            self._pending[conversation_id] = message_id
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(READ_DEBOUNCE, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for conversation_id, message_id in pending.items():
+            try:
+                result = await apply_read_up_to(self.consumer.user, conversation_id, message_id)
+                if result and result['moved']:
+                    await send_receipt(self.consumer.channel_layer, conversation_id, self.consumer.username, result)
+            except Exception as e:
+                logger.error(f"Error applying read_up_to for conversation {conversation_id}: {e}")
+
+    async def close(self):
+        """Write whatever is still pending when the socket goes away"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            await self.flush()
+
+
+apply_read_up_to = db_sync_to_async(mark_read_up_to)
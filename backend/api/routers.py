@@ -0,0 +1,122 @@
+"""
+Read-replica database routing.
+
+Views decorated with @replica_reads send their queries to one of the replica
+aliases in DB_REPLICAS['ALIASES'] when the request uses a safe method; every
+write goes to the primary ('default').
+
+Read-your-writes: a user who writes anything is pinned to the primary for
+STICKY_SECONDS, so the next few pages they load cannot miss their own change
+while the replica catches up. Pins are kept in the Django cache
+(DB_REPLICAS['CACHE_ALIAS']; use a shared cache with several workers). Within
+a request, the first write also sends the rest of that request's reads to the
+primary.
+
+Request state is held in a context variable set by ReplicaRoutingMiddleware,
+so queries made outside a request (consumers, background jobs, management
+commands) always use the primary. Consumers pin the senders they write for
+with pin_user().
+"""
+import contextvars
+import functools
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+PRIMARY = 'default'
+REPLICA_CONFIG = getattr(settings, 'DB_REPLICAS', {})
+REPLICAS = [alias for alias in REPLICA_CONFIG.get('ALIASES', []) if alias in settings.DATABASES and alias != PRIMARY]
+STICKY_SECONDS = REPLICA_CONFIG.get('STICKY_SECONDS', 5)
+PIN_CACHE_ALIAS = REPLICA_CONFIG.get('CACHE_ALIAS', 'default')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestDBState:
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+        self.use_replica = False
+        self.replica = None
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_request_state', default=None)
+
+
+def _pin_key(user_id):
+    return f'dbpin:{user_id}'
+
+
+def pin_user(*user_ids):
+    """Send these users' reads to the primary for the next STICKY_SECONDS"""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if REPLICAS and user_ids:
+        caches[PIN_CACHE_ALIAS].set_many({_pin_key(user_id): 1 for user_id in user_ids}, STICKY_SECONDS)
+
+
+def unpin_user(user_id):
+    caches[PIN_CACHE_ALIAS].delete(_pin_key(user_id))
+
+
+def is_pinned(user_id):
+    return user_id is not None and caches[PIN_CACHE_ALIAS].get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def db_request(user_id=None):
+    """Routing state for one request; pins state.user_id afterwards if anything was written"""
+    state = RequestDBState(user_id)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+        if state.wrote:
+            pin_user(state.user_id)
+
+
+def use_replica(user_id):
+    """Route the current request's reads to a replica unless the user is pinned; returns whether it did"""
+    state = _state.get()
+    if state is None or not REPLICAS or is_pinned(user_id):
+        return False
+    state.user_id = user_id
+    state.use_replica = True
+    return True
+
+
+def replica_reads(view):
+    """Serve a read-only view from a replica for safe requests (needs ReplicaRoutingMiddleware)"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            user = getattr(request, 'user', None)
+            use_replica(user.id if user is not None and user.is_authenticated else None)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote:
+            return PRIMARY
+        if state.replica is None:
+            # One replica per request, so its reads see a single snapshot
+            state.replica = random.choice(REPLICAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
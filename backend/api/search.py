@@ -0,0 +1,316 @@
+"""
+Message search.
+
+Direct messages are tokenized into MessageSearchTerm postings (term, message,
+conversation, frequency). New and edited messages are not indexed on the
+request or socket path: their ids are queued after the write commits and a
+single worker thread indexes each batch with one read and one bulk insert, so
+a burst from save_messages_batch costs a handful of queries.
+
+A search matches messages containing every query term, restricted to the
+conversations the user participates in, ranked by the summed term frequency
+and paginated with a (score, message id) keyset cursor. Soft-deleted
+messages are never indexed and are skipped when a page is rendered.
+Postings keep plain message ids, so archived messages remain searchable.
+
+Group messages and forum channel posts share one compact SearchPosting table
+(document type, document id, scope, term, frequency), maintained the same way
+by a ScopedIndex per document type and searched one group or forum at a time.
+"""
+import base64
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q, Sum
+
+from .cards import user_cards
+from .feeds import InvalidCursor
+from .models import (
+    ArchivedForumChannelMessage, ArchivedGroupMessage, ArchivedMessage, Conversation, ForumChannelMessage,
+    GroupMessage, Message, MessageSearchTerm, SearchPosting
+)
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = getattr(settings, 'MESSAGE_SEARCH', {})
+MIN_TERM_LENGTH = SEARCH_CONFIG.get('MIN_TERM_LENGTH', 2)
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = SEARCH_CONFIG.get('MAX_QUERY_TERMS', 8)
+# Seconds the worker waits so messages written close together share a batch
+BATCH_DELAY = SEARCH_CONFIG.get('BATCH_DELAY', 0.2)
+SNIPPET_RADIUS = SEARCH_CONFIG.get('SNIPPET_RADIUS', 60)
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of `text`, with their counts"""
+    return Counter(
+        token for token in TOKEN_RE.findall((text or '').lower())
+        if MIN_TERM_LENGTH <= len(token) <= MAX_TERM_LENGTH
+    )
+
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+# Indexing
+
+def index_messages(message_ids):
+    """(Re)build the postings of these messages from the hot and archive tables"""
+    message_ids = list(set(message_ids))
+    columns = ('id', 'conversation_id', 'content', 'is_deleted')
+    rows = list(Message.objects.filter(pk__in=message_ids).values_list(*columns))
+    found = {row[0] for row in rows}
+    rows += ArchivedMessage.objects.filter(pk__in=set(message_ids) - found).values_list(*columns)
+
+    postings = [
+        MessageSearchTerm(term=term, message_id=message_id, conversation_id=conversation_id, frequency=min(count, 32767))
+        for message_id, conversation_id, content, is_deleted in rows if not is_deleted
+        for term, count in tokenize(content).items()
+    ]
+    with transaction.atomic():
+        MessageSearchTerm.objects.filter(message_id__in=message_ids).delete()
+        MessageSearchTerm.objects.bulk_create(postings, batch_size=1000)
+    return len(postings)
+
+
+def remove_messages(message_ids):
+    MessageSearchTerm.objects.filter(message_id__in=list(message_ids)).delete()
+
+
+class IndexQueue:
+    """Collects message ids and indexes them in batches on one worker thread"""
+
+    def __init__(self, index_func, name):
+        self.index_func = index_func
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._scheduled = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def add(self, ids):
+        with self._lock:
+            self._pending.update(ids)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self._flush)
+
+    def add_on_commit(self, *ids):
+        transaction.on_commit(lambda: self.add(ids))
+
+    def _flush(self):
+        if BATCH_DELAY:
+            time.sleep(BATCH_DELAY)
+        with self._lock:
+            ids, self._pending = self._pending, set()
+            self._scheduled = False
+        if not ids:
+            return
+        close_old_connections()
+        try:
+            self.index_func(ids)
+        except Exception as e:
+            logger.error(f"Search indexing of {len(ids)} rows failed: {e}")
+        finally:
+            close_old_connections()
+
+
+message_index_queue = IndexQueue(index_messages, 'message-search')
+
+
+class ScopedIndex:
+    """
+    Postings of one document type in the shared SearchPosting table. Every
+    posting carries the document's scope (its group or forum), so a search
+    only reads the postings of the scope being searched.
+    """
+
+    def __init__(self, doc_type, name, hot_model, archive_model, text_field, scope_field, extra_fields=()):
+        self.doc_type = doc_type
+        self.name = name
+        self.hot_model = hot_model
+        self.archive_model = archive_model
+        self.text_field = text_field
+        self.scope_field = scope_field
+        self.extra_fields = extra_fields
+        self.queue = IndexQueue(self.index, f'{name}-search')
+
+    def postings(self):
+        return SearchPosting.objects.filter(doc_type=self.doc_type)
+
+    def index(self, doc_ids):
+        """(Re)build the postings of these documents from the hot and archive tables"""
+        doc_ids = list(set(doc_ids))
+        columns = ('id', self.scope_field, self.text_field)
+        rows = list(self.hot_model.objects.filter(pk__in=doc_ids).values_list(*columns))
+        found = {row[0] for row in rows}
+        rows += self.archive_model.objects.filter(pk__in=set(doc_ids) - found).values_list(*columns)
+
+        postings = [
+            SearchPosting(
+                doc_type=self.doc_type, doc_id=doc_id, scope_id=scope_id, term=term, frequency=min(count, 32767)
+            )
+            for doc_id, scope_id, text in rows
+            for term, count in tokenize(text).items()
+        ]
+        with transaction.atomic():
+            self.postings().filter(doc_id__in=doc_ids).delete()
+            SearchPosting.objects.bulk_create(postings, batch_size=1000)
+        return len(postings)
+
+    def remove(self, doc_ids):
+        self.postings().filter(doc_id__in=list(doc_ids)).delete()
+
+    def search(self, scope_id, query, cursor=None, limit=SEARCH_PAGE_SIZE):
+        """One page of ranked results within a scope: {'data': [...], 'next_cursor': str or None}"""
+        terms = query_terms(query)
+        if not terms:
+            return {'data': [], 'next_cursor': None}
+        limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+
+        postings = self.postings().filter(scope_id=scope_id).values('doc_id')
+        page, next_cursor = ranked_page(postings, 'doc_id', terms, cursor, limit)
+
+        docs = load_across_tiers(self.hot_model, self.archive_model, [hit['doc_id'] for hit in page])
+        cards = user_cards.get_many(doc.sender_id for doc in docs.values())
+
+        data = []
+        for hit in page:
+            doc = docs.get(hit['doc_id'])
+            if doc is None:
+                continue
+            snippet, highlights = make_snippet(getattr(doc, self.text_field), terms)
+            data.append({
+                'id': doc.id,
+                **{field: getattr(doc, field) for field in self.extra_fields},
+                'sender_id': doc.sender_id,
+                'sender_username': (cards.get(doc.sender_id) or {}).get('username'),
+                'timestamp': doc.timestamp,
+                'score': hit['score'],
+                'snippet': snippet,
+                'highlights': highlights,
+            })
+        return {'data': data, 'next_cursor': next_cursor}
+
+
+group_message_index = ScopedIndex(
+    SearchPosting.GROUP_MESSAGE, 'group-message', GroupMessage, ArchivedGroupMessage,
+    text_field='message', scope_field='group_id', extra_fields=('group_id',)
+)
+forum_post_index = ScopedIndex(
+    SearchPosting.FORUM_POST, 'forum-post', ForumChannelMessage, ArchivedForumChannelMessage,
+    text_field='content', scope_field='channel__forum_id', extra_fields=('channel_id',)
+)
+
+
+# Searching
+
+def encode_cursor(score, message_id):
+    return base64.urlsafe_b64encode(f'{score}|{message_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        score, message_id = raw.split('|')
+        return int(score), int(message_id)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def make_snippet(content, terms):
+    """A window of `content` around the first match, with [start, end] offsets of every term in it"""
+    content = content or ''
+    lowered = content.lower()
+    first = min((lowered.find(term) for term in terms if term in lowered), default=0)
+    start = max(first - SNIPPET_RADIUS, 0)
+    end = min(first + SNIPPET_RADIUS * 2, len(content))
+    snippet = content[start:end]
+    highlights = sorted(
+        [match.start(), match.end()]
+        for term in terms
+        for match in re.finditer(re.escape(term), snippet.lower())
+    )
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(content) else ''
+    shift = len(prefix)
+    return prefix + snippet + suffix, [[a + shift, b + shift] for a, b in highlights]
+
+
+def load_across_tiers(hot_model, archive_model, ids):
+    """{id: row} for these ids from the hot table, then the archive for the rest"""
+    rows = {row.id: row for row in hot_model.objects.filter(pk__in=ids)}
+    missing = set(ids) - rows.keys()
+    if missing:
+        rows.update((row.id, row) for row in archive_model.objects.filter(pk__in=missing))
+    return rows
+
+
+def ranked_page(postings, id_field, terms, cursor, limit):
+    """
+    Documents among `postings` that contain every term, best first:
+    (hits, next_cursor) where each hit is {id_field, 'score', ...}.
+    """
+    hits = (
+        postings.filter(term__in=terms)
+        .annotate(matched=Count('term', distinct=True), score=Sum('frequency'))
+        .filter(matched=len(terms))
+    )
+    if cursor:
+        score, doc_id = decode_cursor(cursor)
+        hits = hits.filter(Q(score__lt=score) | Q(score=score, **{f'{id_field}__lt': doc_id}))
+    page = list(hits.order_by('-score', f'-{id_field}')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1]['score'], page[-1][id_field])
+    return page, next_cursor
+
+
+def search_user_messages(user, query, conversation_id=None, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """One page of ranked results: {'data': [...], 'next_cursor': str or None}"""
+    terms = query_terms(query)
+    if not terms:
+        return {'data': [], 'next_cursor': None}
+    limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+
+    conversations = Conversation.participants.through.objects.filter(user_id=user.id)
+    if conversation_id:
+        conversations = conversations.filter(conversation_id=conversation_id)
+
+    postings = MessageSearchTerm.objects.filter(
+        conversation_id__in=conversations.values('conversation_id')
+    ).values('message_id', 'conversation_id')
+    page, next_cursor = ranked_page(postings, 'message_id', terms, cursor, limit)
+
+    messages = load_across_tiers(Message, ArchivedMessage, [hit['message_id'] for hit in page])
+    cards = user_cards.get_many(message.sender_id for message in messages.values())
+
+    data = []
+    for hit in page:
+        message = messages.get(hit['message_id'])
+        if message is None or message.is_deleted:
+            continue
+        snippet, highlights = make_snippet(message.content, terms)
+        data.append({
+            'message_id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender_id': message.sender_id,
+            'sender_username': (cards.get(message.sender_id) or {}).get('username'),
+            'timestamp': message.timestamp,
+            'score': hit['score'],
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    return {'data': data, 'next_cursor': next_cursor}
@@ -1,14 +1,76 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Max
 from rest_framework import serializers
 from .models import (
     College, Group, GroupMember, GroupMessage, Forum, ForumMember, ForumChannel, ForumChannelMessage, ChatConvo, 
-    UserProfile, TabSession, Conversation, Message
+    UserProfile, TabSession, Conversation, Message, ArchivedMessage
 )
+from .images import user_avatar_url
+from .cards import user_cards, card_avatar_url
+from .receipts import read_pointers
 import os
 
 User = get_user_model()
 
 
+class UserCardListSerializer(serializers.ListSerializer):
+    """Loads the user cards for a whole page with one get_many() before rendering the rows"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prefetch_cards(items)
+        return [self.child.to_representation(item) for item in items]
+
+
+class UserCardMixin:
+    """
+    Renders users from the shared card cache (api/cards.py) instead of the
+    related User/UserProfile rows. card_user_field names the FK column holding
+    the user id.
+    """
+    card_user_field = 'sender_id'
+
+    def card_user_ids(self, obj):
+        return [getattr(obj, self.card_user_field)]
+
+    def prefetch_cards(self, items):
+        cards = self.context.setdefault('user_cards', {})
+        user_ids = {user_id for obj in items for user_id in self.card_user_ids(obj)}
+        cards.update(user_cards.get_many(user_ids - cards.keys()))
+
+    def card(self, user_id):
+        cards = self.context.setdefault('user_cards', {})
+        if user_id not in cards:
+            cards.update(user_cards.get_many([user_id]))
+        return cards.get(user_id)
+
+    def card_for(self, obj):
+        return self.card(getattr(obj, self.card_user_field)) or {}
+
+
+class ReadPointerMixin:
+    """
+    Derives a direct message's is_read from the other participants' read
+    pointers (api/receipts.py), loaded once per page into the context.
+    """
+
+    def prefetch_read_pointers(self, conversation_ids):
+        pointers = self.context.setdefault('read_pointers', {})
+        missing = set(conversation_ids) - pointers.keys()
+        if missing:
+            pointers.update(read_pointers(missing))
+        return pointers
+
+    def message_is_read(self, message):
+        if message.is_read:
+            return True
+        pointers = self.prefetch_read_pointers([message.conversation_id])[message.conversation_id]
+        return any(
+            last_read >= message.id
+            for user_id, last_read in pointers.items() if user_id != message.sender_id
+        )
+
+
 class CollegeSerializer(serializers.ModelSerializer):
     class Meta:
         model = College
@@ -41,50 +103,60 @@ class GroupSerializer(serializers.ModelSerializer):
         return False
 
 
-class GroupMemberSerializer(serializers.ModelSerializer):
-    username = serializers.ReadOnlyField(source='user.username')
-    email = serializers.ReadOnlyField(source='user.email')
-    first_name = serializers.ReadOnlyField(source='user.first_name')
-    last_name = serializers.ReadOnlyField(source='user.last_name')
+class GroupMemberSerializer(UserCardMixin, serializers.ModelSerializer):
+    card_user_field = 'user_id'
+    username = serializers.SerializerMethodField()
+    email = serializers.SerializerMethodField()
+    first_name = serializers.SerializerMethodField()
+    last_name = serializers.SerializerMethodField()
     profile_picture = serializers.SerializerMethodField()
     
     class Meta:
         model = GroupMember
         fields = ['id', 'user', 'username', 'email', 'first_name', 'last_name', 'profile_picture', 'role', 'joined_at']
+        list_serializer_class = UserCardListSerializer
+    
+    def get_username(self, obj):
+        return self.card_for(obj).get('username')
+    
+    def get_email(self, obj):
+        return self.card_for(obj).get('email')
+    
+    def get_first_name(self, obj):
+        return self.card_for(obj).get('first_name')
+    
+    def get_last_name(self, obj):
+        return self.card_for(obj).get('last_name')
     
     def get_profile_picture(self, obj):
-        try:
-            if obj.user.profile.profile_picture:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.user.profile.profile_picture.url)
-                return obj.user.profile.profile_picture.url
-            return None
-        except:
-            return None
+        return card_avatar_url(self.context.get('request'), self.card_for(obj), 'medium')
 
 
-class GroupMessageSerializer(serializers.ModelSerializer):
-    sender_username = serializers.ReadOnlyField(source='sender.username')
-    sender_first_name = serializers.ReadOnlyField(source='sender.first_name')
-    sender_last_name = serializers.ReadOnlyField(source='sender.last_name')
+class GroupMessageSerializer(UserCardMixin, serializers.ModelSerializer):
+    sender_username = serializers.SerializerMethodField()
+    sender_first_name = serializers.SerializerMethodField()
+    sender_last_name = serializers.SerializerMethodField()
     sender_profile_picture = serializers.SerializerMethodField()
     attachment_url = serializers.SerializerMethodField()
+    attachment_thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = GroupMessage
-        fields = ['id', 'group', 'sender', 'sender_username', 'sender_first_name', 'sender_last_name', 'sender_profile_picture', 'message', 'attachment', 'attachment_url', 'timestamp']
+        fields = ['id', 'group', 'sender', 'sender_username', 'sender_first_name', 'sender_last_name', 'sender_profile_picture', 'message', 'attachment', 'attachment_url', 'attachment_type', 'attachment_name', 'attachment_size', 'attachment_mime_type', 'attachment_width', 'attachment_height', 'attachment_blurhash', 'attachment_thumbnail_url', 'timestamp']
+        read_only_fields = ['attachment_type', 'attachment_name', 'attachment_size', 'attachment_mime_type', 'attachment_width', 'attachment_height', 'attachment_blurhash']
+        list_serializer_class = UserCardListSerializer
+    
+    def get_sender_username(self, obj):
+        return self.card_for(obj).get('username')
+    
+    def get_sender_first_name(self, obj):
+        return self.card_for(obj).get('first_name')
+    
+    def get_sender_last_name(self, obj):
+        return self.card_for(obj).get('last_name')
     
     def get_sender_profile_picture(self, obj):
-        try:
-            if obj.sender.profile.profile_picture:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.sender.profile.profile_picture.url)
-                return obj.sender.profile.profile_picture.url
-            return None
-        except:
-            return None
+        return card_avatar_url(self.context.get('request'), self.card_for(obj), 'small')
     
     def get_attachment_url(self, obj):
         if obj.attachment:
@@ -93,6 +165,15 @@ class GroupMessageSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.attachment.url)
             return obj.attachment.url
         return None
+    
+    def get_attachment_thumbnail_url(self, obj):
+        if obj.attachment and obj.attachment_type == 'image':
+            url = f'/api/group_messages/{obj.id}/thumbnail/'
+            request = self.context.get('request')
+            if request:
+                return request.build_absolute_uri(url)
+            return url
+        return None
 
 
 class ForumSerializer(serializers.ModelSerializer):
@@ -141,24 +222,20 @@ class ForumChannelSerializer(serializers.ModelSerializer):
         fields = ['id', 'forum', 'forum_title', 'name', 'created_by', 'created_at', 'updated_at']
 
 
-class ForumChannelMessageSerializer(serializers.ModelSerializer):
-    sender_username = serializers.ReadOnlyField(source='sender.username')
+class ForumChannelMessageSerializer(UserCardMixin, serializers.ModelSerializer):
+    sender_username = serializers.SerializerMethodField()
     sender_profile_picture = serializers.SerializerMethodField()
 
     class Meta:
         model = ForumChannelMessage
         fields = ['id', 'channel', 'sender', 'sender_username', 'sender_profile_picture', 'content', 'timestamp']
+        list_serializer_class = UserCardListSerializer
+    
+    def get_sender_username(self, obj):
+        return self.card_for(obj).get('username')
     
     def get_sender_profile_picture(self, obj):
-        try:
-            if obj.sender.profile.profile_picture:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.sender.profile.profile_picture.url)
-                return obj.sender.profile.profile_picture.url
-            return None
-        except:
-            return None
+        return card_avatar_url(self.context.get('request'), self.card_for(obj), 'small')
 
 
 class ChatConvoSerializer(serializers.ModelSerializer):
@@ -188,7 +265,7 @@ class TabSessionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class ConversationSerializer(ReadPointerMixin, UserCardMixin, serializers.ModelSerializer):
     participants = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     other_participant = serializers.SerializerMethodField()
@@ -196,45 +273,89 @@ class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
         fields = ['id', 'participants', 'last_message', 'other_participant', 'created_at', 'updated_at']
+        list_serializer_class = UserCardListSerializer
+    
+    def prefetch_cards(self, items):
+        # One query for the participant ids of every conversation on the page
+        participant_ids = self.context.setdefault('conversation_participants', {})
+        missing = [obj.pk for obj in items if obj.pk not in participant_ids]
+        if missing:
+            rows = Conversation.participants.through.objects.filter(
+                conversation_id__in=missing
+            ).order_by('user_id').values_list('conversation_id', 'user_id')
+            for conversation_id in missing:
+                participant_ids[conversation_id] = []
+            for conversation_id, user_id in rows:
+                participant_ids[conversation_id].append(user_id)
+        self.prefetch_read_pointers(obj.pk for obj in items)
+        self.prefetch_last_messages(obj.pk for obj in items)
+        super().prefetch_cards(items)
+    
+    def prefetch_last_messages(self, conversation_ids):
+        """
+        The newest message of every conversation on the page: one GROUP BY for
+        the latest ids and one in_bulk per tier, falling back to the archive
+        only for conversations without hot messages. Ids grow with timestamps.
+        """
+        last_messages = self.context.setdefault('conversation_last_messages', {})
+        missing = set(conversation_ids) - last_messages.keys()
+        for model in (Message, ArchivedMessage):
+            if not missing:
+                break
+            latest = dict(
+                model.objects.filter(conversation_id__in=missing).order_by()
+                .values('conversation_id').annotate(last_id=Max('id')).values_list('conversation_id', 'last_id')
+            )
+            messages = model.objects.only(
+                'id', 'conversation_id', 'sender_id', 'content', 'timestamp', 'is_read'
+            ).in_bulk(list(latest.values()))
+            for conversation_id, message_id in latest.items():
+                last_messages[conversation_id] = messages.get(message_id)
+            missing -= latest.keys()
+        for conversation_id in missing:
+            last_messages[conversation_id] = None
+        return last_messages
+    
+    def card_user_ids(self, obj):
+        participant_ids = self.context.get('conversation_participants', {})
+        if obj.pk not in participant_ids:
+            self.prefetch_cards([obj])
+            participant_ids = self.context['conversation_participants']
+        return participant_ids[obj.pk]
+    
+    def participant_data(self, user_id):
+        card = self.card(user_id)
+        if not card:
+            return None
+        return {
+            'id': card['id'],
+            'username': card['username'],
+            'email': card['email'],
+            'first_name': card['first_name'],
+            'last_name': card['last_name'],
+            'full_name': card['full_name'],
+            'profile_picture': card_avatar_url(self.context.get('request'), card, 'medium')
+        }
     
     def get_participants(self, obj):
-        request = self.context.get('request')
         participants_data = []
-        for participant in obj.participants.all():
-            participant_data = {
-                'id': participant.id,
-                'username': participant.username,
-                'email': participant.email,
-                'first_name': participant.first_name,
-                'last_name': participant.last_name,
-                'full_name': participant.get_full_name() or participant.username,
-                'profile_picture': None
-            }
-            
-            # Get profile picture
-            try:
-                if hasattr(participant, 'profile') and participant.profile.profile_picture:
-                    if request:
-                        participant_data['profile_picture'] = request.build_absolute_uri(participant.profile.profile_picture.url)
-                    else:
-                        participant_data['profile_picture'] = participant.profile.profile_picture.url
-            except:
-                pass
-            
-            participants_data.append(participant_data)
+        for user_id in self.card_user_ids(obj):
+            participant_data = self.participant_data(user_id)
+            if participant_data:
+                participants_data.append(participant_data)
         return participants_data
     
     def get_last_message(self, obj):
         try:
-            last_message = obj.messages.order_by('-timestamp').first()
+            last_message = self.prefetch_last_messages([obj.pk])[obj.pk]
             if last_message:
                 return {
                     'id': last_message.id,
                     'content': last_message.content,
-                    'sender_id': last_message.sender.id,
-                    'sender_username': last_message.sender.username,
+                    'sender_id': last_message.sender_id,
+                    'sender_username': (self.card(last_message.sender_id) or {}).get('username'),
                     'timestamp': last_message.timestamp,
-                    'is_read': last_message.is_read
+                    'is_read': self.message_is_read(last_message)
                 }
             return None
         except:
@@ -246,55 +367,41 @@ class ConversationSerializer(serializers.ModelSerializer):
             return None
         
         # Get the other participant (not the current user)
-        other_participant = obj.participants.exclude(id=request.user.id).first()
-        if other_participant:
-            other_data = {
-                'id': other_participant.id,
-                'username': other_participant.username,
-                'email': other_participant.email,
-                'first_name': other_participant.first_name,
-                'last_name': other_participant.last_name,
-                'full_name': other_participant.get_full_name() or other_participant.username,
-                'profile_picture': None
-            }
-            
-            # Get profile picture
-            try:
-                if hasattr(other_participant, 'profile') and other_participant.profile.profile_picture:
-                    if request:
-                        other_data['profile_picture'] = request.build_absolute_uri(other_participant.profile.profile_picture.url)
-                    else:
-                        other_data['profile_picture'] = other_participant.profile.profile_picture.url
-            except:
-                pass
-            
-            return other_data
+        for user_id in self.card_user_ids(obj):
+            if user_id != request.user.id:
+                return self.participant_data(user_id)
         return None
 
 
-class MessageSerializer(serializers.ModelSerializer):
-    sender_username = serializers.ReadOnlyField(source='sender.username')
+class MessageSerializer(ReadPointerMixin, UserCardMixin, serializers.ModelSerializer):
+    sender_username = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     sender_full_name = serializers.SerializerMethodField()
     sender_profile_picture = serializers.SerializerMethodField()
     attachment_url = serializers.SerializerMethodField()
+    attachment_thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
-        fields = ['id', 'conversation', 'sender', 'sender_username', 'sender_full_name', 'sender_profile_picture', 'content', 'attachment', 'attachment_url', 'attachment_type', 'timestamp', 'is_read']
+        fields = ['id', 'conversation', 'sender', 'sender_username', 'sender_full_name', 'sender_profile_picture', 'content', 'attachment', 'attachment_url', 'attachment_type', 'attachment_name', 'attachment_size', 'attachment_mime_type', 'attachment_width', 'attachment_height', 'attachment_blurhash', 'attachment_thumbnail_url', 'timestamp', 'is_read']
+        read_only_fields = ['attachment_name', 'attachment_size', 'attachment_mime_type', 'attachment_width', 'attachment_height', 'attachment_blurhash']
+        list_serializer_class = UserCardListSerializer
+    
+    def prefetch_cards(self, items):
+        self.prefetch_read_pointers(obj.conversation_id for obj in items)
+        super().prefetch_cards(items)
+    
+    def get_sender_username(self, obj):
+        return self.card_for(obj).get('username')
+    
+    def get_is_read(self, obj):
+        return self.message_is_read(obj)
     
     def get_sender_full_name(self, obj):
-        return obj.sender.get_full_name() or obj.sender.username
+        return self.card_for(obj).get('full_name')
     
     def get_sender_profile_picture(self, obj):
-        try:
-            if obj.sender.profile.profile_picture:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.sender.profile.profile_picture.url)
-                return obj.sender.profile.profile_picture.url
-            return None
-        except:
-            return None
+        return card_avatar_url(self.context.get('request'), self.card_for(obj), 'small')
     
     def get_attachment_url(self, obj):
         if obj.attachment:
@@ -303,6 +410,15 @@ class MessageSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.attachment.url)
             return obj.attachment.url
         return None
+    
+    def get_attachment_thumbnail_url(self, obj):
+        if obj.attachment and obj.attachment_type == 'image':
+            url = f'/api/messages/{obj.id}/thumbnail/'
+            request = self.context.get('request')
+            if request:
+                return request.build_absolute_uri(url)
+            return url
+        return None
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -317,15 +433,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'password', 'first_name', 'last_name', 'profile_picture', 'description', 'college_name', 'is_admin']
     
     def get_profile_picture(self, obj):
-        try:
-            if hasattr(obj, 'profile') and obj.profile.profile_picture:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.profile.profile_picture.url)
-                return obj.profile.profile_picture.url
-            return None
-        except:
-            return None
+        return user_avatar_url(self.context.get('request'), obj)
 
     def get_description(self, obj):
         try:
@@ -344,15 +452,8 @@ class UserSerializer(serializers.ModelSerializer):
             return None
 
     def get_is_admin(self, obj):
-        try:
-            # Check both User model is_admin field and UserProfile is_admin field
-            user_is_admin = getattr(obj, 'is_admin', False)
-            profile_is_admin = False
-            if hasattr(obj, 'profile') and obj.profile:
-                profile_is_admin = obj.profile.is_admin
-            return user_is_admin or profile_is_admin
-        except:
-            return False
+        # UserProfile.is_admin is mirrored onto User.is_admin
+        return getattr(obj, 'is_admin', False)
 
     def create(self, validated_data):
         # Extract password and other fields
@@ -0,0 +1,73 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import (
+    Message, GroupMessage, Group, Forum, ForumChannelMessage, ArchivedMessage, ArchivedGroupMessage,
+    ArchivedForumChannelMessage
+)
+from .storage import release_blob
+from .search import message_index_queue, remove_messages, group_message_index, forum_post_index
+
+# Columns each search index is built from
+SEARCH_FIELDS = {'content', 'is_deleted', 'conversation'}
+GROUP_SEARCH_FIELDS = {'message', 'group'}
+FORUM_SEARCH_FIELDS = {'content', 'channel'}
+
+
+def _release_after_commit(name):
+    if name:
+        transaction.on_commit(partial(release_blob, name))
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=GroupMessage)
+@receiver(post_delete, sender=ArchivedMessage)
+@receiver(post_delete, sender=ArchivedGroupMessage)
+def release_attachment_blob(sender, instance, **kwargs):
+    """Drop the message's reference on its attachment blob once the delete commits"""
+    _release_after_commit(instance.attachment.name if instance.attachment else None)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Forum)
+def release_image_blob(sender, instance, **kwargs):
+    """Drop the group/forum's reference on its image blob once the delete commits"""
+    _release_after_commit(instance.image.name if instance.image else None)
+
+
+@receiver(post_save, sender=Message)
+def queue_message_indexing(sender, instance, created, update_fields=None, **kwargs):
+    """Index new and edited messages on the search worker once the write commits"""
+    if created or update_fields is None or SEARCH_FIELDS & set(update_fields):
+        message_index_queue.add_on_commit(instance.id)
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=ArchivedMessage)
+def remove_message_postings(sender, instance, **kwargs):
+    remove_messages([instance.id])
+
+
+@receiver(post_save, sender=GroupMessage)
+def queue_group_message_indexing(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or GROUP_SEARCH_FIELDS & set(update_fields):
+        group_message_index.queue.add_on_commit(instance.id)
+
+
+@receiver(post_save, sender=ForumChannelMessage)
+def queue_forum_post_indexing(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or FORUM_SEARCH_FIELDS & set(update_fields):
+        forum_post_index.queue.add_on_commit(instance.id)
+
+
+@receiver(post_delete, sender=GroupMessage)
+@receiver(post_delete, sender=ArchivedGroupMessage)
+def remove_group_message_postings(sender, instance, **kwargs):
+    group_message_index.remove([instance.id])
+
+
+@receiver(post_delete, sender=ForumChannelMessage)
+@receiver(post_delete, sender=ArchivedForumChannelMessage)
+def remove_forum_post_postings(sender, instance, **kwargs):
+    forum_post_index.remove([instance.id])
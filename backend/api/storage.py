@@ -0,0 +1,146 @@
+"""
+Content-addressed, reference-counted blob storage for uploaded files.
+
+Every upload is hashed (SHA-256) while it is streamed to a temporary file and
+then stored once under blobs/<aa>/<bb>/<sha256><ext>. Uploading the same bytes
+again only bumps StoredBlob.ref_count, and when the upload's hash is already
+known (see populate_attachment_metadata) nothing is written at all. Rows
+release their reference on delete (api/signals.py); the last release removes
+the file.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORAGE_CONFIG = getattr(settings, 'BLOB_STORAGE', {})
+BLOB_PREFIX = BLOB_STORAGE_CONFIG.get('PREFIX', 'blobs')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, sha256, extension):
+        return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()[:16]
+
+        # Hash already computed upstream: a known blob is a metadata-only insert
+        known_sha256 = getattr(content, 'sha256', None)
+        if known_sha256:
+            blob_name = add_blob_reference_by_hash(known_sha256)
+            if blob_name:
+                return blob_name
+
+        tmp_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+
+            # store_file owns the temporary file from here on
+            return self.store_file(tmp_path, digest.hexdigest(), size, extension)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def store_file(self, local_path, sha256, size, extension=''):
+        """
+        Take a reference on the blob for an already hashed file on the same
+        filesystem and return the blob name. Takes ownership of `local_path`:
+        once the surrounding transaction commits, it is moved into the store,
+        or removed if the blob file is already there. If the transaction rolls
+        back the file stays behind in place; gc_blobs removes stale leftovers.
+        """
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob, _ = StoredBlob.objects.select_for_update().get_or_create(
+                sha256=sha256,
+                defaults={'name': self.blob_name(sha256, extension), 'size': size}
+            )
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        # Only move the file once the row exists for good
+        transaction.on_commit(partial(self._commit_file, local_path, self.path(blob.name)))
+        return blob.name
+
+    def _commit_file(self, local_path, final_path):
+        try:
+            if os.path.exists(final_path):
+                os.remove(local_path)
+                return
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(local_path, final_path)
+            if self.file_permissions_mode is not None:
+                os.chmod(final_path, self.file_permissions_mode)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error moving {local_path} into the blob store: {e}")
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save, never from the upload name
+        return name
+
+
+def select_blob_storage():
+    """Storage callable used by attachment/image FileFields"""
+    if BLOB_STORAGE_CONFIG.get('ENABLED', True):
+        return blob_storage
+    return default_storage
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def add_blob_reference_by_hash(sha256):
+    """Take another reference on an existing blob. Returns its name, or None if unknown."""
+    from .models import StoredBlob
+
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None or not blob_storage.exists(blob.name):
+            return None
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob.name
+
+
+def release_blob(name):
+    """
+    Drop one reference to a stored file and delete it when none are left.
+    Files stored before content addressing were unique per upload and are
+    deleted directly.
+    """
+    from .models import StoredBlob
+
+    if not name:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            if not name.startswith(f'{BLOB_PREFIX}/'):
+                blob_storage.delete(name)
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+        # Delete while holding the row lock so a concurrent upload of the same
+        # bytes waits and then rewrites the file
+        blob_storage.delete(name)
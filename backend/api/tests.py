@@ -1,3 +1,100 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from api.management.commands.check_query_plans import Command as CheckQueryPlans, explain, is_full_scan, uses_index
+from api.models import User, UserProfile
+from api.wire import COMPACT_WIRE
+
+# Hot query label (see check_query_plans.hot_queries) -> index from migration 0018 it must read through
+EXPECTED_PLAN_INDEXES = {
+    'mark_conversation_read': 'message_conv_read_sender_idx',
+    'get_conversation_messages': 'message_conv_timestamp_idx',
+    'conversation last message': 'message_conv_timestamp_idx',
+    'get_group_messages': 'groupmsg_group_timestamp_idx',
+    'forum channel messages': 'forummsg_channel_ts_idx',
+    'get_user_active_sessions': 'tabsession_user_active_idx',
+    'legacy conversation': 'chatconvo_pair_timestamp_idx',
+}
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot endpoint queries against a seeded dataset"""
+    SEED_ROWS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        CheckQueryPlans().seed(cls.SEED_ROWS)
+
+    def setUp(self):
+        self.queries = {label: (model, queryset) for label, model, queryset in CheckQueryPlans().hot_queries()}
+
+    def test_hot_queries_avoid_full_scans(self):
+        for label, (model, queryset) in self.queries.items():
+            with self.subTest(query=label):
+                plan = explain(queryset)
+                scans = [row for row in plan if is_full_scan(row[0], row[1], model._meta.db_table)]
+                self.assertEqual(scans, [], f'{label} reads {model._meta.db_table} with a full scan: {plan}')
+
+    def test_hot_queries_use_their_indexes(self):
+        for label, index_name in EXPECTED_PLAN_INDEXES.items():
+            with self.subTest(query=label):
+                self.assertIn(label, self.queries)
+                plan = explain(self.queries[label][1])
+                self.assertTrue(uses_index(plan, index_name), f'{label} no longer uses {index_name}: {plan}')
+
+
+class AdminFlagSyncTests(TestCase):
+    """A user is an admin if User.is_admin or UserProfile.is_admin is set"""
+
+    def make_user(self, name, is_admin=False):
+        return User.objects.create_user(username=name, email=f'{name}@example.invalid', is_admin=is_admin)
+
+    def assertAdmin(self, user, expected):
+        user.refresh_from_db()
+        self.assertEqual(user.is_admin, expected)
+
+    def test_user_flag_only_survives_profile_saves(self):
+        user = self.make_user('useradmin', is_admin=True)
+        profile = UserProfile.objects.create(user=user)
+        profile.description = 'changed'
+        profile.save()
+        self.assertAdmin(user, True)
+
+        # Granting and then clearing the profile flag leaves the User grant alone
+        profile.is_admin = True
+        profile.save()
+        profile.is_admin = False
+        profile.save()
+        self.assertAdmin(user, True)
+
+    def test_profile_flag_only_grants_admin(self):
+        user = self.make_user('profileadmin')
+        UserProfile.objects.create(user=user, is_admin=True)
+        self.assertAdmin(user, True)
+
+        other = self.make_user('laterprofileadmin')
+        profile = UserProfile.objects.create(user=other)
+        self.assertAdmin(other, False)
+        profile.is_admin = True
+        profile.save()
+        self.assertAdmin(other, True)
+
+    def test_neither_flag(self):
+        user = self.make_user('regular')
+        profile = UserProfile.objects.create(user=user)
+        profile.description = 'changed'
+        profile.save()
+        self.assertAdmin(user, False)
+
+
+class CompactWireTests(SimpleTestCase):
+    def test_false_flags_round_trip(self):
+        for event in (
+            {'type': 'presence', 'user_id': 7, 'username': 'ana', 'is_online': False, 'timestamp': 1.5},
+            {'type': 'typing', 'sender': 'ana', 'conversation_id': 3, 'is_typing': False, 'expires_in': 6, 'timestamp': 1.5},
+        ):
+            with self.subTest(type=event['type']):
+                self.assertEqual(COMPACT_WIRE.decode(COMPACT_WIRE.encode(event)), event)
+
+    def test_null_and_empty_fields_are_dropped(self):
+        frame = COMPACT_WIRE.compact({'type': 'message', 'message': 'hi', 'conversation_id': None, 'sender_email': ''})
+        self.assertEqual(frame, {'t': 'm', 'm': 'hi'})
@@ -0,0 +1,68 @@
+"""
+Typing indicators for the chat WebSocket.
+
+Typing events are ephemeral: ApiConsumer fans them out to the peer's
+chat_<username> group and never touches the database or the persistence
+queue. Clients tend to send one on every keystroke, so they are throttled per
+(sender, conversation) in this process: the first event of a window goes out
+immediately and the rest are coalesced into a single trailing event carrying
+the latest state, sent when the window closes. A "stopped typing" that
+arrives inside a window is therefore never lost, only delayed.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TYPING_CONFIG = getattr(settings, 'TYPING_INDICATORS', {})
+# At most one typing event per sender and conversation per this many seconds
+TYPING_INTERVAL = TYPING_CONFIG.get('INTERVAL', 1.0)
+# Clients should drop a typing state that is not refreshed within this many seconds
+TYPING_EXPIRY = TYPING_CONFIG.get('EXPIRY', 5)
+
+
+class TypingThrottle:
+    def __init__(self, interval=TYPING_INTERVAL):
+        self.interval = interval
+        self._last_sent = {}  # key -> monotonic time of the last event sent
+        self._pending = {}    # key -> (send, event) waiting for the window to close
+
+    async def submit(self, key, event, send):
+        """Send `event` with `send(event)` now, or coalesce it into the trailing event for `key`"""
+        if len(self._last_sent) > 10000:
+            self.prune()
+        now = time.monotonic()
+        wait = self._last_sent.get(key, 0) + self.interval - now
+        if wait <= 0 and key not in self._pending:
+            self._last_sent[key] = now
+            await send(event)
+            return
+        if key not in self._pending:
+            asyncio.get_running_loop().call_later(max(wait, 0), self._flush, key)
+        self._pending[key] = (send, event)
+
+    def _flush(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        send, event = pending
+        self._last_sent[key] = time.monotonic()
+        asyncio.ensure_future(self._send(send, event))
+
+    async def _send(self, send, event):
+        try:
+            await send(event)
+        except Exception as e:
+            logger.error(f"Error sending typing event: {e}")
+
+    def prune(self):
+        """Forget keys whose window closed long ago"""
+        horizon = time.monotonic() - max(self.interval, TYPING_EXPIRY)
+        for key in [key for key, sent in self._last_sent.items() if sent < horizon and key not in self._pending]:
+            del self._last_sent[key]
+
+
+typing_throttle = TypingThrottle()
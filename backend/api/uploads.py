@@ -0,0 +1,264 @@
+"""
+Chunked, resumable uploads.
+
+A client opens an UploadSession, PUTs the file in chunks at explicit byte
+offsets and finalizes it into a group message attachment or a group image.
+Each chunk is streamed from the request body into its own staging file in
+READ_SIZE pieces, with no database lock or transaction open, so a slow client
+only ties up its own request. Once the chunk is on disk, a single conditional
+UPDATE (received_bytes = offset) claims its byte range and the staging file is
+renamed to the chunk file for that offset. A dropped connection only loses
+the current chunk: the client asks for received_bytes and resumes from there.
+
+Finalizing concatenates the chunk files into one file, hashing it on the way,
+and hands that file to the blob store.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .attachments import classify_attachment
+from .background import start_periodic_task
+from .images import image_preview_metadata
+from .storage import BLOB_PREFIX, ContentAddressedStorage, blob_storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CONFIG = getattr(settings, 'CHUNKED_UPLOADS', {})
+MAX_UPLOAD_SIZE = UPLOAD_CONFIG.get('MAX_UPLOAD_SIZE', 500 * 1024 * 1024)
+MAX_CHUNK_SIZE = UPLOAD_CONFIG.get('MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+READ_SIZE = UPLOAD_CONFIG.get('READ_SIZE', 64 * 1024)
+SESSION_TTL = UPLOAD_CONFIG.get('SESSION_TTL', timedelta(days=1))
+SWEEP_INTERVAL = UPLOAD_CONFIG.get('SWEEP_INTERVAL', 3600)
+
+CHUNK_SUFFIX = '.chunk'
+
+
+class UploadError(Exception):
+    """A request that cannot be applied to the upload session"""
+
+
+class UploadOffsetMismatch(UploadError):
+    def __init__(self, received_bytes):
+        super().__init__(f'Expected chunk at offset {received_bytes}')
+        self.received_bytes = received_bytes
+
+
+def chunk_dir(session_id):
+    return blob_storage.path(f'{BLOB_PREFIX}/uploads/{session_id}')
+
+
+def chunk_path(session_id, offset):
+    return os.path.join(chunk_dir(session_id), f'{offset:020d}{CHUNK_SUFFIX}')
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error removing upload file {path}: {e}")
+
+
+def _remove_chunks(session_id):
+    shutil.rmtree(chunk_dir(session_id), ignore_errors=True)
+
+
+def create_upload_session(user, file_name, total_size, content_type=''):
+    from .models import UploadSession
+
+    if total_size <= 0:
+        raise UploadError('size must be positive')
+    if total_size > MAX_UPLOAD_SIZE:
+        raise UploadError(f'File exceeds the maximum upload size of {MAX_UPLOAD_SIZE} bytes')
+
+    start_periodic_task('upload-session-sweeper', cleanup_stale_upload_sessions, SWEEP_INTERVAL)
+
+    file_name = os.path.basename(file_name)[:255]
+    content_type = content_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    return UploadSession.objects.create(
+        user=user,
+        file_name=file_name,
+        content_type=content_type[:100],
+        total_size=total_size,
+    )
+
+
+def _check_chunk(session, offset, length):
+    if session.status != 'active':
+        raise UploadError('Upload is already finalized')
+    if offset != session.received_bytes:
+        raise UploadOffsetMismatch(session.received_bytes)
+    if offset + length > session.total_size:
+        raise UploadError('Chunk extends past the declared file size')
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Write `length` bytes read from `stream` at `offset`. Chunks must arrive in
+    order; a chunk at the wrong offset raises UploadOffsetMismatch carrying the
+    offset to resume from. Returns the new received_bytes.
+    """
+    from .models import UploadSession
+
+    if length <= 0:
+        raise UploadError('Empty chunk')
+    if length > MAX_CHUNK_SIZE:
+        raise UploadError(f'Chunks may not exceed {MAX_CHUNK_SIZE} bytes')
+    _check_chunk(UploadSession.objects.get(pk=session.pk), offset, length)
+
+    directory = chunk_dir(session.pk)
+    os.makedirs(directory, exist_ok=True)
+    fd, staging_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        written = 0
+        with os.fdopen(fd, 'wb') as staging:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                staging.write(data)
+                written += len(data)
+        if written != length:
+            raise UploadError(f'Incomplete chunk: received {written} of {length} bytes')
+
+        # Claim the byte range; a concurrent chunk at the same offset or a finalize may have won
+        claimed = UploadSession.objects.filter(pk=session.pk, status='active', received_bytes=offset).update(
+            received_bytes=offset + length, updated_at=timezone.now()
+        )
+        if not claimed:
+            current = UploadSession.objects.get(pk=session.pk)
+            _check_chunk(current, offset, length)
+            raise UploadOffsetMismatch(current.received_bytes)
+        os.replace(staging_path, chunk_path(session.pk, offset))
+    finally:
+        _remove_file(staging_path)
+    return offset + length
+
+
+def assemble_upload(session):
+    """
+    Concatenate the chunk files of a fully received upload into one file.
+    Returns (path, sha256). Raises UploadError if chunks are missing, after
+    rewinding received_bytes to the end of the contiguous chunks so the
+    client can resume from there.
+    """
+    from .models import UploadSession
+
+    directory = chunk_dir(session.pk)
+    fd, path = tempfile.mkstemp(dir=os.path.dirname(directory), suffix='.part')
+    digest = hashlib.sha256()
+    assembled = 0
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            while assembled < session.total_size:
+                try:
+                    part = open(chunk_path(session.pk, assembled), 'rb')
+                except FileNotFoundError:
+                    break
+                with part:
+                    for data in iter(lambda: part.read(READ_SIZE), b''):
+                        digest.update(data)
+                        target.write(data)
+                        assembled += len(data)
+        if assembled != session.total_size:
+            UploadSession.objects.filter(pk=session.pk, status='active', received_bytes__gt=assembled).update(
+                received_bytes=assembled, updated_at=timezone.now()
+            )
+            raise UploadError(f'Upload incomplete: {assembled} of {session.total_size} bytes received')
+    except BaseException:
+        _remove_file(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def attach_upload(session, instance, field_name='attachment'):
+    """
+    Store a fully received upload in `instance.<field_name>` and save the
+    instance. Attachment metadata is filled from the session, so the file is
+    never read again by populate_attachment_metadata.
+    """
+    from .models import UploadSession
+
+    session = UploadSession.objects.get(pk=session.pk)
+    if session.status != 'active':
+        raise UploadError('Upload is already finalized')
+    if session.received_bytes != session.total_size:
+        raise UploadError(f'Upload incomplete: {session.received_bytes} of {session.total_size} bytes received')
+    # Read and hash the chunks before any row is locked
+    path, sha256 = assemble_upload(session)
+
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.status != 'active':
+                raise UploadError('Upload is already finalized')
+
+            if field_name == 'attachment':
+                metadata = {
+                    'attachment_size': session.total_size,
+                    'attachment_mime_type': session.content_type,
+                    'attachment_name': session.file_name,
+                    'attachment_hash': sha256,
+                    'attachment_type': classify_attachment(session.content_type, session.file_name),
+                }
+                if session.content_type.startswith('image/'):
+                    try:
+                        metadata.update(image_preview_metadata(path))
+                    except Exception as e:
+                        logger.error(f"Error building image preview for upload {session.pk}: {e}")
+                for field, value in metadata.items():
+                    setattr(instance, field, value)
+
+            field_file = getattr(instance, field_name)
+            storage = instance._meta.get_field(field_name).storage
+            if isinstance(storage, ContentAddressedStorage):
+                # Same filesystem: the assembled file is renamed into the store on commit, no copy
+                extension = os.path.splitext(session.file_name)[1].lower()[:16]
+                field_file.name = storage.store_file(path, sha256, session.total_size, extension)
+            else:
+                with open(path, 'rb') as assembled:
+                    field_file.save(session.file_name, File(assembled), save=False)
+                transaction.on_commit(lambda: _remove_file(path))
+            instance.save()
+
+            session.sha256 = sha256
+            session.status = 'complete'
+            session.save(update_fields=['sha256', 'status', 'updated_at'])
+            session_id = session.pk
+            transaction.on_commit(lambda: _remove_chunks(session_id))
+    except BaseException:
+        _remove_file(path)
+        raise
+    return instance
+
+
+def abort_upload(session):
+    session_id = session.pk
+    session.delete()
+    _remove_chunks(session_id)
+
+
+def cleanup_stale_upload_sessions():
+    """Delete sessions (and their part files) untouched for longer than SESSION_TTL"""
+    from .models import UploadSession
+
+    cutoff = timezone.now() - SESSION_TTL
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff).values_list('pk', 'status'))
+    for session_id, session_status in stale:
+        if session_status == 'active':
+            _remove_chunks(session_id)
+    if stale:
+        UploadSession.objects.filter(pk__in=[session_id for session_id, _ in stale]).delete()
+        logger.info(f"Removed {len(stale)} stale upload sessions")
+    return len(stale)
@@ -47,10 +47,15 @@ from .views import (
     admin_delete_college,
     admin_delete_group,
     admin_delete_forum,
+    admin_get_job,
+    admin_db_pool_stats,
     
     # New dynamic chat system views
     get_user_conversations,
     search_user_by_email,
+    search_messages,
+    search_group_messages,
+    search_forum_posts,
     get_conversation_messages,
     send_message_new,
     mark_conversation_read,
@@ -58,6 +63,8 @@ from .views import (
     
     # File and resource sharing views
     download_message_attachment,
+    get_message_attachment_thumbnail,
+    get_group_message_attachment_thumbnail,
     get_conversation_resources,
     
     # Message management views
@@ -65,6 +72,7 @@ from .views import (
     
     # Nearby users views
     get_nearby_users,
+    get_users_presence,
     
     # Group views
     create_group,
@@ -76,6 +84,10 @@ from .views import (
     promote_group_member,
     get_group_messages,
     send_group_message,
+    create_upload,
+    upload_detail,
+    upload_chunk,
+    finalize_upload,
     delete_group,
     update_group,
     
@@ -85,12 +97,13 @@ from .views import (
 )
 
 from rest_framework_simplejwt.views import TokenRefreshView
+from .permissions import AdminClaimTokenRefreshSerializer
 
 urlpatterns = [
     
     path("user/register/", CreateUserView.as_view(), name="register"),
     path("token/", CustomTokenObtainPairView.as_view(), name="get_token"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("token/refresh/", TokenRefreshView.as_view(serializer_class=AdminClaimTokenRefreshSerializer), name="token_refresh"),
     path("token/checktoken/", check_token, name="check_token"),
     
     # Google OAuth endpoint
@@ -110,6 +123,7 @@ urlpatterns = [
     path("forums/<int:forum_id>/invitation/", generate_forum_invitation, name="generate_forum_invitation"),
     path("forums/<int:forum_id>/join/", join_forum_via_invitation, name="join_forum_via_invitation"),
     path("forums/<int:forum_id>/channels/create/", create_forum_channel, name="create_forum_channel"),
+    path("forums/<int:forum_id>/search/", search_forum_posts, name="search_forum_posts"),
     path("channels/<int:channel_id>/messages/", forum_channel_messages, name="forum_channel_messages"),
     
     # Admin endpoints
@@ -125,6 +139,8 @@ urlpatterns = [
     path("admin/colleges/<int:college_id>/delete/", admin_delete_college, name="admin_delete_college"),
     path("admin/groups/<int:group_id>/delete/", admin_delete_group, name="admin_delete_group"),
     path("admin/forums/<int:forum_id>/delete/", admin_delete_forum, name="admin_delete_forum"),
+    path("admin/jobs/<uuid:job_id>/", admin_get_job, name="admin_get_job"),
+    path("admin/db-pool/", admin_db_pool_stats, name="admin_db_pool_stats"),
     
     # Test endpoint
     path("test-upload/", test_upload_endpoint, name="test_upload_endpoint"),
@@ -150,6 +166,7 @@ urlpatterns = [
     path("user/location/", update_user_location, name="update_user_location"),
     path("users/locations/", get_user_locations, name="get_user_locations"),
     path("nearby/users/", get_nearby_users, name="get_nearby_users"),
+    path("users/presence/", get_users_presence, name="get_users_presence"),
     
     # New dynamic chat system endpoints
     path("conversations/", get_user_conversations, name="get_user_conversations"),
@@ -160,7 +177,10 @@ urlpatterns = [
     path("tab_sessions/", get_tab_sessions, name="get_tab_sessions"),
     
     # File and resource sharing endpoints
+    path("messages/search/", search_messages, name="search_messages"),
     path("messages/<int:message_id>/download/", download_message_attachment, name="download_message_attachment"),
+    path("messages/<int:message_id>/thumbnail/", get_message_attachment_thumbnail, name="get_message_attachment_thumbnail"),
+    path("group_messages/<int:message_id>/thumbnail/", get_group_message_attachment_thumbnail, name="get_group_message_attachment_thumbnail"),
     path("conversations/<int:conversation_id>/resources/", get_conversation_resources, name="get_conversation_resources"),
     
     # Message management endpoints
@@ -178,6 +198,13 @@ urlpatterns = [
     path("groups/<int:group_id>/members/<int:user_id>/promote/", promote_group_member, name="promote_group_member"),
     path("groups/<int:group_id>/messages/", get_group_messages, name="get_group_messages"),
     path("groups/<int:group_id>/messages/send/", send_group_message, name="send_group_message"),
+    path("groups/<int:group_id>/search/", search_group_messages, name="search_group_messages"),
+    
+    # Chunked, resumable uploads
+    path("uploads/", create_upload, name="create_upload"),
+    path("uploads/<uuid:upload_id>/", upload_detail, name="upload_detail"),
+    path("uploads/<uuid:upload_id>/chunk/", upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:upload_id>/finalize/", finalize_upload, name="finalize_upload"),
     
     # Resource and file management endpoints
     path("user/file-stats/", get_user_file_stats, name="get_user_file_stats"),
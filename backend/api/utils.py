@@ -73,22 +73,58 @@ def get_or_create_tab_session(user, tab_id, session_key, user_agent=None):
         )
         return session
 
-def cleanup_inactive_sessions():
+def _tab_session_sweeper_config():
+    config = getattr(settings, 'TAB_SESSION_SWEEPER', {})
+    return {
+        'INACTIVE_AFTER': config.get('INACTIVE_AFTER', timedelta(hours=2)),
+        'DELETE_AFTER': config.get('DELETE_AFTER', timedelta(days=7)),
+        'CHUNK_SIZE': config.get('CHUNK_SIZE', 1000),
+    }
+
+def cleanup_inactive_sessions(chunk_size=None):
     """
-    Clean up sessions that haven't been active for more than 2 hours
+    Deactivate sessions idle for longer than INACTIVE_AFTER and hard-delete
+    sessions idle for longer than DELETE_AFTER. Works in primary-key chunks
+    over the (is_active, last_activity) index so no single statement locks
+    the whole table. Called by the background sweeper, never from requests.
+    Returns (deactivated, deleted).
     """
-    cutoff_time = timezone.now() - timedelta(hours=2)
-    TabSession.objects.filter(
-        last_activity__lt=cutoff_time,
-        is_active=True
-    ).update(is_active=False)
+    config = _tab_session_sweeper_config()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    now = timezone.now()
+
+    deactivated = 0
+    inactive_cutoff = now - config['INACTIVE_AFTER']
+    while True:
+        ids = list(TabSession.objects.filter(
+            is_active=True,
+            last_activity__lt=inactive_cutoff
+        ).order_by().values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        deactivated += TabSession.objects.filter(id__in=ids).update(is_active=False)
+
+    deleted = 0
+    delete_cutoff = now - config['DELETE_AFTER']
+    while True:
+        ids = list(TabSession.objects.filter(
+            is_active=False,
+            last_activity__lt=delete_cutoff
+        ).order_by().values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        # TabSession has no dependents, so this is a single fast-path DELETE
+        deleted += TabSession.objects.filter(id__in=ids).delete()[0]
+
+    return deactivated, deleted
 
 def get_user_active_sessions(user):
     """
-    Get all active sessions for a user
+    Get all active sessions for a user. Sessions past the inactivity window
+    are filtered out here even if the sweeper hasn't flagged them yet.
     """
-    cleanup_inactive_sessions()  # Clean up old sessions first
-    return TabSession.objects.filter(user=user, is_active=True)
+    cutoff_time = timezone.now() - _tab_session_sweeper_config()['INACTIVE_AFTER']
+    return TabSession.objects.filter(user=user, is_active=True, last_activity__gte=cutoff_time)
 
 def validate_tab_session(user, tab_id, session_key):
     """
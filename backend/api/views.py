@@ -4,7 +4,6 @@ from .serializers import UserSerializer, ProfileUpdateSerializer, CollegeSeriali
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import timedelta
@@ -15,20 +14,44 @@ from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from .models import (
     College, Group, GroupMember, GroupMessage, Forum, ForumMember, ForumChannel, ForumChannelMessage, ChatConvo, 
-    UserProfile, TabSession, Conversation, Message, User
+    UserProfile, Conversation, Message, ArchivedMessage, User, UploadSession, BackgroundJob
 )
 from .serializers import (
     CollegeSerializer, GroupSerializer, GroupMemberSerializer, GroupMessageSerializer,
     ForumSerializer, ForumMemberSerializer, ForumChannelSerializer, ForumChannelMessageSerializer, ChatConvoSerializer, UserProfileSerializer, ProfileUpdateSerializer,
     TabSessionSerializer, ConversationSerializer, MessageSerializer, UserSerializer
 )
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Value
+from django.db.models.functions import Coalesce
+import itertools
 import os
 import time
 from django.conf import settings
-from .utils import get_profile_picture_url, save_profile_picture_file, delete_profile_picture_file
+from .utils import get_profile_picture_url, save_profile_picture_file
 from .google_oauth import GoogleOAuth
+from .presence import is_online, presence
+from .downloads import serve_file
+from .jobs import start_job, job_data
+from .dbpool import pool_stats
+from .routers import replica_reads
+from .archive import TieredMessages, find_message
+from .receipts import has_read, mark_read_up_to, push_receipt
+from .search import search_user_messages, group_message_index, forum_post_index, SEARCH_PAGE_SIZE
+from .permissions import IsAdmin, AdminClaimTokenObtainPairSerializer
+from .feeds import admin_message_feed, parse_feed_filters, InvalidCursor, DEFAULT_PAGE_SIZE
+from .storage import release_blob
+from .uploads import (
+    UploadError, UploadOffsetMismatch, MAX_CHUNK_SIZE,
+    create_upload_session, append_chunk, attach_upload, abort_upload
+)
+from .images import (
+    schedule_profile_renditions, user_avatar_url,
+    get_attachment_thumbnail, THUMBNAIL_SIZES, DEFAULT_THUMBNAIL_SIZE
+)
+from .consumers import group_message_payload
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 
 # Updated views.py functions to support full names
 
@@ -86,23 +109,6 @@ def google_auth(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-# Admin permission check decorator
-def admin_required(view_func):
-    def wrapper(request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if not profile.is_admin:
-                return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        except UserProfile.DoesNotExist:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
-        return view_func(request, *args, **kwargs)
-    return wrapper
-
-
 # Get all colleges for dropdown
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -121,6 +127,7 @@ def get_colleges(request):
 # Public Forums
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def get_forums(request):
     try:
         forums = Forum.objects.all().order_by('-created_at')
@@ -208,8 +215,11 @@ def forum_channel_messages(request, channel_id):
     try:
         channel = ForumChannel.objects.get(id=channel_id)
         if request.method == 'GET':
-            messages = channel.messages.all().order_by('timestamp')
-            serializer = ForumChannelMessageSerializer(messages, many=True, context={'request': request})
+            messages = TieredMessages(
+                channel.archived_messages.select_related('sender').order_by('timestamp'),
+                channel.messages.select_related('sender').order_by('timestamp')
+            )
+            serializer = ForumChannelMessageSerializer(list(messages), many=True, context={'request': request})
             return Response({'data': serializer.data}, status=status.HTTP_200_OK)
         # POST
         content = request.data.get('content')
@@ -300,29 +310,10 @@ def join_forum_via_invitation(request, forum_id):
 
 # Get all users (admin only)
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def admin_get_users(request):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
-        try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
-        
-        # Also check UserProfile.is_admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
-        
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         users = User.objects.all().order_by('-date_joined')
         # Exclude staff accounts from the admin-visible user list if requested by product
         users = users.exclude(is_staff=True)
@@ -337,63 +328,24 @@ def admin_get_users(request):
 
 # Get all messages (admin only)
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def admin_get_messages(request):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
+        # Keyset-paginated merge of legacy ChatConvo rows and conversation messages.
+        # Filters: user_id, conversation_id, since, until (ISO 8601); page with ?cursor=
         try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
+            filters = parse_feed_filters(request.GET)
+            limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Also check UserProfile.is_admin
         try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
+            page = admin_message_feed(filters, cursor=request.GET.get('cursor'), limit=limit)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get messages from both old and new systems
-        old_messages = ChatConvo.objects.all().order_by('-timestamp')
-        new_messages = Message.objects.all().order_by('-timestamp')
-        
-        message_data = []
-        
-        # Add old messages
-        for message in old_messages:
-            message_data.append({
-                'id': f"old_{message.id}",
-                'sender': message.sender.username,
-                'receiver': message.receiver.username,
-                'message': message.message,
-                'timestamp': message.timestamp,
-                'type': 'old'
-            })
-        
-        # Add new messages
-        for message in new_messages:
-            message_data.append({
-                'id': f"new_{message.id}",
-                'sender': message.sender.username,
-                'receiver': message.receiver.username,
-                'message': message.content,
-                'timestamp': message.timestamp,
-                'type': 'new'
-            })
-        
-        # Sort by timestamp
-        message_data.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        return Response({
-            'data': message_data
-        }, status=status.HTTP_200_OK)
+        return Response(page, status=status.HTTP_200_OK)
     except Exception as e:
         print(f"Error in admin_get_messages: {e}")
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -401,48 +353,16 @@ def admin_get_messages(request):
 
 # Delete all messages and conversations (admin only)
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_delete_all_messages(request):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
-        try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
-        
-        # Also check UserProfile.is_admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
-        
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get counts before deletion
-        old_message_count = ChatConvo.objects.count()
-        new_message_count = Message.objects.count()
-        conversation_count = Conversation.objects.count()
-        
-        # Delete all messages and conversations
-        ChatConvo.objects.all().delete()
-        Message.objects.all().delete()
-        Conversation.objects.all().delete()
+        # Deleted in chunks on the background worker; poll admin/jobs/<job_id>/ for progress
+        job = start_job('delete_all_messages', created_by=request.user)
         
         return Response({
-            'message': 'All messages and conversations deleted successfully',
-            'deleted': {
-                'old_messages': old_message_count,
-                'new_messages': new_message_count,
-                'conversations': conversation_count,
-                'total': old_message_count + new_message_count + conversation_count
-            }
-        }, status=status.HTTP_200_OK)
+            'message': 'Deletion of all messages and conversations started',
+            'job': job_data(job)
+        }, status=status.HTTP_202_ACCEPTED)
     except Exception as e:
         print(f"Error in admin_delete_all_messages: {e}")
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -450,37 +370,17 @@ def admin_delete_all_messages(request):
 
 # Delete specific user (admin only)
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_delete_user(request, user_id):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
-        try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
-        
-        # Also check UserProfile.is_admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
-        
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         # Get the user to delete
         try:
             user_to_delete = User.objects.get(id=user_id)
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        # Prevent deleting admin users
-        if user_to_delete.is_admin or (hasattr(user_to_delete, 'profile') and user_to_delete.profile.is_admin):
+        # Prevent deleting admin users (User.is_admin mirrors UserProfile.is_admin)
+        if user_to_delete.is_admin:
             return Response({"error": "Cannot delete admin users"}, status=status.HTTP_400_BAD_REQUEST)
         
         # Prevent deleting self
@@ -490,12 +390,13 @@ def admin_delete_user(request, user_id):
         # Store username for response
         username = user_to_delete.username
         
-        # Delete user (this will cascade delete related data)
-        user_to_delete.delete()
+        # Delete user and related data in chunks on the background worker
+        job = start_job('delete_user', {'user_id': user_to_delete.id}, created_by=request.user)
         
         return Response({
-            'message': f'User "{username}" deleted successfully'
-        }, status=status.HTTP_200_OK)
+            'message': f'Deletion of user "{username}" started',
+            'job': job_data(job)
+        }, status=status.HTTP_202_ACCEPTED)
     except Exception as e:
         print(f"Error in admin_delete_user: {e}")
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -503,29 +404,10 @@ def admin_delete_user(request, user_id):
 
 # Get all groups (admin only)
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def admin_get_groups(request):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
-        try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
-        
-        # Also check UserProfile.is_admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
-        
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         groups = Group.objects.all().order_by('-created_at')
         serializer = GroupSerializer(groups, many=True, context={'request': request})
         return Response({
@@ -538,29 +420,10 @@ def admin_get_groups(request):
 
 # Get all forums (admin only)
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def admin_get_forums(request):
     try:
-        # Check if user is admin (check both User.is_admin and UserProfile.is_admin)
-        is_admin = False
-        try:
-            # First check User model's is_admin field
-            if hasattr(request.user, 'is_admin') and request.user.is_admin:
-                is_admin = True
-        except:
-            pass
-        
-        # Also check UserProfile.is_admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_admin:
-                is_admin = True
-        except UserProfile.DoesNotExist:
-            pass
-        
-        if not is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         forums = Forum.objects.all().order_by('-created_at')
         serializer = ForumSerializer(forums, many=True, context={'request': request})
         return Response({
@@ -573,24 +436,13 @@ def admin_get_forums(request):
 
 # Add new college (admin only)
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_add_college(request):
     try:
         print(f"DEBUG: admin_add_college called by user: {request.user.username}")
         print(f"DEBUG: Request data: {request.data}")
         print(f"DEBUG: Request headers: {request.headers}")
         
-        # Check if user is admin
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            print(f"DEBUG: User profile found, is_admin: {profile.is_admin}")
-            if not profile.is_admin:
-                print(f"DEBUG: User is not admin")
-                return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        except UserProfile.DoesNotExist:
-            print(f"DEBUG: User profile does not exist")
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         serializer = CollegeSerializer(data=request.data)
         print(f"DEBUG: Serializer is valid: {serializer.is_valid()}")
         if not serializer.is_valid():
@@ -613,14 +465,9 @@ def admin_add_college(request):
 
 # Add new group (admin only)
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_add_group(request):
     try:
-        # Check if user is admin
-        profile = UserProfile.objects.get(user=request.user)
-        if not profile.is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         serializer = GroupSerializer(data=request.data)
         if serializer.is_valid():
             group = serializer.save(created_by=request.user)
@@ -636,14 +483,9 @@ def admin_add_group(request):
 
 # Add new forum (admin only)
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_add_forum(request):
     try:
-        # Check if user is admin
-        profile = UserProfile.objects.get(user=request.user)
-        if not profile.is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         serializer = ForumSerializer(data=request.data)
         if serializer.is_valid():
             forum = serializer.save(created_by=request.user)
@@ -659,14 +501,9 @@ def admin_add_forum(request):
 
 # Delete college (admin only)
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_delete_college(request, college_id):
     try:
-        # Check if user is admin
-        profile = UserProfile.objects.get(user=request.user)
-        if not profile.is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         try:
             college = College.objects.get(id=college_id)
             college.delete()
@@ -682,20 +519,16 @@ def admin_delete_college(request, college_id):
 
 # Delete group (admin only)
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_delete_group(request, group_id):
     try:
-        # Check if user is admin
-        profile = UserProfile.objects.get(user=request.user)
-        if not profile.is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         try:
             group = Group.objects.get(id=group_id)
-            group.delete()
+            job = start_job('delete_group', {'group_id': group.id}, created_by=request.user)
             return Response({
-                'message': 'Group deleted successfully'
-            }, status=status.HTTP_200_OK)
+                'message': 'Group deletion started',
+                'job': job_data(job)
+            }, status=status.HTTP_202_ACCEPTED)
         except Group.DoesNotExist:
             return Response({"error": "Group not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -705,20 +538,16 @@ def admin_delete_group(request, group_id):
 
 # Delete forum (admin only)
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsAdmin])
 def admin_delete_forum(request, forum_id):
     try:
-        # Check if user is admin
-        profile = UserProfile.objects.get(user=request.user)
-        if not profile.is_admin:
-            return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
-        
         try:
             forum = Forum.objects.get(id=forum_id)
-            forum.delete()
+            job = start_job('delete_forum', {'forum_id': forum.id}, created_by=request.user)
             return Response({
-                'message': 'Forum deleted successfully'
-            }, status=status.HTTP_200_OK)
+                'message': 'Forum deletion started',
+                'job': job_data(job)
+            }, status=status.HTTP_202_ACCEPTED)
         except Forum.DoesNotExist:
             return Response({"error": "Forum not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -726,6 +555,37 @@ def admin_delete_forum(request, forum_id):
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Status of a background admin job (admin only)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def admin_get_job(request, job_id):
+    try:
+        try:
+            job = BackgroundJob.objects.get(id=job_id)
+        except BackgroundJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'data': job_data(job)
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in admin_get_job: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Database connection pool and consumer executor metrics (admin only)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def admin_db_pool_stats(request):
+    try:
+        return Response({
+            'data': pool_stats()
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in admin_db_pool_stats: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # Updated CreateUserView to handle first_name and last_name
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -882,22 +742,15 @@ def upload_profile_picture(request):
                 "error": "File size must be less than 5MB"
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete old profile picture if it exists
-        if profile.profile_picture:
-            try:
-                if os.path.isfile(profile.profile_picture.path):
-                    os.remove(profile.profile_picture.path)
-                    print(f"Old profile picture deleted: {profile.profile_picture.path}")
-            except Exception as e:
-                print(f"Error deleting old profile picture: {e}")
-        
-        # Save new profile picture using Django's ImageField
+        # Save new profile picture using Django's ImageField. Only the changed
+        # columns are written; the old file and its renditions are removed
+        # by UserProfile.save once the update commits.
         profile.profile_picture = uploaded_file
         profile.save()
         print(f"Profile picture saved to database: {profile.profile_picture}")
-
-        # Refresh profile from database to ensure latest data
-        profile.refresh_from_db()
+        
+        # Generate 48/128/512px WebP renditions in the background worker pool
+        schedule_profile_renditions(profile)
 
         # Get the full URL for response
         file_url = request.build_absolute_uri(profile.profile_picture.url)
@@ -937,10 +790,8 @@ def delete_profile_picture(request):
         profile, created = UserProfile.objects.get_or_create(user=request.user)
         
         if profile.profile_picture:
-            # Delete the file using utility function
-            delete_profile_picture_file(profile.profile_picture)
-            
-            # Clear the field in database
+            # Clear the field in database; the file and its renditions are
+            # deleted after the update commits
             profile.profile_picture = None
             profile.save()
             
@@ -970,7 +821,8 @@ def delete_profile_picture(request):
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
  
 class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = TokenObtainPairSerializer
+    # Stamps the is_admin claim checked by IsAdmin
+    serializer_class = AdminClaimTokenObtainPairSerializer
 
     def post(self, request, *args, **kwargs):
         # Call the parent method to get the token data
@@ -1171,15 +1023,13 @@ def list_users(request):
     
     try:
         # Exclude the current user and admin user
-        users = User.objects.exclude(id=request.user.id).exclude(username='admin')
+        users = User.objects.exclude(id=request.user.id).exclude(username='admin').select_related('profile')
         data = []
         
         for u in users:
             try:
                 # Get profile picture URL using utility function
-                profile_picture_url = None
-                if hasattr(u, 'profile') and u.profile.profile_picture:
-                    profile_picture_url = get_profile_picture_url(request, u.profile.profile_picture)
+                profile_picture_url = user_avatar_url(request, u, 'medium')
                 
                 user_data = {
                     "id": u.id,
@@ -1285,6 +1135,7 @@ def list_profile_pictures(request):
     
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def search_users(request):
     print(f"DEBUG: search_users called with user: {request.user}, authenticated: {request.user.is_authenticated}")
     prefix = request.GET.get('q', '').strip()
@@ -1313,24 +1164,14 @@ def search_users(request):
             search_query |= prefix_query
         
         users = User.objects.filter(search_query).exclude(id=request.user.id).distinct()
-        users = users.order_by('username', 'email')
+        users = users.select_related('profile').order_by('username', 'email')
         users = users[:50]
         
         # Prepare response data with profile information
         data = []
         for user in users:
-            try:
-                # Get user profile with select_related for efficiency
-                profile = UserProfile.objects.get(user=user)
-                profile_picture_url = None
-                
-                # Get profile picture URL if it exists
-                if profile.profile_picture:
-                    profile_picture_url = request.build_absolute_uri(profile.profile_picture.url)
-                
-            except UserProfile.DoesNotExist:
-                profile_picture_url = None
-                profile = None
+            profile = getattr(user, 'profile', None)
+            profile_picture_url = user_avatar_url(request, user, 'medium')
             
             user_data = {
                 "id": user.id,
@@ -1393,49 +1234,43 @@ def get_nearby_users(request):
             location_lng__isnull=False
         ).select_related('profile')
         
+        # Only users within 10km radius are candidates
+        candidates = []
         for other_user in all_users:
             distance = calculate_distance(user_lat, user_lon, float(other_user.location_lat), float(other_user.location_lng))
-            
-            # Only include users within 10km radius
             if distance <= 10:
-                # Check if user is online (active in last 5 minutes)
-                from datetime import timedelta
-                now = timezone.now()
-                five_minutes_ago = now - timedelta(minutes=5)
-                
-                # Check if user has active tab sessions in last 5 minutes
-                active_sessions = TabSession.objects.filter(
-                    user=other_user,
-                    last_activity__gte=five_minutes_ago,
-                    is_active=True
-                ).exists()
-                
-                # Also check if location was updated recently (within 5 minutes)
-                location_recent = other_user.last_location_update and other_user.last_location_update >= five_minutes_ago
-                
-                is_online = active_sessions or location_recent
+                candidates.append((other_user, distance))
+        
+        # Bulk presence lookup for all candidates (no per-user database query)
+        online_map = is_online([other_user.id for other_user, _ in candidates])
+        five_minutes_ago = timezone.now() - timedelta(minutes=5)
+        
+        for other_user, distance in candidates:
+            # Also check if location was updated recently (within 5 minutes)
+            location_recent = other_user.last_location_update and other_user.last_location_update >= five_minutes_ago
+            
+            is_user_online = online_map.get(other_user.id, False) or bool(location_recent)
+            
+            # Only include online users in nearby list
+            if is_user_online:
+                user_profile = other_user.profile
+                profile_picture_url = user_avatar_url(request, other_user)
                 
-                # Only include online users in nearby list
-                if is_online:
-                    user_profile = other_user.profile
-                    profile_picture_url = get_profile_picture_url(request, user_profile.profile_picture) if user_profile.profile_picture else None
-                    print(f"User {other_user.username} profile picture URL: {profile_picture_url}")
-                    
-                    nearby_users.append({
-                        'id': other_user.id,
-                        'username': other_user.username,
-                        'full_name': f"{other_user.first_name} {other_user.last_name}".strip() or other_user.username,
-                        'email': other_user.email,
-                        'profile_picture': profile_picture_url,
-                        'location': {
-                            'lat': float(other_user.location_lat),
-                            'lng': float(other_user.location_lng)
-                        },
-                        'distance': round(distance, 1),
-                        'college': user_profile.college_name or 'Unknown',
-                        'is_online': is_online,
-                        'last_seen': other_user.last_location_update.isoformat() if other_user.last_location_update else None
-                    })
+                nearby_users.append({
+                    'id': other_user.id,
+                    'username': other_user.username,
+                    'full_name': f"{other_user.first_name} {other_user.last_name}".strip() or other_user.username,
+                    'email': other_user.email,
+                    'profile_picture': profile_picture_url,
+                    'location': {
+                        'lat': float(other_user.location_lat),
+                        'lng': float(other_user.location_lng)
+                    },
+                    'distance': round(distance, 1),
+                    'college': user_profile.college_name or 'Unknown',
+                    'is_online': is_user_online,
+                    'last_seen': other_user.last_location_update.isoformat() if other_user.last_location_update else None
+                })
         
         # Sort by distance
         nearby_users.sort(key=lambda x: x['distance'])
@@ -1491,10 +1326,11 @@ def get_user_locations(request):
     try:
         # Get all users' latest locations
         locations = []
-        users = User.objects.exclude(id=request.user.id).filter(
+        users = list(User.objects.exclude(id=request.user.id).filter(
             location_lat__isnull=False,
             location_lng__isnull=False
-        )
+        ))
+        online_map = is_online([user.id for user in users])
         
         for user in users:
             locations.append({
@@ -1503,7 +1339,7 @@ def get_user_locations(request):
                 "latitude": float(user.location_lat),
                 "longitude": float(user.location_lng),
                 "timestamp": user.last_location_update.isoformat() if user.last_location_update else None,
-                "is_online": True,  # Assume online if location is recent
+                "is_online": online_map.get(user.id, False),
                 "last_seen": user.last_location_update.isoformat() if user.last_location_update else None
             })
         
@@ -1513,6 +1349,32 @@ def get_user_locations(request):
         print(f"ERROR: get_user_locations exception: {e}")
         return Response({"error": "Internal server error"}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_users_presence(request):
+    """Bulk online lookup, e.g. /api/users/presence/?ids=1,2,3 (served from the presence registry)"""
+    try:
+        raw_ids = request.GET.get('ids', '')
+        try:
+            user_ids = [int(uid) for uid in raw_ids.split(',') if uid.strip()]
+        except ValueError:
+            return Response({"error": "ids must be a comma separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(user_ids) > 500:
+            return Response({"error": "At most 500 ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        online_map = is_online(user_ids)
+        last_seen = presence.last_seen([uid for uid, online in online_map.items() if online])
+        return Response({
+            'data': [
+                {'user_id': uid, 'is_online': online_map[uid], 'last_seen': last_seen.get(uid)}
+                for uid in user_ids
+            ]
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in get_users_presence: {e}")
+        return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # Debug endpoint to check authentication
 @api_view(['GET'])
 def debug_auth(request):
@@ -1572,6 +1434,7 @@ def test_auth_simple(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_user_conversations(request):
     # Debug authentication
     print(f"DEBUG: User authenticated: {request.user.is_authenticated}")
@@ -1621,12 +1484,7 @@ def search_user_by_email(request):
                 return Response({"error": "Cannot search for yourself"}, status=status.HTTP_400_BAD_REQUEST)
             
             # Get user profile info
-            profile_picture = None
-            try:
-                if hasattr(user, 'profile') and user.profile.profile_picture:
-                    profile_picture = user.profile.profile_picture.url
-            except:
-                pass
+            profile_picture = user_avatar_url(None, user, 'medium')
             
             return Response({
                 'found': True,
@@ -1651,6 +1509,7 @@ def search_user_by_email(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_conversation_messages(request, conversation_id):
     """Get all messages for a specific conversation"""
     try:
@@ -1661,13 +1520,23 @@ def get_conversation_messages(request, conversation_id):
             if not conversation.participants.filter(id=user.id).exists():
                 return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
             
-            # Mark messages as read for the current user (messages not sent by the user)
-            conversation.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
-            
-            messages = conversation.messages.all()
+            messages = list(TieredMessages(
+                conversation.archived_messages.select_related('sender'),
+                conversation.messages.select_related('sender')
+            ))
             serializer = MessageSerializer(messages, many=True)
+            data = serializer.data
+
+            # Move the user's read pointer to the last message served (one row, not every
+            # unread message). Reads stay on the replica up to here; the write, and the
+            # read-your-writes pin that follows it, only happen when the pointer is behind.
+            if messages and not has_read(conversation.id, user.id, messages[-1].id):
+                receipt = mark_read_up_to(user, conversation.id, messages[-1].id)
+                if receipt and receipt['moved']:
+                    push_receipt(conversation.id, user.username, receipt)
+
             return Response({
-                'data': serializer.data
+                'data': data
             }, status=status.HTTP_200_OK)
         except Conversation.DoesNotExist:
             return Response({"error": "Conversation not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -1677,6 +1546,84 @@ def get_conversation_messages(request, conversation_id):
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def search_messages(request):
+    """Search the user's direct messages; ranked snippets, paged with ?cursor="""
+    try:
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            conversation_id = int(request.GET['conversation_id']) if request.GET.get('conversation_id') else None
+            limit = int(request.GET.get('limit', SEARCH_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "conversation_id and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            page = search_user_messages(
+                request.user, query, conversation_id=conversation_id, cursor=request.GET.get('cursor'), limit=limit
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(page, status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in search_messages: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _scoped_search_response(request, index, scope_id):
+    """Run a ranked search of one group/forum for the ?q=&cursor=&limit= parameters"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.GET.get('limit', SEARCH_PAGE_SIZE))
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page = index.search(scope_id, query, cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(page, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def search_group_messages(request, group_id):
+    """Search the messages of a group the user belongs to"""
+    try:
+        if not Group.objects.filter(id=group_id).exists():
+            return Response({"error": "Group not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not GroupMember.objects.filter(group_id=group_id, user=request.user).exists():
+            return Response({"error": "You are not a member of this group"}, status=status.HTTP_403_FORBIDDEN)
+        
+        return _scoped_search_response(request, group_message_index, group_id)
+    except Exception as e:
+        print(f"Error in search_group_messages: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def search_forum_posts(request, forum_id):
+    """Search the channel posts of a forum the user has joined"""
+    try:
+        if not Forum.objects.filter(id=forum_id).exists():
+            return Response({"error": "Forum not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not ForumMember.objects.filter(forum_id=forum_id, user=request.user).exists():
+            return Response({"error": "You are not a member of this forum"}, status=status.HTTP_403_FORBIDDEN)
+        
+        return _scoped_search_response(request, forum_post_index, forum_id)
+    except Exception as e:
+        print(f"Error in search_forum_posts: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([JSONParser, MultiPartParser, FormParser])
@@ -1858,8 +1805,10 @@ def mark_conversation_read(request, conversation_id):
             if not conversation.participants.filter(id=user.id).exists():
                 return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
             
-            # Mark all messages in the conversation as read for this user
-            conversation.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
+            # Mark everything up to the newest message as read for this user
+            receipt = mark_read_up_to(user, conversation.id)
+            if receipt and receipt['moved']:
+                push_receipt(conversation.id, user.username, receipt)
             
             return Response({
                 'message': 'Conversation marked as read'
@@ -2129,7 +2078,7 @@ def get_group_members(request, group_id):
                 'error': 'You are not a member of this group'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        members = group.members.all()
+        members = group.members.select_related('user')
         serializer = GroupMemberSerializer(members, many=True, context={'request': request})
         
         return Response({
@@ -2307,6 +2256,7 @@ def promote_group_member(request, group_id, user_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_group_messages(request, group_id):
     try:
         print(f"=== GET GROUP MESSAGES DEBUG ===")
@@ -2330,7 +2280,11 @@ def get_group_messages(request, group_id):
         page = int(request.GET.get('page', 1))
         page_size = int(request.GET.get('page_size', 50))
         
-        messages = group.messages.all()
+        # Archived history first, then the hot table
+        messages = TieredMessages(
+            group.archived_messages.select_related('sender'),
+            group.messages.select_related('sender')
+        )
         total_messages = messages.count()
         
         print(f"Total messages in group: {total_messages}")
@@ -2377,6 +2331,33 @@ def get_group_messages(request, group_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def post_group_message(group, sender, text, attachment=None, upload=None):
+    """
+    Create a group message, from an uploaded file or a chunked upload session,
+    and deliver it to the group's open sockets once it commits. Indexing is
+    queued by the post_save receiver (api/signals.py).
+    """
+    with transaction.atomic():
+        message = GroupMessage(group=group, sender=sender, message=text)
+        if upload is not None:
+            attach_upload(upload, message)
+        else:
+            if attachment:
+                message.attachment = attachment
+            message.save()
+        event = {'type': 'group_message', 'message': group_message_payload(message)}
+        room = f'group_{group.id}'
+
+        def broadcast():
+            try:
+                async_to_sync(get_channel_layer().group_send)(room, event)
+            except Exception as e:
+                print(f"Error broadcasting group message {message.id}: {e}")
+
+        transaction.on_commit(broadcast)
+    return message
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_group_message(request, group_id):
@@ -2412,18 +2393,8 @@ def send_group_message(request, group_id):
                 'error': 'Either message text or attachment is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create message
-        message_data = {
-            'group': group,
-            'sender': request.user,
-            'message': message_text
-        }
-        
-        # Handle attachment if provided
-        if attachment:
-            message_data['attachment'] = attachment
-        
-        message = GroupMessage.objects.create(**message_data)
+        # Create message and push it to the group's sockets
+        message = post_group_message(group, request.user, message_text, attachment=attachment)
         print(f"Message created with ID: {message.id}")
         
         serializer = GroupMessageSerializer(message, context={'request': request})
@@ -2458,6 +2429,156 @@ def send_group_message(request, group_id):
             'error': 'Failed to send message'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _upload_session_data(session):
+    return {
+        'upload_id': str(session.id),
+        'file_name': session.file_name,
+        'content_type': session.content_type,
+        'size': session.total_size,
+        'received_bytes': session.received_bytes,
+        'status': session.status,
+        'max_chunk_size': MAX_CHUNK_SIZE,
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    """Open a chunked upload session: {file_name, size, content_type?}"""
+    try:
+        file_name = request.data.get('file_name')
+        if not file_name:
+            return Response({"error": "file_name is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            total_size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        session = create_upload_session(
+            request.user, file_name, total_size, request.data.get('content_type', '')
+        )
+        return Response(_upload_session_data(session), status=status.HTTP_201_CREATED)
+    except UploadError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in create_upload: {e}")
+        return Response({"error": "Failed to create upload"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """GET reports progress so a client can resume; DELETE aborts the upload"""
+    try:
+        session = UploadSession.objects.get(id=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        if request.method == 'DELETE':
+            abort_upload(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(_upload_session_data(session), status=status.HTTP_200_OK)
+    except Exception as e:
+        print(f"Error in upload_detail: {e}")
+        return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id):
+    """
+    Append the raw request body at the byte offset given in the Upload-Offset
+    header (or ?offset=). A wrong offset returns 409 with received_bytes.
+    """
+    try:
+        session = UploadSession.objects.get(id=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.GET.get('offset', '')))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({"error": "Upload-Offset header and Content-Length are required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Read the body as a stream; request.data would spool the whole chunk first
+        received_bytes = append_chunk(session, offset, request.stream, length)
+        return Response({
+            'upload_id': str(session.id),
+            'received_bytes': received_bytes,
+            'size': session.total_size,
+        }, status=status.HTTP_200_OK)
+    except UploadOffsetMismatch as e:
+        return Response({
+            "error": str(e),
+            "received_bytes": e.received_bytes,
+        }, status=status.HTTP_409_CONFLICT)
+    except UploadError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in upload_chunk: {e}")
+        return Response({"error": "Failed to store chunk"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload(request, upload_id):
+    """
+    Attach a completed upload. Body: {target: 'group_message', group_id, message?}
+    or {target: 'group_image', group_id}.
+    """
+    try:
+        session = UploadSession.objects.get(id=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        target = request.data.get('target', 'group_message')
+        group_id = request.data.get('group_id')
+        if not group_id:
+            return Response({"error": "group_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        group = Group.objects.get(id=group_id)
+        member = group.members.filter(user=request.user).first()
+        
+        if target == 'group_message':
+            if not member:
+                return Response({"error": "You are not a member of this group"}, status=status.HTTP_403_FORBIDDEN)
+            message = post_group_message(group, request.user, request.data.get('message', ''), upload=session)
+            serializer = GroupMessageSerializer(message, context={'request': request})
+            return Response({
+                'success': True,
+                'message': 'Message sent successfully',
+                'data': serializer.data
+            }, status=status.HTTP_201_CREATED)
+        
+        if target == 'group_image':
+            if not member or member.role != 'admin':
+                return Response({"error": "Only group admins can update groups"}, status=status.HTTP_403_FORBIDDEN)
+            if not session.content_type.startswith('image/'):
+                return Response({"error": "Group image must be an image"}, status=status.HTTP_400_BAD_REQUEST)
+            old_image_name = group.image.name if group.image else None
+            with transaction.atomic():
+                attach_upload(session, group, field_name='image')
+                if old_image_name:
+                    transaction.on_commit(lambda: release_blob(old_image_name))
+            serializer = GroupSerializer(group, context={'request': request})
+            return Response({
+                'success': True,
+                'message': 'Group updated successfully',
+                'data': serializer.data
+            }, status=status.HTTP_200_OK)
+        
+        return Response({"error": "target must be 'group_message' or 'group_image'"}, status=status.HTTP_400_BAD_REQUEST)
+    except Group.DoesNotExist:
+        return Response({"error": "Group not found"}, status=status.HTTP_404_NOT_FOUND)
+    except UploadError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in finalize_upload: {e}")
+        return Response({"error": "Failed to finalize upload"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_group(request, group_id):
@@ -2478,11 +2599,17 @@ def update_group(request, group_id):
             group.description = request.data['description']
         
         # Handle image update
+        old_image_name = None
         if 'image' in request.FILES:
+            old_image_name = group.image.name if group.image else None
             group.image = request.FILES['image']
         
         group.save()
         
+        # Release the replaced image's blob reference once the update commits
+        if old_image_name:
+            transaction.on_commit(lambda: release_blob(old_image_name))
+        
         serializer = GroupSerializer(group, context={'request': request})
         return Response({
             'success': True,
@@ -2541,24 +2668,18 @@ def get_conversation_resources(request, conversation_id):
         if request.user not in conversation.participants.all():
             return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get messages with attachments
-        messages = Message.objects.filter(
-            conversation=conversation,
-            attachment__isnull=False
-        ).exclude(attachment='').order_by('-timestamp')
+        # Get messages with attachments: hot rows, then the (older) archived ones
+        messages = [
+            queryset.filter(attachment__isnull=False).exclude(attachment='').select_related('sender').order_by('-timestamp')
+            for queryset in (conversation.messages.all(), conversation.archived_messages.all())
+        ]
         
-        # Serialize messages with attachment info
+        # Serialize messages with attachment info (metadata stored at upload time)
         resources = []
-        for message in messages:
+        for message in itertools.chain(*messages):
             if message.attachment:
-                # Get file size if possible
-                try:
-                    file_size = message.attachment.size if hasattr(message.attachment, 'size') else None
-                except:
-                    file_size = None
-                
-                # Get file name from path
-                file_name = message.attachment.name.split('/')[-1] if message.attachment.name else 'Unknown File'
+                file_size = message.attachment_size
+                file_name = message.attachment_name or message.attachment.name.split('/')[-1]
                 
                 resources.append({
                     'id': message.id,
@@ -2602,41 +2723,51 @@ def get_user_file_stats(request):
     try:
         user = request.user
         
-        # Get all messages with attachments by this user
-        user_messages = Message.objects.filter(
-            sender=user,
-            attachment__isnull=False
-        ).exclude(attachment='')
+        # Messages with attachments by this user, in both the hot and the archive tier
+        user_messages = [
+            model.objects.filter(sender=user, attachment__isnull=False).exclude(attachment='')
+            for model in (Message, ArchivedMessage)
+        ]
         
-        # Calculate statistics
-        total_files = user_messages.count()
-        total_size = 0
+        # Per-type counts and sizes in a single GROUP BY over stored metadata per tier;
+        # totals are derived from the buckets so no per-row work happens in Python
         file_types = {}
-        
-        for message in user_messages:
-            try:
-                if hasattr(message.attachment, 'size'):
-                    total_size += message.attachment.size
-            except:
-                pass
-            
-            file_type = message.attachment_type or 'file'
-            if file_type not in file_types:
-                file_types[file_type] = 0
-            file_types[file_type] += 1
-        
-        # Get recent uploads
-        recent_uploads = user_messages.order_by('-timestamp')[:10]
+        total_files = 0
+        total_size = 0
+        for queryset in user_messages:
+            type_buckets = queryset.order_by().values(
+                file_type=Coalesce('attachment_type', Value('file'))
+            ).annotate(
+                count=Count('id'),
+                size=Coalesce(Sum('attachment_size'), Value(0))
+            )
+            for bucket in type_buckets:
+                file_types[bucket['file_type']] = file_types.get(bucket['file_type'], 0) + bucket['count']
+                total_files += bucket['count']
+                total_size += bucket['size']
+        
+        # Get recent uploads (only the columns the response needs), newest ten across tiers
+        recent_uploads = sorted(
+            itertools.chain.from_iterable(
+                queryset.order_by('-timestamp').values(
+                    'id', 'attachment', 'attachment_name', 'attachment_type', 'attachment_size', 'timestamp', 'conversation_id'
+                )[:10]
+                for queryset in user_messages
+            ),
+            key=lambda message: message['timestamp'],
+            reverse=True
+        )[:10]
         recent_files = []
         
         for message in recent_uploads:
-            file_name = message.attachment.name.split('/')[-1] if message.attachment.name else 'Unknown File'
+            file_name = message['attachment_name'] or (message['attachment'].split('/')[-1] if message['attachment'] else 'Unknown File')
             recent_files.append({
-                'id': message.id,
+                'id': message['id'],
                 'file_name': file_name,
-                'file_type': message.attachment_type or 'file',
-                'uploaded_at': message.timestamp,
-                'conversation_id': message.conversation.id
+                'file_type': message['attachment_type'] or 'file',
+                'file_size': message['attachment_size'],
+                'uploaded_at': message['timestamp'],
+                'conversation_id': message['conversation_id']
             })
         
         return Response({
@@ -2657,7 +2788,7 @@ def download_message_attachment(request, message_id):
     try:
         # Get the message
         try:
-            message = Message.objects.get(id=message_id)
+            message = find_message(Message, message_id)
         except Message.DoesNotExist:
             return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
         
@@ -2676,22 +2807,85 @@ def download_message_attachment(request, message_id):
         if not os.path.exists(file_path):
             return Response({"error": "File not found on server"}, status=status.HTTP_404_NOT_FOUND)
         
-        # Get file info
-        file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
-        
-        # Create response with file
-        with open(file_path, 'rb') as file:
-            response = HttpResponse(file.read(), content_type='application/octet-stream')
-            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-            response['Content-Length'] = file_size
-            return response
+        # Stream the file (supports Range, ETag/Last-Modified and X-Sendfile offload)
+        return serve_file(
+            request,
+            file_path,
+            file_name=message.attachment_name or os.path.basename(file_path),
+            content_type=message.attachment_mime_type or 'application/octet-stream',
+            media_name=message.attachment.name
+        )
             
     except Exception as e:
         print(f"Error in download_message_attachment: {e}")
         return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _attachment_thumbnail_response(request, message):
+    """Serve a cached WebP thumbnail for an image attachment, rendering it on first request"""
+    if not message.attachment:
+        return Response({"error": "No attachment found"}, status=status.HTTP_404_NOT_FOUND)
+    
+    if message.attachment_type != 'image' and not (message.attachment_mime_type or '').startswith('image/'):
+        return Response({"error": "Attachment is not an image"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        size = int(request.GET.get('size', DEFAULT_THUMBNAIL_SIZE))
+    except ValueError:
+        size = DEFAULT_THUMBNAIL_SIZE
+    if size not in THUMBNAIL_SIZES:
+        return Response({"error": f"size must be one of {list(THUMBNAIL_SIZES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        thumbnail_path = get_attachment_thumbnail(message, size)
+    except FileNotFoundError:
+        return Response({"error": "File not found on server"}, status=status.HTTP_404_NOT_FOUND)
+    
+    response = serve_file(request, thumbnail_path, content_type='image/webp', as_attachment=False)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_message_attachment_thumbnail(request, message_id):
+    """Thumbnail of a direct message image attachment"""
+    try:
+        try:
+            message = find_message(Message, message_id)
+        except Message.DoesNotExist:
+            return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Check if user is part of the conversation
+        if not message.conversation.participants.filter(id=request.user.id).exists():
+            return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
+        
+        return _attachment_thumbnail_response(request, message)
+    except Exception as e:
+        print(f"Error in get_message_attachment_thumbnail: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_group_message_attachment_thumbnail(request, message_id):
+    """Thumbnail of a group message image attachment"""
+    try:
+        try:
+            message = find_message(GroupMessage, message_id)
+        except GroupMessage.DoesNotExist:
+            return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Check if user is a member of the group
+        if not GroupMember.objects.filter(group_id=message.group_id, user=request.user).exists():
+            return Response({"error": "You are not a member of this group"}, status=status.HTTP_403_FORBIDDEN)
+        
+        return _attachment_thumbnail_response(request, message)
+    except Exception as e:
+        print(f"Error in get_group_message_attachment_thumbnail: {e}")
+        return Response(data={"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversation_resources(request, conversation_id):
@@ -2708,19 +2902,22 @@ def get_conversation_resources(request, conversation_id):
         if not conversation.participants.filter(id=user.id).exists():
             return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get messages with attachments
-        messages_with_attachments = conversation.messages.filter(
-            attachment__isnull=False
-        ).exclude(attachment='').order_by('-timestamp')
+        # Get messages with attachments (metadata stored at upload time, no file access);
+        # hot rows first, then the older archived ones
+        messages_with_attachments = [
+            queryset.filter(attachment__isnull=False).exclude(attachment='').select_related('sender').order_by('-timestamp')
+            for queryset in (conversation.messages.all(), conversation.archived_messages.all())
+        ]
         
         resources = []
-        for message in messages_with_attachments:
+        for message in itertools.chain(*messages_with_attachments):
             if message.attachment:
                 resources.append({
                     'id': message.id,
-                    'file_name': os.path.basename(message.attachment.name),
-                    'file_size': message.attachment.size if hasattr(message.attachment, 'size') else 0,
+                    'file_name': message.attachment_name or os.path.basename(message.attachment.name),
+                    'file_size': message.attachment_size or 0,
                     'file_type': message.attachment_type,
+                    'mime_type': message.attachment_mime_type,
                     'uploaded_by': message.sender.username,
                     'uploaded_at': message.timestamp.isoformat(),
                     'download_url': f'/api/messages/{message.id}/download/'
@@ -2740,9 +2937,9 @@ def get_conversation_resources(request, conversation_id):
 def delete_message(request, message_id):
     """Delete a message (only by sender)"""
     try:
-        # Get the message
+        # Get the message (it may have moved to the archive)
         try:
-            message = Message.objects.get(id=message_id)
+            message = find_message(Message, message_id)
         except Message.DoesNotExist:
             return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
         
@@ -0,0 +1,114 @@
+"""
+Wire formats for the ws/chat/ socket.
+
+Without a subprotocol the socket speaks the original verbose JSON. A client
+that offers COMPACT_SUBPROTOCOL in Sec-WebSocket-Protocol gets the compact
+format instead: the same events as JSON with short keys and short type codes,
+with null, empty and redundant fields left out (receiver_full_name is only
+ever the receiver's username, and sender_full_name is dropped when it equals
+the sender). Booleans are always kept, so is_online/is_typing false arrives
+explicitly. Frames a compact client sends are expanded back to the long
+keys, so the consumer logic never sees the difference. Keys without a short
+form pass through unchanged.
+
+The compression extension (permessage-deflate) is negotiated by the ASGI
+server, not by the consumer; `manage.py benchmark_wire_format` reports the
+deflated sizes of both formats.
+"""
+import json
+
+from django.conf import settings
+
+WIRE_CONFIG = getattr(settings, 'WEBSOCKET_WIRE', {})
+COMPACT_ENABLED = WIRE_CONFIG.get('COMPACT_ENABLED', True)
+COMPACT_SUBPROTOCOL = 'chat.compact.v1'
+
+COMPACT_KEYS = {
+    'type': 't',
+    'message': 'm',
+    'sender': 's',
+    'receiver': 'r',
+    'message_id': 'i',
+    'timestamp': 'ts',
+    'conversation_id': 'c',
+    'is_new_conversation': 'n',
+    'sender_full_name': 'sn',
+    'sender_email': 'se',
+    'receiver_email': 're',
+    'is_typing': 'on',
+    'expires_in': 'x',
+    'reader': 'rd',
+    'user_id': 'u',
+    'username': 'un',
+    'is_online': 'o',
+}
+COMPACT_TYPES = {
+    'message': 'm',
+    'message_sent': 's',
+    'conversation_refresh': 'cr',
+    'typing': 'ty',
+    'read_receipt': 'rr',
+    'read_up_to': 'ru',
+    'presence': 'p',
+    'ping': 'pi',
+    'pong': 'po',
+    'error': 'e',
+}
+LONG_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+LONG_TYPES = {short: name for name, short in COMPACT_TYPES.items()}
+
+
+class JsonWire:
+    subprotocol = None
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, text):
+        return json.loads(text)
+
+
+class CompactWire:
+    subprotocol = COMPACT_SUBPROTOCOL
+
+    def compact(self, data):
+        out = {}
+        for key, value in data.items():
+            if value is None or (isinstance(value, (str, list, dict)) and not value):
+                continue
+            if key == 'receiver_full_name':
+                continue
+            if key == 'sender_full_name' and value == data.get('sender'):
+                continue
+            if key == 'type':
+                value = COMPACT_TYPES.get(value, value)
+            elif key == 'timestamp' and isinstance(value, float):
+                value = round(value, 3)
+            out[COMPACT_KEYS.get(key, key)] = value
+        return out
+
+    def expand(self, data):
+        out = {}
+        for key, value in data.items():
+            key = LONG_KEYS.get(key, key)
+            if key == 'type':
+                value = LONG_TYPES.get(value, value)
+            out[key] = value
+        return out
+
+    def encode(self, data):
+        return json.dumps(self.compact(data), separators=(',', ':'), ensure_ascii=False)
+
+    def decode(self, text):
+        return self.expand(json.loads(text))
+
+
+JSON_WIRE = JsonWire()
+COMPACT_WIRE = CompactWire()
+
+
+def negotiate(subprotocols):
+    """The wire format for a connection, from the subprotocols the client offered"""
+    if COMPACT_ENABLED and COMPACT_SUBPROTOCOL in (subprotocols or []):
+        return COMPACT_WIRE
+    return JSON_WIRE
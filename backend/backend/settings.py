@@ -53,6 +53,9 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Issue and refresh tokens with the is_admin claim (api/permissions.py)
+    "TOKEN_OBTAIN_SERIALIZER": "api.permissions.AdminClaimTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.permissions.AdminClaimTokenRefreshSerializer",
 }
 # Application definition
 
@@ -82,6 +85,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'api.middleware.TabSessionMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -123,13 +127,64 @@ WEBSOCKET_CONFIG = {
     'CONNECTION_TIMEOUT': 300,  # seconds
 }
 
+# Wire formats of ws/chat/ (api/wire.py). Clients opt into compact frames by
+# offering the chat.compact.v1 subprotocol; compare with manage.py benchmark_wire_format.
+WEBSOCKET_WIRE = {
+    'COMPACT_ENABLED': True,
+}
+
+# Typing indicators on the chat WebSocket (api/typing_throttle.py)
+TYPING_INDICATORS = {
+    'INTERVAL': 1.0,             # at most one typing event per sender and conversation per second
+    'EXPIRY': 5,                 # seconds clients keep a typing state without a refresh
+}
+
+# Read receipts / per-participant read pointers (api/receipts.py)
+READ_RECEIPTS = {
+    'DEBOUNCE': 0.5,             # seconds read_up_to events are coalesced before the pointer is written
+}
+
+# Cache used by the presence registry (api/presence.py). LocMemCache is a
+# per-process stand-in; switch to Redis/Memcached to share presence across workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'studverse-default',
+    },
+}
+
+PRESENCE_CONFIG = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 90,  # seconds without a ping before a socket counts as gone (3x heartbeat)
+}
+
+# Shared user-card cache used by serializers (api/cards.py)
+USER_CARD_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 3600,      # seconds a card lives in the shared cache
+    'LOCAL_SIZE': 5000,   # cards kept in each process's LRU
+    'LOCAL_TTL': 30,      # seconds a process trusts its local copy
+}
+
+
+
+# Background sweeper for TabSession expiry (api/background.py, api/utils.py)
+TAB_SESSION_SWEEPER = {
+    'ENABLED': True,
+    'INTERVAL': 300,                       # seconds between sweeps
+    'INACTIVE_AFTER': timedelta(hours=2),  # mark sessions inactive after this idle time
+    'DELETE_AFTER': timedelta(days=7),     # hard-delete inactive sessions after this idle time
+    'CHUNK_SIZE': 1000,                    # rows per UPDATE/DELETE statement
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # django.db.backends.mysql with a process-wide connection pool (api/dbpool.py)
+        'ENGINE': 'api.pooled_mysql',
         'NAME': 'studverse',
         'USER': 'root',
         'PASSWORD': 'root',
@@ -140,9 +195,55 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'autocommit': True,
         },
+        # Connections go back to the pool at the end of each request; under ASGI
+        # every request runs on a new thread, so per-thread persistence never reuses them
+        'CONN_MAX_AGE': 0,
     }
 }
 
+# Read replica: DB_REPLICA_HOST (and DB_REPLICA_PORT) adds a MySQL replica.
+# DB_LOCAL_REPLICAS=1 uses two local SQLite files instead, to exercise the
+# routing with `manage.py check_replica_routing` (migrate both with --database).
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+if os.getenv('DB_LOCAL_REPLICAS'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Read-replica routing (api/routers.py)
+DB_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': 5,         # reads stay on the primary this long after a user writes
+    'CACHE_ALIAS': 'default',    # where the pins live; share it between workers
+}
+
+# Connection pool and consumer DB executor (api/dbpool.py)
+DB_POOL = {
+    'MAX_SIZE': 20,              # MySQL connections per process and database
+    'TIMEOUT': 10,               # seconds to wait for a free connection
+    'MAX_LIFETIME': 600,         # recycle connections older than this (keep below wait_timeout)
+    'HEALTH_CHECK_AFTER': 30,    # ping connections idle longer than this before reuse
+    'CONSUMER_WORKERS': 8,       # threads (and so connections) for WebSocket consumer queries
+    'SLOW_WAIT': 0.5,            # log waits longer than this (seconds)
+    'STATS_LOG_INTERVAL': 300,   # seconds between pool stats log lines, 0 to disable
+}
+
 # MySQL-specific settings for better performance
 DATABASE_OPTIONS = {
     'sql_mode': 'STRICT_TRANS_TABLES',
@@ -192,6 +293,57 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Attachment downloads (api/downloads.py). Set OFFLOAD to 'sendfile' (X-Sendfile)
+# or 'accel' (nginx X-Accel-Redirect) to let the web server stream file bodies.
+FILE_DOWNLOADS = {
+    'OFFLOAD': None,
+    'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+    'CHUNK_SIZE': 64 * 1024,
+}
+
+# Background admin bulk deletes (api/jobs.py)
+ADMIN_JOBS = {
+    'DELETE_CHUNK_SIZE': 1000,   # rows per DELETE statement
+    'CHUNK_PAUSE': 0.05,         # seconds between chunks
+    'STALE_AFTER': 600,          # seconds before an untouched pending/running job is resumed
+    'RESUME_INTERVAL': 60,       # seconds between checks for interrupted jobs
+}
+
+# Hot/cold message archival (api/archive.py, manage.py archive_messages)
+ARCHIVE = {
+    'MAX_AGE_DAYS': 365,         # messages older than this move to the archive tables
+    'CHUNK_SIZE': 1000,          # rows moved per transaction
+    'CHUNK_PAUSE': 0.05,         # seconds between chunks
+}
+
+# Direct-message search index (api/search.py)
+MESSAGE_SEARCH = {
+    'MIN_TERM_LENGTH': 2,
+    'MAX_QUERY_TERMS': 8,
+    'BATCH_DELAY': 0.2,          # seconds the indexer waits to batch nearby writes
+    'SNIPPET_RADIUS': 60,        # characters of context around a match
+}
+
+# Chunked, resumable uploads (api/uploads.py)
+CHUNKED_UPLOADS = {
+    'MAX_UPLOAD_SIZE': 500 * 1024 * 1024,
+    'MAX_CHUNK_SIZE': 8 * 1024 * 1024,   # largest accepted PUT body
+    'READ_SIZE': 64 * 1024,              # bytes buffered per upload while streaming a chunk
+    'SESSION_TTL': timedelta(days=1),    # idle sessions and their part files are removed after this
+    'SWEEP_INTERVAL': 3600,
+}
+
+# Profile picture renditions and attachment thumbnails (api/images.py)
+IMAGE_RENDITIONS = {
+    'WORKERS': 2,
+    'PROFILE_PICTURE_SIZES': {'small': 48, 'medium': 128, 'large': 512},
+    'WEBP_QUALITY': 80,
+    'THUMBNAIL_SIZES': (160, 320, 640),
+    'DEFAULT_THUMBNAIL_SIZE': 320,
+    'THUMBNAIL_CACHE_DIR': BASE_DIR / 'cache' / 'thumbnails',
+    'THUMBNAIL_CACHE_MAX_BYTES': 512 * 1024 * 1024,
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -208,6 +360,18 @@ CORS_ALLOW_HEADERS = [
     'x-tab-id',
     'x-session-key',
     'x-user-agent',
+    'range',
+    'if-range',
+    'if-none-match',
+    'if-modified-since',
+    'upload-offset',
+]
+CORS_EXPOSE_HEADERS = [
+    'content-range',
+    'accept-ranges',
+    'content-disposition',
+    'etag',
+    'last-modified',
 ]
 
 # Channels configuration